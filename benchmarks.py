@@ -0,0 +1,387 @@
+""" Benchmarks of the mortgage and rent & invest calculators with a machine-readable history.
+
+Every run appends one JSON line to the history file with the timings of all cases, the git commit and a machine
+fingerprint. Timings are compared against a baseline entry recorded on the same machine and cases slower than
+the threshold are flagged as regressions.
+
+    python benchmarks.py                       # run all cases and append to benchmark_history.jsonl
+    python benchmarks.py --quick               # skip the 100k scenario batch
+    python benchmarks.py -k batch --no-save    # only cases containing 'batch', without recording them
+    python benchmarks.py --fail-on-regression  # exit with status 1 when a case regressed
+"""
+
+import numpy as np
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timedelta
+
+import rent_vs_buy_dubai as calc
+
+
+SEED = 20840101
+HORIZONS = [10, 25, 40]
+EARLY_REPAYMENT_COUNTS = [0, 1000]
+BATCH_SIZES = [1000, 10000, 100000]
+QUICK_BATCH_SIZES = [1000, 10000]
+BATCH_CHUNK_SIZE = 10000  # same chunking as ParameterSweep, so 100k scenarios never hold all schedules at once
+
+
+def mortgage_params(years, n_early_repayments=0, seed=SEED):
+    """ Mortgage arguments of the example scenario over `years` with seeded arbitrary early repayments. """
+    params = {name: calc.EXAMPLE_SCENARIO[name] for name in calc.MORTGAGE_PARAMETERS if name in calc.EXAMPLE_SCENARIO}
+    params['total_years'] = years
+    params['initial_years'] = min(params['initial_years'], years)
+    rng = np.random.default_rng(seed)
+    start = datetime.strptime(params['start_date'], '%Y-%m-%d')
+    days = np.sort(rng.integers(1, years * 365, n_early_repayments))
+    amounts = rng.integers(1, 20, n_early_repayments) * 1000
+    params['arbitrary_early_repayments'] = [{'date': (start + timedelta(days=int(day))).strftime('%Y-%m-%d'), 'amount': int(amount)}
+                                            for day, amount in zip(days, amounts)]
+    return params
+
+
+def rent_params(years):
+    """ Rent & invest arguments of the example scenario over `years`. """
+    scenario = calc.EXAMPLE_SCENARIO
+    return {
+        'initial_amount': scenario['initial_savings'], 'annual_interest_rate': scenario['annual_investment_rate'], 'years': years,
+        'annual_rent': scenario['annual_rent'], 'rent_cheques': scenario['rent_cheques'], 'monthly_salary': scenario['monthly_salary'],
+        'monthly_expenses': scenario['monthly_expenses'], 'change_apartment_interval': scenario['change_apartment_interval'],
+        'move_in_costs': scenario['move_in_costs'], 'start_date': scenario['start_date'],
+    }
+
+
+def cash_flows():
+    """ Salary, expenses and savings of the example scenario. """
+    return [calc.EXAMPLE_SCENARIO[name] for name in calc.CASH_FLOW_PARAMETERS]
+
+
+def batch_scenarios(n_scenarios, seed=SEED):
+    """ Seeded scenarios around the example: price, rates, rent and cash flows drawn per scenario. """
+    rng = np.random.default_rng(seed)
+    scenarios = dict(calc.EXAMPLE_SCENARIO)
+    scenarios['property_price'] = rng.uniform(1.5e6, 3.0e6, n_scenarios)
+    scenarios['principal'] = scenarios['property_price'] * rng.uniform(0.5, 0.8, n_scenarios)
+    scenarios['initial_rate'] = rng.uniform(3.0, 6.0, n_scenarios)
+    scenarios['later_rate'] = scenarios['initial_rate'] + rng.uniform(0.0, 2.0, n_scenarios)
+    scenarios['annual_investment_rate'] = rng.uniform(2.0, 8.0, n_scenarios)
+    scenarios['annual_rent'] = rng.uniform(80000, 200000, n_scenarios)
+    scenarios['monthly_salary'] = rng.uniform(40000, 80000, n_scenarios)
+    scenarios['monthly_expenses'] = rng.uniform(10000, 25000, n_scenarios)
+    scenarios['initial_savings'] = rng.uniform(6e5, 1.2e6, n_scenarios)
+    return scenarios
+
+
+def mortgage_offers(n_offers, seed=SEED):
+    """ Seeded bank offers: rates, fixed period, opening fee and early repayment terms drawn per offer. """
+    rng = np.random.default_rng(seed)
+    return [{'initial_rate': float(rng.uniform(3.0, 6.0)), 'initial_years': int(rng.integers(1, 6)), 'later_rate': float(rng.uniform(5.0, 9.0)),
+             'bank_mortgage_opening_fee_rate': float(rng.uniform(0.0, 1.5)), 'max_early_repayment_percent': float(rng.choice([10, 20, 30])),
+             'regular_early_repayment': float(rng.choice([0, 10000, 30000]))} for _ in range(n_offers)]
+
+
+def rate_history(n_months, seed=SEED):
+    """ Seeded monthly history: EIBOR as a bounded random walk and normally distributed monthly investment returns. """
+    rng = np.random.default_rng(seed)
+    history = np.empty(n_months, dtype=calc.HISTORY_DTYPE)
+    history['month'] = 2000 * 12 + np.arange(n_months)
+    history['eibor'] = np.clip(3 + np.cumsum(rng.normal(0, 0.15, n_months)), 0.1, 8)
+    history['investment_return'] = rng.normal(0.6, 4, n_months)
+    return history
+
+
+def evaluate_in_chunks(scenarios, n_scenarios, chunk_size=BATCH_CHUNK_SIZE):
+    """ Evaluate a scenario batch chunk by chunk and return the final net worth differences. """
+    differences = np.empty(n_scenarios)
+    for first in range(0, n_scenarios, chunk_size):
+        members = np.arange(first, min(first + chunk_size, n_scenarios))
+        differences[members] = calc.evaluate_scenarios(calc.select_scenarios(scenarios, members))['net_worth_difference']
+    return differences
+
+
+def build_cases(quick=False):
+    """ Ordered list of (name, setup) pairs; setup returns the callable to time and runs outside the timer. """
+    cases = []
+    salary, expenses, savings = cash_flows()
+
+    for years in HORIZONS:
+        for n_early_repayments in EARLY_REPAYMENT_COUNTS:
+            def setup(years=years, n_early_repayments=n_early_repayments):
+                calculator = calc.MortgageCalculator(**mortgage_params(years, n_early_repayments))
+                return lambda: calculator.simulate_payment_plan(salary, expenses, savings)
+            cases.append((f'mortgage.simulate.{years}y.{n_early_repayments}_repayments', setup))
+
+    def setup():
+        calculator = calc.MortgageCalculator(**mortgage_params(25))
+        cache = calc.AmortizationCache()
+        calculator.generate_payment_plan(salary, expenses, savings, cache=cache)
+        return lambda: calculator.generate_payment_plan(salary, expenses, savings, cache=cache)
+    cases.append(('mortgage.cached.25y', setup))
+
+    def setup():
+        params = mortgage_params(25)
+        plan = calc.IncrementalPaymentPlan(params, salary, expenses, savings)
+        last_year = int(params['start_date'][:4]) + 24
+        # Alternates between two repayment dates in the last year, so every call re-simulates the last months
+        repayments = itertools.cycle([[{'date': f'{last_year}-{month:02d}-01', 'amount': 10000}] for month in (3, 4)])
+        return lambda: plan.update(arbitrary_early_repayments=next(repayments))
+    cases.append(('mortgage.incremental.late_edit', setup))
+
+    for years in HORIZONS:
+        def setup(years=years):
+            calculator = calc.Rent_And_Invest_Calculator(**rent_params(years))
+            return calculator.calculate_investment
+        cases.append((f'rent.simulate.{years}y', setup))
+
+        def setup(years=years):
+            calculator = calc.Rent_And_Invest_Calculator(**rent_params(years))
+            return calculator.calculate_investment_fast
+        cases.append((f'rent.fast.{years}y', setup))
+
+    def setup():
+        payment_plan = calc.MortgageCalculator(**mortgage_params(25)).simulate_payment_plan(salary, expenses, savings)[0]
+        return payment_plan.to_dataframe
+    cases.append(('report.payment_plan.dataframe', setup))
+
+    def setup():
+        calculator = calc.MortgageCalculator(**mortgage_params(25))
+        payment_plan, _, _, _, _, _, highlight_row = calculator.simulate_payment_plan(salary, expenses, savings)
+        return lambda: calculator.style_payment_plan(payment_plan, highlight_row)
+    cases.append(('report.payment_plan.styler', setup))
+
+    def setup():
+        calculator = calc.MortgageCalculator(**mortgage_params(25))
+        payment_plan, _, _, _, _, _, highlight_row = calculator.simulate_payment_plan(salary, expenses, savings)
+        styler = calculator.style_payment_plan(payment_plan, highlight_row)
+        return styler.to_html
+    cases.append(('report.payment_plan.html', setup))
+
+    for years in HORIZONS:
+        def setup(years=years):
+            payment_plan, _, _, _, _, _, highlight_row = calc.MortgageCalculator(**mortgage_params(years)).simulate_payment_plan(salary, expenses, savings)
+            return calc.TableRenderer(payment_plan, highlight_row).html
+        cases.append((f'report.payment_plan.renderer_html.{years}y', setup))
+
+    def setup():
+        payment_plan, _, _, _, _, _, highlight_row = calc.MortgageCalculator(**mortgage_params(25)).simulate_payment_plan(salary, expenses, savings)
+        return calc.TableRenderer(payment_plan, highlight_row).text
+    cases.append(('report.payment_plan.renderer_text', setup))
+
+    def setup():
+        payment_plan, _, _, _, _, _, highlight_row = calc.MortgageCalculator(**mortgage_params(25)).simulate_payment_plan(salary, expenses, savings)
+        return lambda: calc.TableRenderer(payment_plan, highlight_row).yearly().html()
+    cases.append(('report.payment_plan.renderer_yearly', setup))
+
+    def setup():
+        calculator = calc.Rent_And_Invest_Calculator(**rent_params(25))
+        balance_progression = calculator.calculate_investment()[0]
+        return lambda: calculator.style_balance_progression(balance_progression).to_html()
+    cases.append(('report.balance_progression.html', setup))
+
+    def setup():
+        net_worth_progression = calc.MortgageCalculator(**mortgage_params(25)).simulate_payment_plan(salary, expenses, savings)[5]
+        balance_progression = calc.Rent_And_Invest_Calculator(**rent_params(25)).calculate_investment()[0]
+        return lambda: calc.style_comparison(calc.compare_net_worth(net_worth_progression, balance_progression)).to_html()
+    cases.append(('report.comparison.html', setup))
+
+    def setup():
+        mortgage_calculator, rent_invest_calculator = calc.build_calculators(calc.EXAMPLE_SCENARIO)
+        payment_plan, _, _, _, _, net_worth_progression, _ = mortgage_calculator.simulate_payment_plan(salary, expenses, savings)
+        balance_progression = rent_invest_calculator.calculate_investment()[0]
+        exporter = calc.ChartExporter(tempfile.mkdtemp(prefix='benchmark_charts_'))
+        return lambda: exporter.export(payment_plan, net_worth_progression, balance_progression)
+    cases.append(('report.charts.png', setup))
+
+    for years in HORIZONS:
+        def setup(years=years):
+            simulation = calc.StreamingSimulation(calc.MortgageCalculator(**mortgage_params(years)), calc.Rent_And_Invest_Calculator(**rent_params(years)),
+                                                  salary, expenses, savings, step='daily')
+            path = os.path.join(tempfile.mkdtemp(prefix='benchmark_stream_'), 'daily.csv')
+            return lambda: simulation.write(path)
+        cases.append((f'stream.daily.{years}y', setup))
+
+    for top_k in (None, 5):
+        def setup(top_k=top_k):
+            offers = mortgage_offers(1000)
+            rental_plans = [{'annual_rent': annual_rent} for annual_rent in (70000, 100000, 130000)]
+            return calc.OfferComparison(calc.EXAMPLE_SCENARIO, offers, rental_plans, top_k).run
+        cases.append((f'offers.rank.1000{"" if top_k is None else f".top{top_k}"}', setup))
+
+    for objective in calc.EarlyRepaymentOptimizer.OBJECTIVES:
+        def setup(objective=objective):
+            return calc.EarlyRepaymentOptimizer(calc.EXAMPLE_SCENARIO, objective).run
+        cases.append((f'optimize.early_repayments.{objective}', setup))
+
+    def setup():
+        path = os.path.join(tempfile.mkdtemp(prefix='benchmark_backtest_'), 'history.npy')
+        np.save(path, rate_history(60 * 12))
+        return calc.HistoricalBacktest(calc.EXAMPLE_SCENARIO, path, margin=1.5, reset_interval=3).run
+    cases.append(('backtest.rolling.60y_history', setup))
+
+    for cached in (False, True):
+        def setup(cached=cached):
+            rows = [{'annual_rent': float(annual_rent)} for annual_rent in np.random.default_rng(SEED).uniform(80000, 200000, 1000)]
+            directory = tempfile.mkdtemp(prefix='benchmark_store_')
+            if cached:
+                store = calc.ResultStore(directory)
+                store.evaluate(rows, calc.EXAMPLE_SCENARIO)
+                return lambda: store.evaluate(rows, calc.EXAMPLE_SCENARIO)
+            # A fresh store every call, so every scenario is simulated and stored
+            stores = (calc.ResultStore(os.path.join(directory, str(i))) for i in itertools.count())
+            return lambda: next(stores).evaluate(rows, calc.EXAMPLE_SCENARIO)
+        cases.append((f'store.evaluate.1000.{"warm" if cached else "cold"}', setup))
+
+    def setup():
+        dashboard = calc.InteractiveDashboard()
+        dashboard.build_figure().canvas.draw()
+        later_rates = itertools.cycle([8.0, 8.05])
+        return lambda: dashboard.update(later_rate=next(later_rates))
+    cases.append(('dashboard.update.later_rate', setup))
+
+    def setup():
+        dashboard = calc.InteractiveDashboard()
+        dashboard.build_figure().canvas.draw()
+        last_year = int(dashboard.scenario['start_date'][:4]) + dashboard.scenario['total_years'] - 1
+        # A repayment moving within the last year: only the last months are re-simulated and redrawn
+        repayments = dashboard.scenario['arbitrary_early_repayments']
+        repayments = itertools.cycle([repayments + [{'date': f'{last_year}-{month:02d}-01', 'amount': 10000}] for month in (3, 4)])
+        return lambda: dashboard.update(arbitrary_early_repayments=next(repayments))
+    cases.append(('dashboard.update.late_edit', setup))
+
+    for n_scenarios in (QUICK_BATCH_SIZES if quick else BATCH_SIZES):
+        def setup(n_scenarios=n_scenarios):
+            scenarios = batch_scenarios(n_scenarios)
+            return lambda: evaluate_in_chunks(scenarios, n_scenarios)
+        cases.append((f'batch.evaluate.{n_scenarios}', setup))
+
+    return cases
+
+
+def time_case(function, repeat=5, min_time=0.2):
+    """ Time a callable like timeit's autorange and return per-call seconds. """
+    timer = timeit.Timer(function)
+    number, total = timer.autorange(lambda number, total: total >= min_time)
+    if total >= 10 * min_time:
+        repeat = min(repeat, 3)  # slow cases: a few single calls are enough
+    times = [total / number] + [t / number for t in timer.repeat(repeat=repeat - 1, number=number)]
+    return {'min': min(times), 'median': float(np.median(times)), 'number': number, 'repeat': repeat}
+
+
+def git_commit():
+    """ Current commit of the working tree, marked dirty when there are uncommitted changes. """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def machine_info():
+    """ Fingerprint used to only compare timings taken on the same machine and software versions. """
+    return {
+        'machine': platform.machine(), 'processor': platform.processor(), 'system': platform.system(), 'node': platform.node(),
+        'cpu_count': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__,
+    }
+
+
+def read_history(path):
+    """ All recorded runs, oldest first. """
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(history, machine, baseline=None):
+    """ Baseline run: by index or commit prefix when given, otherwise the first run on this machine. """
+    if baseline is not None:
+        if baseline.lstrip('-').isdigit():
+            return history[int(baseline)] if history else None
+        matches = [entry for entry in history if (entry.get('commit') or '').startswith(baseline)]
+        return matches[0] if matches else None
+    matches = [entry for entry in history if entry['machine'] == machine]
+    return matches[0] if matches else None
+
+
+def compare(results, baseline, threshold):
+    """ Per case (name, median, baseline median, ratio, regressed) rows; ratio is None for new cases. """
+    rows = []
+    for name, timing in results.items():
+        previous = baseline['results'].get(name) if baseline else None
+        if previous is None:
+            rows.append((name, timing['median'], None, None, False))
+            continue
+        ratio = timing['median'] / previous['median']
+        rows.append((name, timing['median'], previous['median'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def format_seconds(seconds):
+    """ Human readable duration. """
+    if seconds is None:
+        return '-'
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:,.2f} {unit}"
+    return f"{seconds / 1e-9:,.0f} ns"
+
+
+def main(argv=None):
+    """ Run the benchmark cases, record them and report regressions against the baseline. """
+    parser = argparse.ArgumentParser(description='Benchmark the mortgage and rent & invest calculators')
+    parser.add_argument('-k', '--filter', action='append', help='only run cases whose name contains this text (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='skip the 100k scenario batch')
+    parser.add_argument('--history', default='benchmark_history.jsonl', help='JSON lines file with one entry per run')
+    parser.add_argument('--baseline', help='history entry to compare against: index or commit prefix (default: first run on this machine)')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown of the median flagged as a regression')
+    parser.add_argument('--repeat', type=int, default=5, help='timings per case')
+    parser.add_argument('--no-save', action='store_true', help='do not append this run to the history')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 when a case regressed')
+    args = parser.parse_args(argv)
+
+    cases = [(name, setup) for name, setup in build_cases(args.quick) if not args.filter or any(text in name for text in args.filter)]
+    results = {}
+    for name, setup in cases:
+        calc.AMORTIZATION_CACHE.clear()
+        results[name] = time_case(setup(), repeat=args.repeat)
+        print(f"{name:<45} {format_seconds(results[name]['median']):>12}", file=sys.stderr)
+
+    machine = machine_info()
+    history = read_history(args.history)
+    baseline = find_baseline(history, machine, args.baseline)
+    rows = compare(results, baseline, args.threshold)
+
+    if baseline:
+        print(f"\nBaseline: {baseline['timestamp']} ({baseline.get('commit') or 'unknown commit'})")
+    else:
+        print("\nNo baseline for this machine yet; this run becomes the baseline once saved")
+    print(f"{'case':<45} {'median':>12} {'baseline':>12} {'ratio':>8}")
+    for name, median, previous, ratio, regressed in rows:
+        ratio_text = f"{ratio:.2f}x" if ratio is not None else '-'
+        print(f"{name:<45} {format_seconds(median):>12} {format_seconds(previous):>12} {ratio_text:>8}{'  REGRESSION' if regressed else ''}")
+
+    if not args.no_save:
+        entry = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(), 'machine': machine, 'quick': args.quick, 'results': results}
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,22 @@
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import matplotlib.ticker as mticker
+import argparse
+import calendar
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import copy
+import csv
+import functools
+import hashlib
+import html
+import inspect
+import itertools
+import json
+import os
+import sys
+import threading
+import time
 from datetime import datetime, timedelta
 
 """
@@ -55,8 +69,602 @@ change_apartment_interval = 3  # Change apartment every 3 years
 initial_amount = initial_savings  # Initial amount equal to initial savings
 move_in_costs = 3000  # Move-in costs for each new apartment
 
+EXAMPLE_SCENARIO = {
+    'principal': principal, 'initial_rate': initial_rate, 'initial_years': initial_years, 'later_rate': later_rate, 'total_years': total_years,
+    'property_price': property_price, 'property_size': property_size, 'maintenance_fees_rate': maintenance_fees_rate,
+    'maintenance_fees_interval': maintenance_fees_interval, 'life_insurance_rate': life_insurance_rate, 'property_insurance_rate': property_insurance_rate,
+    'insurance_payment_interval': insurance_payment_interval, 'annual_investment_rate': annual_investment_rate,
+    'regular_early_repayment': regular_early_repayment, 'regular_early_repayment_interval': regular_early_repayment_interval,
+    'property_value_factor': property_value_factor, 'valuation_fee': valuation_fee, 'conveyance_fee': conveyance_fee,
+    'bank_mortgage_opening_fee_rate': bank_mortgage_opening_fee_rate, 'max_early_repayment_percent': max_early_repayment_percent,
+    'start_date': start_date, 'first_regular_early_repayment_date': first_regular_early_repayment_date,
+    'allow_exceed_early_repayment_limit': allow_exceed_early_repayment_limit, 'arbitrary_early_repayments': arbitrary_early_repayments,
+    'monthly_salary': monthly_salary, 'monthly_expenses': monthly_expenses, 'initial_savings': initial_savings,
+    'annual_rent': annual_rent, 'rent_cheques': rent_cheques, 'change_apartment_interval': change_apartment_interval, 'move_in_costs': move_in_costs,
+}
+
+# pandas, matplotlib and seaborn are imported inside the print_* and plot_* methods, asyncio inside EvaluationService and
+# sqlite3 inside ResultStore, so importing this module stays cheap
+
+class Instrumentation:
+    """ Named stage timings and counters collected while installed with instrument().
+
+    Every finished stage and counter update is also recorded as a Chrome trace event and passed to the callback,
+    if any. Stage times include the time of the stages nested in them.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = collections.defaultdict(lambda: [0, 0.0])  # name -> [calls, seconds]
+        self.counters = collections.Counter()
+        self.events = []
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Time the enclosed block as one call of the named stage. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.stages[name][0] += 1
+                self.stages[name][1] += duration
+            self.record({'name': name, 'ph': 'X', 'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6})
+
+    def count(self, name, n=1):
+        """ Add n to the named counter. """
+        with self.lock:
+            self.counters[name] += n
+            total = self.counters[name]
+        self.record({'name': name, 'ph': 'C', 'ts': (time.perf_counter() - self.origin) * 1e6, 'args': {name: total}})
+
+    def record(self, event):
+        event['pid'] = os.getpid()
+        event['tid'] = threading.get_ident()
+        self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    def summary(self):
+        """ {'stages': {name: {'calls', 'seconds'}}, 'counters': {name: total}} """
+        return {'stages': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.stages.items()},
+                'counters': dict(self.counters)}
+
+    def write_json(self, path):
+        """ Write the summary as JSON. """
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_chrome_trace(self, path):
+        """ Write all events in the Chrome trace format, for chrome://tracing or Perfetto. """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Installed by instrument() for the current thread or asyncio task; while it is None, stages and counters cost one lookup
+_instrumentation = contextvars.ContextVar('instrumentation', default=None)
+_NO_STAGE = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def instrument(callback=None):
+    """ Collect stage timings and counters of everything run inside the block into the yielded Instrumentation.
+
+    Collection is per context: other threads and asyncio tasks are only recorded when they run in a copy of this
+    context, as asyncio tasks created inside the block do.
+    """
+    instrumentation = Instrumentation(callback)
+    token = _instrumentation.set(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        _instrumentation.reset(token)
+
+
+def _stage(name):
+    instrumentation = _instrumentation.get()
+    return _NO_STAGE if instrumentation is None else instrumentation.stage(name)
+
+
+def _count(name, n=1):
+    instrumentation = _instrumentation.get()
+    if instrumentation is not None:
+        instrumentation.count(name, n)
+
+
+def _timed(name):
+    """ Decorator timing every call of a function as the named stage. """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            instrumentation = _instrumentation.get()
+            if instrumentation is None:
+                return function(*args, **kwargs)
+            with instrumentation.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Schedule:
+    """ Columnar (structure-of-arrays) simulation result.
+
+    Every field is a contiguous float64 array indexed by an integer month number: shaped (months,) for a single
+    scenario or (n_scenarios, months) for a batch. Dates are derived from start_date only when requested.
+    """
+    def __init__(self, columns, month, start_date):
+        self.columns = columns
+        self.month = np.asarray(month)
+        self.start_date = start_date
+        self._dates = None
+
+    @classmethod
+    def allocate(cls, column_names, n_rows, start_date, first_month=0):
+        """ Preallocate a single-scenario schedule; rows are filled in place through schedule.values[row] = (...). """
+        values = np.empty((n_rows, len(column_names)), order='F')  # Column-major, so every column is contiguous
+        schedule = cls({column: values[:, i] for i, column in enumerate(column_names)}, np.arange(first_month, first_month + n_rows), start_date)
+        schedule.values = values
+        _count('bytes_allocated', schedule.nbytes)
+        return schedule
+
+    def __len__(self):
+        return self.month.shape[-1]
+
+    def __getitem__(self, column):
+        return self.dates if column == 'Date' else self.columns[column]
+
+    def __contains__(self, column):
+        return column == 'Date' or column in self.columns
+
+    def keys(self):
+        return ['Date'] + list(self.columns)
+
+    @property
+    def n_scenarios(self):
+        """ Number of scenarios in a batch schedule, or None for a single scenario. """
+        for values in self.columns.values():
+            return values.shape[0] if values.ndim == 2 else None
+        return None
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values()) + self.month.nbytes
+
+    @property
+    def dates(self):
+        """ 'YYYY-MM-DD' payment date of every month, formatted once on first access. """
+        if self._dates is None:
+            with _stage('dates'):
+                unique_months, inverse = np.unique(self.month, return_inverse=True)
+                labels = np.array([MortgageCalculator.get_payment_date(self.start_date, int(month)).strftime('%Y-%m-%d') for month in unique_months])
+                self._dates = labels[inverse].reshape(self.month.shape)
+            _count('dates_formatted', len(unique_months))
+        return self._dates
+
+    def scenario(self, index):
+        """ View of one scenario of a batch schedule (no copy). """
+        month = self.month[index] if self.month.ndim == 2 else self.month
+        return Schedule({column: values[index] for column, values in self.columns.items()}, month, self.start_date)
+
+    def to_dataframe(self):
+        """ DataFrame with a 'Date' column followed by the numeric columns, which share memory with this schedule. """
+        if self.n_scenarios is not None:
+            raise ValueError("Select a single scenario with schedule.scenario(i) before converting to a DataFrame")
+        import pandas as pd
+        dates = self.dates
+        with _stage('dataframe'):
+            df = pd.DataFrame({'Date': dates, **self.columns}, copy=False)
+        _count('rows_materialized', len(df))
+        return df
+
+    def to_records(self):
+        """ Legacy list-of-dicts form: one {'Date': ..., column: value, ...} dict per month. """
+        if self.n_scenarios is not None:
+            raise ValueError("Select a single scenario with schedule.scenario(i) before converting to records")
+        columns = [column.tolist() for column in self.columns.values()]
+        _count('rows_materialized', len(self))
+        return [dict(zip(self.keys(), row)) for row in zip(self.dates.tolist(), *columns)]
+
+
+class TableRenderer:
+    """ Renders a Schedule or DataFrame as HTML, plain text or Markdown in one pass per column, without a pandas Styler.
+
+    Numbers are formatted column by column and the highlight row is a CSS class, so no per-cell styles are built.
+    rows selects a slice of the table (see pages()); the iter_* methods yield the output in chunks of chunk_size rows,
+    so a long table can be written out without holding the whole document in memory.
+    """
+    # Columns holding a balance at the end of the month; yearly() keeps their year-end value instead of summing them
+    END_OF_PERIOD_COLUMNS = ['Mortgage Balance', 'Investments', 'Net Worth', 'Property Value', 'Investment Balance', 'Remaining Principal', 'Debts',
+                             'Balance', 'Net Worth (Mortgage)', 'Net Worth (Rent & Invest)']
+    LABEL_COLUMNS = ['Date', 'Year']
+
+    CSS = """<style>
+table.schedule {border-collapse: collapse}
+table.schedule th, table.schedule td {border: 1px solid black; padding: 3px}
+table.schedule thead th {font-size: 14pt; font-weight: bold; text-align: center; vertical-align: middle}
+table.schedule td {color: black; background-color: white}
+table.schedule tbody tr:nth-child(odd) td {background-color: #f2f2f2}
+table.schedule td.label {white-space: nowrap; text-align: center}
+table.schedule tr.highlight td {font-weight: bold; color: darkgreen}
+</style>
+"""
+
+    def __init__(self, table, highlight_row=None, index_start=1, number_format=',.2f', chunk_size=1000):
+        if getattr(table, 'n_scenarios', None) is not None:
+            raise ValueError("Select a single scenario with schedule.scenario(i) before rendering")
+        self.columns = [str(column) for column in table.keys()]
+        self.values = [np.asarray(table[column]) for column in table.keys()]
+        self.highlight_row = highlight_row
+        self.index_start = index_start
+        self.number_format = number_format
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.values[0]) if self.values else 0
+
+    def pages(self, page_size=120):
+        """ Row slices of consecutive pages, to pass as rows to the render methods. """
+        return [slice(start, min(start + page_size, len(self))) for start in range(0, len(self), page_size)]
+
+    def chunks(self, rows=None):
+        """ Row ranges of at most chunk_size rows covering the selected rows. """
+        start, stop, _ = (rows or slice(None)).indices(len(self))
+        return [range(first, min(first + self.chunk_size, stop)) for first in range(start, stop, self.chunk_size)]
+
+    def format_column(self, values, rows):
+        """ Cell strings of one column for a range of rows. """
+        values = values[rows.start:rows.stop]
+        if values.dtype.kind == 'f':
+            return [format(value, self.number_format) for value in values.tolist()]
+        return [str(value) for value in values.tolist()]
+
+    def column_width(self, values, rows):
+        """ Width of the widest cell of a column, from its extremes rather than formatting every cell. """
+        values = values[rows]
+        if values.dtype.kind != 'f' or not len(values):
+            return max((len(str(value)) for value in values.tolist()), default=0)
+        finite = values[np.isfinite(values)]
+        widths = [len(format(value, self.number_format)) for value in (finite.min(), finite.max())] if len(finite) else []
+        if len(finite) < len(values):
+            widths += [len(format(value, self.number_format)) for value in np.unique(values[~np.isfinite(values)]).tolist()]
+        return max(widths)
+
+    def rows_of(self, rows):
+        """ (index label, cells) of every row in a chunk. """
+        cells = [self.format_column(values, rows) for values in self.values]
+        return zip([str(row + self.index_start) for row in rows], zip(*cells))
+
+    def iter_html(self, rows=None):
+        """ HTML table in chunks; the highlight row is set in bold dark green. """
+        label_columns = [column in self.LABEL_COLUMNS for column in self.columns]
+        yield self.CSS + '<table class="schedule">\n<thead>\n<tr><th></th>' + ''.join(f'<th>{html.escape(column)}</th>' for column in self.columns) + '</tr>\n</thead>\n<tbody>\n'
+        for chunk in self.chunks(rows):
+            lines = []
+            for row, (label, cells) in zip(chunk, self.rows_of(chunk)):
+                row_class = ' class="highlight"' if row == self.highlight_row else ''
+                lines.append(f'<tr{row_class}><th>{label}</th>' + ''.join(f'<td class="label">{cell}</td>' if is_label else f'<td>{cell}</td>'
+                                                                        for cell, is_label in zip(cells, label_columns)) + '</tr>\n')
+            yield ''.join(lines)
+        yield '</tbody>\n</table>\n'
+
+    def iter_text(self, rows=None):
+        """ Fixed-width plain text in chunks, with right-aligned columns; the highlight row is marked with '*'. """
+        rows = rows or slice(None)
+        start, stop, _ = rows.indices(len(self))
+        index_width = len(str(max(stop - 1, 0) + self.index_start)) + 1
+        widths = [max(len(column), self.column_width(values, slice(start, stop))) for column, values in zip(self.columns, self.values)]
+        yield ' ' * index_width + ''.join('  ' + column.rjust(width) for column, width in zip(self.columns, widths)) + '\n'
+        for chunk in self.chunks(rows):
+            yield ''.join((label + ('*' if row == self.highlight_row else '')).ljust(index_width) + ''.join('  ' + cell.rjust(width) for cell, width in zip(cells, widths)) + '\n'
+                          for row, (label, cells) in zip(chunk, self.rows_of(chunk)))
+
+    def iter_markdown(self, rows=None):
+        """ Markdown table in chunks; the highlight row is set in bold. """
+        yield '| |' + ''.join(f' {column} |' for column in self.columns) + '\n|--:|' + ''.join(':-:|' if column in self.LABEL_COLUMNS else '--:|' for column in self.columns) + '\n'
+        for chunk in self.chunks(rows):
+            lines = []
+            for row, (label, cells) in zip(chunk, self.rows_of(chunk)):
+                if row == self.highlight_row:
+                    label, cells = f'**{label}**', [f'**{cell}**' for cell in cells]
+                lines.append(f'| {label} |' + ''.join(f' {cell} |' for cell in cells) + '\n')
+            yield ''.join(lines)
+
+    def html(self, rows=None):
+        return ''.join(self.iter_html(rows))
+
+    def text(self, rows=None):
+        return ''.join(self.iter_text(rows))
+
+    def markdown(self, rows=None):
+        return ''.join(self.iter_markdown(rows))
+
+    def write(self, path, output_format=None, rows=None):
+        """ Stream the table to a file; the format ('html', 'text' or 'markdown') defaults from the .html/.md/.txt extension. """
+        output_format = output_format or {'.html': 'html', '.htm': 'html', '.md': 'markdown'}.get(os.path.splitext(path)[1].lower(), 'text')
+        chunks = {'html': self.iter_html, 'text': self.iter_text, 'markdown': self.iter_markdown}[output_format](rows)
+        with open(path, 'w') as f:
+            f.writelines(chunks)
+
+    def yearly(self):
+        """ Renderer of one row per calendar year: flows are summed and balances keep their year-end value. """
+        table, starts = aggregate_yearly(dict(zip(self.columns, self.values)))
+        highlight_row = None if self.highlight_row is None else int(np.searchsorted(starts, self.highlight_row, side='right')) - 1
+        return TableRenderer(table, highlight_row, self.index_start, self.number_format, self.chunk_size)
+
+
+def aggregate_yearly(table):
+    """ One row per calendar year of a table with a 'Date' column, returned as (columns dict starting with 'Year', first row of every year).
+
+    Flows are summed over the year, while balances (TableRenderer.END_OF_PERIOD_COLUMNS) keep their year-end value.
+    """
+    years = np.asarray(table['Date']).astype('U4').astype(int)
+    starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+    ends = np.r_[starts[1:], len(years)] - 1
+    yearly = {'Year': years[starts]}
+    for column in table.keys():
+        if column != 'Date':
+            values = np.asarray(table[column])
+            yearly[column] = values[ends] if column in TableRenderer.END_OF_PERIOD_COLUMNS else np.add.reduceat(values, starts)
+    return yearly, starts
+
+
+def _display_table(renderer, rows=None):
+    """ Show a table as HTML in a notebook, or as plain text in a terminal. """
+    with _stage('table.render'):
+        try:
+            from IPython import get_ipython
+            from IPython.display import HTML, display
+        except ImportError:
+            shell = None
+        else:
+            shell = get_ipython()
+        if shell is None:
+            sys.stdout.writelines(renderer.iter_text(rows))
+        else:
+            display(HTML(renderer.html(rows)))
+
+
+class Amortization:
+    """ Loan side of a payment plan, which does not depend on salary, expenses or savings.
+
+    required_balance holds, for every month, the investment balance the early repayments of that month need so that
+    the investment balance cap does not reduce them (-inf in months without early repayments).
+    """
+    def __init__(self, schedule, required_balance, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees):
+        self.schedule = schedule
+        self.required_balance = required_balance
+        self.total_interest_paid = total_interest_paid
+        self.total_insurance_costs = total_insurance_costs
+        self.total_maintenance_costs = total_maintenance_costs
+        self.total_early_repayment_fees = total_early_repayment_fees
+
+    @property
+    def nbytes(self):
+        return self.schedule.nbytes + self.required_balance.nbytes
+
+
+class AmortizationCache:
+    """ Bounded LRU cache of amortizations keyed by a canonical hash of the loan parameters.
+
+    Entries are evicted least recently used first once there are more than max_entries of them or their arrays take
+    more than max_bytes. fallbacks counts lookups whose cash flows could not reuse the cached loan side.
+    """
+    def __init__(self, max_entries=256, max_bytes=64 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fallbacks = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        amortization = self.entries.get(key)
+        if amortization is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return amortization
+
+    def put(self, key, amortization):
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key).nbytes
+        self.entries[key] = amortization
+        self.nbytes += amortization.nbytes
+        while self.entries and (len(self.entries) > self.max_entries or self.nbytes > self.max_bytes):
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """ Drop all entries and reset the statistics. """
+        self.entries.clear()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = self.fallbacks = 0
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0, 'fallbacks': self.fallbacks,
+                'evictions': self.evictions, 'entries': len(self.entries), 'nbytes': self.nbytes}
+
+
+def _parse_date(date):
+    """ datetime for a 'YYYY-MM-DD' string; datetime objects are returned unchanged. """
+    if isinstance(date, datetime):
+        return date
+    try:
+        return datetime.fromisoformat(date)
+    except ValueError:
+        return datetime.strptime(date, '%Y-%m-%d')
+
+
+class EventSchedule:
+    """ Cash-flow events on an integer month index, shared by the calculators.
+
+    A dated event belongs to the first month whose payment date is on or after it, which is where comparing payment
+    dates month by month used to apply it. Dates are converted once, when events are added, and events are grouped per
+    kind and month, so the monthly loops only do O(1) index lookups. Kinds are free-form strings.
+
+    With first_month > 0 the schedule is a window of months first_month to total_months - 1: tables and occurs() are
+    indexed from first_month, and of the earlier events only the last of each kind is kept, for last_before().
+    """
+    def __init__(self, start_date, total_months, first_month=0):
+        self.start_date = _parse_date(start_date)
+        self.total_months = total_months
+        self.first_month = first_month
+        self.events = collections.defaultdict(list)  # kind -> [(month, date, priority, sequence, amount)]
+        self.before = {}  # kind -> last event before first_month
+        self.sequence = itertools.count()
+        self.tables = {}  # kind -> [offsets, amounts, months, occurs], built on first use
+
+    def payment_day(self, year, month):
+        """ Day of the month payments fall on: the start day, or the last day of shorter months. """
+        return min(self.start_date.day, calendar.monthrange(year, month)[1])
+
+    def month_index(self, date):
+        """ First month whose payment date is on or after date; 0 for dates before the start. """
+        date = _parse_date(date)
+        month = (date.year - self.start_date.year) * 12 + date.month - self.start_date.month
+        if date.day > self.payment_day(date.year, date.month):
+            month += 1
+        return max(month, 0)
+
+    def add(self, kind, date, amount=None, priority=0):
+        """ Add one dated event; events on the same date apply by priority, then in the order they were added. """
+        date = _parse_date(date)
+        event = (self.month_index(date), (date.year, date.month, date.day), priority, next(self.sequence), amount)
+        if event[0] < self.first_month:
+            if kind not in self.before or event[:4] > self.before[kind][:4]:
+                self.before[kind] = event
+            return
+        self.events[kind].append(event)
+        self.tables.pop(kind, None)
+
+    def add_recurring(self, kind, first_date, interval, amount=None, priority=0):
+        """ Add an event every interval months from first_date through the last payment date.
+
+        Like get_payment_date, every date keeps the day of the previous one, or the last day of a shorter month.
+        """
+        if interval <= 0:
+            return
+        date = _parse_date(first_date)
+        year, month, day = date.year, date.month, date.day
+        last_year, last_month = divmod(self.start_date.year * 12 + self.start_date.month + self.total_months - 2, 12)
+        last_payment_date = (last_year, last_month + 1, self.payment_day(last_year, last_month + 1))
+        while (year, month, day) <= last_payment_date:
+            self.add(kind, datetime(year, month, day), amount, priority)
+            year, month = year + (month + interval - 1) // 12, (month + interval - 1) % 12 + 1
+            day = min(day, calendar.monthrange(year, month)[1])
+
+    def add_every(self, kind, interval, first_month=0, amount=None):
+        """ Add an event in months first_month, first_month + interval, ... of the schedule. """
+        events = self.events[kind]
+        if first_month < self.first_month:
+            first_month -= (first_month - self.first_month) // interval * interval
+        for month in range(first_month, self.total_months, interval):
+            events.append((month, (), 0, next(self.sequence), amount))
+        self.tables.pop(kind, None)
+
+    def replace(self, other, kinds, first_month):
+        """ Replace the events of the given kinds in first_month and later with those of other, a schedule with the same start date. """
+        for kind in kinds:
+            events = self.events[kind] = [event for event in self.events[kind] if event[0] < first_month]
+            for month, date, priority, _, amount in other.events.get(kind, []):
+                if month >= first_month:
+                    events.append((month, date, priority, next(self.sequence), amount))
+            self.tables.pop(kind, None)
+
+    def build_table(self, kind):
+        if kind not in self.tables:
+            events = sorted(event for event in self.events.get(kind, []) if event[0] < self.total_months)
+            months = [event[0] for event in events]
+            self.tables[kind] = [np.searchsorted(months, np.arange(self.first_month, self.total_months + 1)).tolist(), [event[4] for event in events], months, None]
+        return self.tables[kind]
+
+    def table(self, kind):
+        """ (offsets, amounts) of one kind: the events of month m are amounts[offsets[m]:offsets[m + 1]], in the order they apply. """
+        offsets, amounts, _, _ = self.build_table(kind)
+        return offsets, amounts
+
+    def entries(self, kind):
+        """ (month, amount) of every event of one kind, in the order they apply. """
+        _, amounts, months, _ = self.build_table(kind)
+        return list(zip(months, amounts))
+
+    def occurs(self, kind):
+        """ Per month, whether any event of kind falls in it; computed once per kind, so callers must not modify it. """
+        table = self.build_table(kind)
+        if table[3] is None:
+            offsets = table[0]
+            table[3] = [offsets[month + 1] > offsets[month] for month in range(self.total_months - self.first_month)]
+        return table[3]
+
+    def last_before(self, kind):
+        """ Amount of the last event of kind before the window, or None. """
+        event = self.before.get(kind)
+        return None if event is None else event[4]
+
+
+# Custom mortgage events: {'date': ..., 'type': ..., 'amount': ...}
+MORTGAGE_EVENT_TYPES = {
+    'maintenance': 'one-off property cost in AED, such as a renovation, paid with that month\'s maintenance',
+    'maintenance_fees_rate': 'new service charge in AED per square foot per year, for the maintenance fees due from that month on',
+}
+
+
+def _check_events(events):
+    """ Validate custom mortgage events. """
+    for event in events:
+        if event.get('type') not in MORTGAGE_EVENT_TYPES:
+            raise ValueError(f"Unknown event type {event.get('type')!r}, expected one of {sorted(MORTGAGE_EVENT_TYPES)}")
+    return list(events)
+
+
+# Everything the monthly loop carries from one month to the next, taken at the start of `month`
+PaymentPlanState = collections.namedtuple('PaymentPlanState', [
+    'month', 'remaining_principal', 'investment_balance', 'annual_early_repayments', 'total_interest_paid', 'total_insurance_costs',
+    'total_maintenance_costs', 'total_early_repayment_fees', 'total_emi', 'early_repayment_index', 'highlight_row', 'early_repayment_fees'])
+
+
+def _loan_events(calculator, total_months, periodic, dated_only=False, first_month=0):
+    """ EventSchedule of a scalar or batch mortgage calculator's early repayments, year ends and custom events, and with periodic=True its due months.
+
+    With dated_only=True only the dated events are added: early repayments and custom events. With first_month > 0 the
+    schedule is the window of months from first_month on.
+    """
+    events = EventSchedule(calculator.start_date, total_months, first_month)
+    # Regular repayments come first on equal dates; arbitrary ones keep their input order
+    events.add_recurring('early_repayment', calculator.first_regular_early_repayment_date, calculator.regular_early_repayment_interval, calculator.regular_early_repayment)
+    for rep in sorted(calculator.arbitrary_early_repayments, key=lambda x: _parse_date(x['date'])):
+        events.add('early_repayment', rep['date'], rep['amount'], priority=1)
+    for event in calculator.events:
+        events.add(event['type'], event['date'], event['amount'])
+    if dated_only:
+        return events
+    # The annual early repayment limit resets after the payment made in December
+    events.add_every('year_end', 12, first_month=(12 - calculator.start_date.month) % 12)
+    if periodic:
+        events.add_every('maintenance_due', calculator.maintenance_fees_interval)
+        events.add_every('insurance_due', calculator.insurance_payment_interval)
+    return events
+
+
 class MortgageCalculator:
-    def __init__(self, principal, initial_rate, initial_years, later_rate, total_years, property_price, property_size, maintenance_fees_rate, maintenance_fees_interval, life_insurance_rate=0.216, property_insurance_rate=0.12, insurance_payment_interval=1, annual_investment_rate=4.5, regular_early_repayment=0, regular_early_repayment_interval=0, property_value_factor=1.0, valuation_fee=1750, conveyance_fee=5250, bank_mortgage_opening_fee_rate=1, max_early_repayment_percent=10, start_date='2084-01-01', first_regular_early_repayment_date='2085-01-01', allow_exceed_early_repayment_limit=False, arbitrary_early_repayments=[]):
+    PAYMENT_PLAN_COLUMNS = ['Principal', 'Interest', 'Early Repayment', 'ER Fee', 'Insurance', 'Maint', 'Payments Sum', 'Mortgage Balance', 'Investments', 'Net Cash Flow']
+    NET_WORTH_COLUMNS = ['Net Worth', 'Property Value', 'Investment Balance', 'Remaining Principal', 'Debts']
+    # Payment plan columns that only depend on the loan, and the attributes that only affect the cash flows around it
+    LOAN_COLUMNS = PAYMENT_PLAN_COLUMNS[:8]
+    CASH_FLOW_ATTRIBUTES = ['annual_investment_rate', 'valuation_fee', 'conveyance_fee', 'bank_mortgage_opening_fee_rate', 'property_value_factor', 'early_repayment_fees']
+
+    def __init__(self, principal, initial_rate, initial_years, later_rate, total_years, property_price, property_size, maintenance_fees_rate, maintenance_fees_interval, life_insurance_rate=0.216, property_insurance_rate=0.12, insurance_payment_interval=1, annual_investment_rate=4.5, regular_early_repayment=0, regular_early_repayment_interval=0, property_value_factor=1.0, valuation_fee=1750, conveyance_fee=5250, bank_mortgage_opening_fee_rate=1, max_early_repayment_percent=10, start_date='2084-01-01', first_regular_early_repayment_date='2085-01-01', allow_exceed_early_repayment_limit=False, arbitrary_early_repayments=[], events=[]):
         self.principal = principal
         self.initial_rate = initial_rate / 100 / 12  # Convert annual rate to monthly
         self.initial_years = initial_years
@@ -82,7 +690,8 @@ class MortgageCalculator:
         self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
         self.first_regular_early_repayment_date = datetime.strptime(first_regular_early_repayment_date, '%Y-%m-%d')
         self.allow_exceed_early_repayment_limit = allow_exceed_early_repayment_limit
-        self.arbitrary_early_repayments = [rep for rep in arbitrary_early_repayments if datetime.strptime(rep['date'], '%Y-%m-%d') >= self.start_date]
+        self.arbitrary_early_repayments = [rep for rep in arbitrary_early_repayments if _parse_date(rep['date']) >= self.start_date]
+        self.events = _check_events(events)
         self.early_repayment_fees = 0
 
     def calculate_payment(self, rate, n_months, principal):
@@ -95,7 +704,8 @@ class MortgageCalculator:
         """ Calculate the remaining term in months given the rate, monthly payment, and remaining principal. """
         return np.log(monthly_payment / (monthly_payment - rate * principal)) / np.log(1 + rate)
 
-    def get_payment_date(self, start_date, month):
+    @staticmethod
+    def get_payment_date(start_date, month):
         """ Calculate the payment date on the same day of the month, or the last day if necessary. """
         year = start_date.year + (start_date.month + month - 1) // 12
         month = (start_date.month + month - 1) % 12 + 1
@@ -127,62 +737,188 @@ class MortgageCalculator:
 
         return actual_repayment_amt, early_repayment_fee, annual_early_repayments + actual_repayment_amt
 
-    def generate_payment_plan(self, monthly_salary, monthly_expenses, initial_savings):
-        payment_plan = []
-        remaining_principal = self.principal
-        total_interest_paid = 0
-        total_insurance_costs = 0
-        total_maintenance_costs = 0
-        annual_early_repayments = 0
-        total_early_repayment_fees = 0
+    def loan_key(self):
+        """ Canonical hash of the loan parameters; numbers are compared as floats, so 800000 and 800000.0 give the same key. """
+        # Every other attribute can change the loan side, so new attributes are part of the key unless listed as cash flow ones
+        loan = {name: value for name, value in vars(self).items() if name not in self.CASH_FLOW_ATTRIBUTES}
+        loan = {name: float(value) if isinstance(value, (int, float, np.number)) and not isinstance(value, bool) else value for name, value in loan.items()}
+        # Early repayments are applied in date order, keeping the given order within a date
+        repayments = sorted(self.arbitrary_early_repayments, key=lambda x: _parse_date(x['date']))
+        loan['arbitrary_early_repayments'] = [[_parse_date(rep['date']).isoformat(), float(rep['amount'])] for rep in repayments]
+        loan['events'] = [[event['date'], event['type'], float(event['amount'])] for event in self.events]
+        return hashlib.sha256(json.dumps(loan, sort_keys=True, default=str).encode()).hexdigest()
+
+    def amortize(self):
+        """ Loan side of the payment plan, simulated with an unlimited investment balance. """
+        early_repayment_fees = self.early_repayment_fees
+        required_balance = np.full(self.total_years * 12, -np.inf)
+        payment_plan, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, _, _ = self.simulate_payment_plan(
+            0, 0, float('inf'), required_balance=required_balance)
+        self.early_repayment_fees = early_repayment_fees
+
+        schedule = Schedule.allocate(self.LOAN_COLUMNS, len(payment_plan), self.start_date)
+        schedule.values[:] = payment_plan.values[:, :len(self.LOAN_COLUMNS)]
+        return Amortization(schedule, required_balance, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees)
+
+    def apply_cash_flows(self, amortization, monthly_salary, monthly_expenses, initial_savings, summary_only=False):
+        """ Simulate only the investment balance on top of an amortization; None if an early repayment would exceed the balance. """
+        loan = amortization.schedule
+        total_months = len(loan)
+        payments = loan['Payments Sum'].tolist()
+        remaining_principals = loan['Mortgage Balance'].tolist()
+        required_balance = amortization.required_balance.tolist()
+        investment_balances = [0.0] * total_months
+        net_cash_flows = [0.0] * total_months
+
+        down_payment = self.property_price - self.principal
+        initial_fees = self.calculate_initial_costs(self.property_price)
+        investment_balance = initial_savings - down_payment - initial_fees
+        net_monthly_income = monthly_salary - monthly_expenses
         highlight_row = None
 
-        # Calculate EMI for the initial period based on total loan duration
-        initial_months = self.initial_years * 12
+        # Same operations in the same order as simulate_payment_plan, so both give identical results
+        for month in range(total_months):
+            if required_balance[month] > investment_balance:
+                return None
+            investment_interest = investment_balance * self.annual_investment_rate if month > 0 else 0
+            net_cash_flow = net_monthly_income - payments[month] + investment_interest
+            investment_balance += net_cash_flow
+            investment_balances[month] = investment_balance
+            net_cash_flows[month] = net_cash_flow
+            if investment_balance >= remaining_principals[month] and highlight_row is None:
+                highlight_row = month
+
+        rows = slice(total_months - 1, None) if summary_only else slice(None)
+        payment_plan = Schedule.allocate(self.PAYMENT_PLAN_COLUMNS, 1 if summary_only else total_months, self.start_date)
+        net_worth_progression = Schedule.allocate(self.NET_WORTH_COLUMNS, 1 if summary_only else total_months, self.start_date)
+        payment_plan.month[:] = net_worth_progression.month[:] = loan.month[rows]
+
+        remaining_principal = loan['Mortgage Balance'][rows]
+        investment_balance = np.array(investment_balances[rows])
+        property_value = self.property_price * self.property_value_factor
+        payment_plan.values[:, :len(self.LOAN_COLUMNS)] = loan.values[rows]
+        payment_plan['Investments'][:] = investment_balance
+        payment_plan['Net Cash Flow'][:] = net_cash_flows[rows]
+        net_worth_progression['Net Worth'][:] = property_value - remaining_principal + investment_balance
+        net_worth_progression['Property Value'][:] = property_value
+        net_worth_progression['Investment Balance'][:] = investment_balance
+        net_worth_progression['Remaining Principal'][:] = remaining_principal
+        net_worth_progression['Debts'][:] = remaining_principal
+
+        return (payment_plan, amortization.total_interest_paid, amortization.total_insurance_costs, amortization.total_maintenance_costs,
+                amortization.total_early_repayment_fees, net_worth_progression, highlight_row)
+
+    def generate_payment_plan(self, monthly_salary, monthly_expenses, initial_savings, summary_only=False, cache=None):
+        """ Payment plan for the given cash flows; with summary_only=True the schedules only keep the final month.
+
+        Without a cache the plan is simulated in full. With a cache (e.g. AMORTIZATION_CACHE) the loan side is looked
+        up there and only the investment balance is simulated on top of it. Early repayments are capped by the
+        investment balance, so when that cap would change an early repayment the plan is simulated in full instead.
+        """
+        if cache is None:
+            return self.simulate_payment_plan(monthly_salary, monthly_expenses, initial_savings, summary_only)
+        key = self.loan_key()
+        amortization = cache.get(key)
+        if amortization is None:
+            with _stage('mortgage.amortize'):
+                amortization = self.amortize()
+            cache.put(key, amortization)
+
+        with _stage('mortgage.cash_flows'):
+            result = self.apply_cash_flows(amortization, monthly_salary, monthly_expenses, initial_savings, summary_only)
+        if result is None:
+            cache.fallbacks += 1
+            return self.simulate_payment_plan(monthly_salary, monthly_expenses, initial_savings, summary_only)
+        self.early_repayment_fees += amortization.total_early_repayment_fees
+        return result
+
+    def build_events(self, total_months, periodic=True, first_month=0):
+        """ EventSchedule of early repayments, calendar year ends and custom events; with periodic=True also the months maintenance fees and insurance are due.
+
+        With first_month > 0 only the window of months from first_month on is built.
+        """
+        return _loan_events(self, total_months, periodic, first_month=first_month)
+
+    def maintenance_costs(self, events):
+        """ Maintenance paid in every month of the events' window: the periodic fees at the current service charge plus one-off costs. """
+        rate_offsets, rates = events.table('maintenance_fees_rate')
+        cost_offsets, costs = events.table('maintenance')
+        # The fees of every month follow the last service charge change up to and including it, or before the window
+        rate_before = events.last_before('maintenance_fees_rate')
+        initial_fees = self.maintenance_fees if rate_before is None else self.property_size * rate_before
+        last_rate = np.asarray(rate_offsets[1:]) - 1
+        maintenance_fees = np.where(last_rate >= 0, self.property_size * np.asarray(rates + [0], dtype=float)[last_rate], initial_fees)
+        maintenance_costs = np.where(events.occurs('maintenance_due'), maintenance_fees, 0.0).tolist()
+        # One-off costs are added in the order they apply, only in the few months that have any
+        for month in np.flatnonzero(np.diff(cost_offsets)).tolist():
+            for event in range(cost_offsets[month], cost_offsets[month + 1]):
+                maintenance_costs[month] += costs[event]
+        return maintenance_costs
+
+    def simulate_payment_plan(self, monthly_salary, monthly_expenses, initial_savings, summary_only=False, required_balance=None, checkpoints=None, checkpoint_interval=12):
+        """ Simulate the loan month by month; with summary_only=True the schedules only keep the final month.
+
+        When a required_balance array is given, it records the investment balance each month's early repayments need.
+        When a checkpoints dict is given, it receives the PaymentPlanState at the start of every checkpoint_interval-th month.
+        """
+        total_months = self.total_years * 12
+
+        # Per-month results are written in place into preallocated columns
+        n_rows = 1 if summary_only else total_months
+        payment_plan = Schedule.allocate(self.PAYMENT_PLAN_COLUMNS, n_rows, self.start_date)
+        net_worth_progression = Schedule.allocate(self.NET_WORTH_COLUMNS, n_rows, self.start_date)
+        if summary_only:
+            payment_plan.month[0] = net_worth_progression.month[0] = total_months - 1
+
+        state = self.initial_state(initial_savings)
+        with _stage('mortgage.events'):
+            events = self.build_events(total_months)
+        with _stage('mortgage.simulate'):
+            state = self.simulate_months(state, monthly_salary, monthly_expenses, events, payment_plan, net_worth_progression,
+                                         summary_only, required_balance, checkpoints, checkpoint_interval)
+        return (payment_plan, state.total_interest_paid, state.total_insurance_costs, state.total_maintenance_costs, state.total_early_repayment_fees,
+                net_worth_progression, state.highlight_row)
+
+    def initial_state(self, initial_savings):
+        """ PaymentPlanState at the start of the loan: the savings left after the down payment and fees are invested. """
         total_months = self.total_years * 12
-        total_emi = self.calculate_payment(self.initial_rate, total_months, self.principal)
 
         # Initial invested value calculation
         down_payment = self.property_price - self.principal
         initial_fees = self.calculate_initial_costs(self.property_price)
         initial_invested_value = initial_savings - down_payment - initial_fees
 
-        investment_balance = initial_invested_value
-        net_worth_progression = []
-
-        # Prepare regular and arbitrary early repayment dates
-        next_regular_early_repayment_date = self.first_regular_early_repayment_date
-        regular_early_repayment_dates = []
-        arbitrary_early_repayment_dates = sorted(self.arbitrary_early_repayments, key=lambda x: x['date'])
-
-        # Calculate all regular early repayment dates
-        while next_regular_early_repayment_date <= self.get_payment_date(self.start_date, total_months - 1):
-            regular_early_repayment_dates.append(next_regular_early_repayment_date)
-            next_regular_early_repayment_date = self.get_payment_date(next_regular_early_repayment_date, self.regular_early_repayment_interval)
-
-        # Merge regular and arbitrary early repayment dates
-        all_early_repayment_dates = []
-        i, j = 0, 0
-        while i < len(regular_early_repayment_dates) and j < len(arbitrary_early_repayment_dates):
-            if regular_early_repayment_dates[i] <= datetime.strptime(arbitrary_early_repayment_dates[j]['date'], '%Y-%m-%d'):
-                all_early_repayment_dates.append({'date': regular_early_repayment_dates[i], 'amount': self.regular_early_repayment, 'type': 'regular'})
-                i += 1
-            else:
-                all_early_repayment_dates.append({'date': datetime.strptime(arbitrary_early_repayment_dates[j]['date'], '%Y-%m-%d'), 'amount': arbitrary_early_repayment_dates[j]['amount'], 'type': 'arbitrary'})
-                j += 1
-        while i < len(regular_early_repayment_dates):
-            all_early_repayment_dates.append({'date': regular_early_repayment_dates[i], 'amount': self.regular_early_repayment, 'type': 'regular'})
-            i += 1
-        while j < len(arbitrary_early_repayment_dates):
-            all_early_repayment_dates.append({'date': datetime.strptime(arbitrary_early_repayment_dates[j]['date'], '%Y-%m-%d'), 'amount': arbitrary_early_repayment_dates[j]['amount'], 'type': 'arbitrary'})
-            j += 1
+        # Calculate EMI for the initial period based on total loan duration
+        return PaymentPlanState(month=0, remaining_principal=self.principal, investment_balance=initial_invested_value, annual_early_repayments=0,
+                                total_interest_paid=0, total_insurance_costs=0, total_maintenance_costs=0, total_early_repayment_fees=0,
+                                total_emi=self.calculate_payment(self.initial_rate, total_months, self.principal), early_repayment_index=0,
+                                highlight_row=None, early_repayment_fees=self.early_repayment_fees)
 
-        early_repayment_index = 0
+    def simulate_months(self, state, monthly_salary, monthly_expenses, events, payment_plan, net_worth_progression, summary_only=False,
+                        required_balance=None, checkpoints=None, checkpoint_interval=12, end_month=None):
+        """ Simulate from state.month to end_month (the end of the loan by default), writing those months into the schedules, and return the final state.
 
-        for month in range(total_months):
-            payment_date = self.get_payment_date(self.start_date, month)
-            is_early_repayment_month = (early_repayment_index < len(all_early_repayment_dates) and payment_date >= all_early_repayment_dates[early_repayment_index]['date'])
+        events is the EventSchedule from build_events; every month only looks up its own entries. When events is a
+        window starting at first_month, the schedules hold the window's months from row 0.
+        """
+        (_, remaining_principal, investment_balance, annual_early_repayments, total_interest_paid, total_insurance_costs, total_maintenance_costs,
+         total_early_repayment_fees, total_emi, early_repayment_index, highlight_row, self.early_repayment_fees) = state
+        initial_months = self.initial_years * 12
+        total_months = self.total_years * 12
+        end_month = total_months if end_month is None else end_month
+        first = events.first_month
+        repayment_offsets, repayment_amounts = events.table('early_repayment')
+        insurance_due = events.occurs('insurance_due')
+        year_end = events.occurs('year_end')
+        maintenance_costs = self.maintenance_costs(events)
+        _count('months_simulated', end_month - state.month)
+        _count('early_repayments_applied', repayment_offsets[end_month - first] - repayment_offsets[state.month - first])
 
+        for month in range(state.month, end_month):
+            index = month - first
+            if checkpoints is not None and month % checkpoint_interval == 0:
+                checkpoints[month] = PaymentPlanState(month, remaining_principal, investment_balance, annual_early_repayments, total_interest_paid, total_insurance_costs,
+                                                      total_maintenance_costs, total_early_repayment_fees, total_emi, early_repayment_index, highlight_row, self.early_repayment_fees)
             if month < initial_months:
                 rate = self.initial_rate
             else:
@@ -197,14 +933,13 @@ class MortgageCalculator:
             early_repayment_fee = 0
 
             # Calculate total early repayment amount for the month
-            while is_early_repayment_month:
-                early_repayment_amt, early_repayment_fee, annual_early_repayments = self.calculate_early_repayment(all_early_repayment_dates[early_repayment_index]['amount'], remaining_principal, investment_balance, annual_early_repayments)
+            for early_repayment_index in range(repayment_offsets[index], repayment_offsets[index + 1]):
+                early_repayment_amt, early_repayment_fee, annual_early_repayments = self.calculate_early_repayment(repayment_amounts[early_repayment_index], remaining_principal, investment_balance, annual_early_repayments)
                 total_early_repayment_amt += early_repayment_amt
                 total_early_repayment_fees += early_repayment_fee
-                early_repayment_index += 1
-                if early_repayment_index >= len(all_early_repayment_dates):
-                    break
-                is_early_repayment_month = (early_repayment_index < len(all_early_repayment_dates) and payment_date >= all_early_repayment_dates[early_repayment_index]['date'])
+                if required_balance is not None:
+                    required_balance[month] = max(required_balance[month], early_repayment_amt + early_repayment_fee)
+            early_repayment_index = repayment_offsets[index + 1]
 
             # Apply the total early repayment amount once
             remaining_principal -= total_early_repayment_amt
@@ -222,7 +957,7 @@ class MortgageCalculator:
             total_interest_paid += interest_payment
 
             # Only pay insurance if the principal is not fully paid off
-            if remaining_principal > 0 and month % self.insurance_payment_interval == 0:
+            if remaining_principal > 0 and insurance_due[index]:
                 life_insurance_cost = remaining_principal * (self.life_insurance_rate / 12)
                 property_insurance_cost = self.property_price * (self.property_insurance_rate / 12)
             else:
@@ -231,7 +966,7 @@ class MortgageCalculator:
 
             insurance_cost = life_insurance_cost + property_insurance_cost
             total_insurance_costs += insurance_cost
-            maintenance_cost = self.maintenance_fees if month % self.maintenance_fees_interval == 0 else 0
+            maintenance_cost = maintenance_costs[index]
             total_maintenance_costs += maintenance_cost
             total_monthly_payment = principal_payment + interest_payment + total_early_repayment_amt + early_repayment_fee + insurance_cost + maintenance_cost
 
@@ -247,40 +982,33 @@ class MortgageCalculator:
             # Calculate net worth
             property_value = self.property_price * self.property_value_factor
             net_worth = property_value - remaining_principal + investment_balance
-            net_worth_progression.append({
-                'Date': payment_date.strftime('%Y-%m-%d'),
-                'Net Worth': net_worth,
-                'Property Value': property_value,
-                'Investment Balance': investment_balance,
-                'Remaining Principal': remaining_principal,
-                'Debts': remaining_principal
-            })
-
-            payment_plan.append({
-                'Date': payment_date.strftime('%Y-%m-%d'),
-                'Principal': principal_payment,
-                'Interest': interest_payment,
-                'Early Repayment': total_early_repayment_amt,
-                'ER Fee': early_repayment_fee,
-                'Insurance': insurance_cost,
-                'Maint': maintenance_cost,
-                'Payments Sum': total_monthly_payment,
-                'Mortgage Balance': remaining_principal,
-                'Investments': investment_balance,
-                'Net Cash Flow': net_cash_flow,
-            })
+            row = 0 if summary_only else index
+            net_worth_progression.values[row] = (net_worth, property_value, investment_balance, remaining_principal, remaining_principal)
+            payment_plan.values[row] = (principal_payment, interest_payment, total_early_repayment_amt, early_repayment_fee, insurance_cost, maintenance_cost,
+                                        total_monthly_payment, remaining_principal, investment_balance, net_cash_flow)
 
             # Highlight the first month where investment balance is enough to fully repay remaining principal
             if investment_balance >= remaining_principal and highlight_row is None:
                 highlight_row = month
 
             # Reset annual early repayments at the end of the year
-            if payment_date.month == 12:
+            if year_end[index]:
                 annual_early_repayments = 0
 
-        return payment_plan, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, net_worth_progression, highlight_row
+        return PaymentPlanState(end_month, remaining_principal, investment_balance, annual_early_repayments, total_interest_paid, total_insurance_costs,
+                                total_maintenance_costs, total_early_repayment_fees, total_emi, early_repayment_index, highlight_row, self.early_repayment_fees)
+
+    def print_payment_plan(self, payment_plan, total_interest_paid, highlight_row, total_insurance_costs=None, total_maintenance_costs=None, total_early_repayment_fees=None, monthly_salary=None, yearly=False):
+        """ Print the mortgage insights and the payment plan table; totals default to the sums of the plan columns, DTI needs monthly_salary.
 
-    def print_payment_plan(self, payment_plan, total_interest_paid, highlight_row):
+        With yearly=True the table shows one row per calendar year instead of one per month.
+        """
+        if total_insurance_costs is None:
+            total_insurance_costs = payment_plan['Insurance'].sum()
+        if total_maintenance_costs is None:
+            total_maintenance_costs = payment_plan['Maint'].sum()
+        if total_early_repayment_fees is None:
+            total_early_repayment_fees = payment_plan['ER Fee'].sum()
         total_cost_of_ownership, initial_fees, ltv = self.calculate_total_cost_of_ownership(self.property_price, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees)
         down_payment = self.property_price - self.principal
         total_initial_costs = initial_fees + down_payment
@@ -291,16 +1019,25 @@ class MortgageCalculator:
         print(f"Initial Fees (excluding down payment): AED {initial_fees:,.2f}")
         print(f"Total Initial Costs (including down payment): AED {total_initial_costs:,.2f}")
         print(f"Loan to Value (LTV): {ltv:.2f}%")
-        print(f"Debt to Income (DTI): {self.principal/(monthly_salary*12):,.2f}")
+        if monthly_salary:
+            print(f"Debt to Income (DTI): {self.principal/(monthly_salary*12):,.2f}")
         print(f"Total Cost of Ownership: AED {total_cost_of_ownership:,.2f}")
         print(f"Total interest paid: AED {total_interest_paid:,.2f}")
         print(f"Total early repayment fees paid: AED {self.early_repayment_fees:,.2f}")
 
-        df = pd.DataFrame(payment_plan)
+        print("\n------ Mortgage Payment Plan ------\n")
+        renderer = TableRenderer(payment_plan, highlight_row)
+        _display_table(renderer.yearly() if yearly else renderer)
+
+    @_timed('table.style')
+    def style_payment_plan(self, payment_plan, highlight_row=None):
+        """ Styler of the payment plan table, with the highlight row (a 0-based month, as TableRenderer takes it) in bold. """
+        import pandas as pd
+        df = payment_plan.to_dataframe()
         df.index += 1  # Set index to start at 1
 
         def highlight_rows(row):
-            return ['font-weight: bold; color: darkgreen'] * len(row) if row.name == highlight_row else [''] * len(row)
+            return ['font-weight: bold; color: darkgreen'] * len(row) if highlight_row is not None and row.name == highlight_row + 1 else [''] * len(row)
 
         styled_df = df.style.apply(highlight_rows, axis=1).set_table_styles([
             {'selector': 'thead th', 'props': [('font-size', '14pt'), ('border', '1px solid black'), ('font-weight', 'bold'), ('text-align', 'center'), ('vertical-align', 'middle')]},
@@ -309,20 +1046,17 @@ class MortgageCalculator:
         .set_properties(subset=['Date'], **{'white-space': 'nowrap'}) \
         .format("{:,.2f}", subset=pd.IndexSlice[:, df.columns.drop('Date')]) \
         .set_table_styles({'Date': [{'selector': 'td', 'props': [('text-align', 'center')]}]}, overwrite=False)
-        pd.set_option('display.max_columns', None)  # Show all columns
-        pd.set_option('display.width', 150)  # Set the display width
-        pd.set_option('display.float_format', '{:,.2f}'.format)  # Format float numbers
 
-        styled_df = styled_df.set_properties(**{'border': '1px solid black'}).set_table_styles(
+        return styled_df.set_properties(**{'border': '1px solid black'}).set_table_styles(
             [{'selector': 'thead th', 'props': [('font-weight', 'bold'), ('text-align', 'center'), ('border-bottom', '1px solid black')]},
             {'selector': 'tbody tr:nth-child(odd)', 'props': [('background-color', '#f2f2f2')]}]
         ).set_table_attributes('border="1" cellpadding="3" cellspacing="0" style="border-collapse: collapse"')
 
-        print("\n------ Mortgage Payment Plan ------\n")
-        display(styled_df)
-
+    @_timed('plot.payment_plan')
     def plot_payment_plan(self, payment_plan):
-        df = pd.DataFrame(payment_plan)
+        import matplotlib.pyplot as plt
+        import matplotlib.ticker as mticker
+        df = payment_plan.to_dataframe()
         plt.figure(figsize=(18, 10))
         bottom = np.zeros(len(df))
         
@@ -340,8 +1074,12 @@ class MortgageCalculator:
         plt.grid(True)
         plt.show()
 
+    @_timed('plot.net_worth_progression')
     def plot_net_worth_progression(self, net_worth_progression):
-        df = pd.DataFrame(net_worth_progression)
+        import matplotlib.pyplot as plt
+        import matplotlib.ticker as mticker
+        import seaborn as sns
+        df = net_worth_progression.to_dataframe()
         plt.figure(figsize=(18, 10))
         sns.lineplot(data=df, x='Date', y='Net Worth', label='Net Worth', linewidth=2)
         sns.lineplot(data=df, x='Date', y='Investment Balance', label='Investment Balance', linewidth=2)
@@ -389,8 +1127,127 @@ class MortgageCalculator:
         return total_cost, initial_fees, ltv
 
 
+class IncrementalPaymentPlan:
+    """ Payment plan that is re-simulated incrementally as its inputs are edited.
+
+    The simulation keeps a PaymentPlanState every checkpoint_interval months. update() finds the first month an edit
+    can affect and resumes from the last checkpoint before it, so an edit late in the loan only recomputes the last
+    few months. Results are identical to a full simulate_payment_plan run with the edited inputs.
+    """
+    # Inputs that only act through the early repayment dates and amounts, through the annual early repayment limit, or through maintenance costs
+    EARLY_REPAYMENT_PARAMETERS = ['regular_early_repayment', 'regular_early_repayment_interval', 'first_regular_early_repayment_date', 'arbitrary_early_repayments']
+    LIMIT_PARAMETERS = ['max_early_repayment_percent', 'allow_exceed_early_repayment_limit']
+    MAINTENANCE_PARAMETERS = ['events']
+    # Inputs update() sets on the existing calculator, and the dated event kinds they change
+    EVENT_KINDS = dict({name: ['early_repayment'] for name in EARLY_REPAYMENT_PARAMETERS}, events=list(MORTGAGE_EVENT_TYPES))
+    INCREMENTAL_PARAMETERS = ['later_rate'] + EARLY_REPAYMENT_PARAMETERS + LIMIT_PARAMETERS + MAINTENANCE_PARAMETERS
+    # How MortgageCalculator.__init__ converts them; the others are stored as given
+    CONVERSIONS = {'later_rate': lambda value: value / 100 / 12, 'max_early_repayment_percent': lambda value: value / 100,
+                   'first_regular_early_repayment_date': lambda value: datetime.strptime(value, '%Y-%m-%d'), 'events': _check_events}
+
+    def __init__(self, mortgage_params, monthly_salary, monthly_expenses, initial_savings, checkpoint_interval=12):
+        self.mortgage_params = dict(mortgage_params)
+        self.cash_flows = {'monthly_salary': monthly_salary, 'monthly_expenses': monthly_expenses, 'initial_savings': initial_savings}
+        self.checkpoint_interval = checkpoint_interval
+        self.calculator = MortgageCalculator(**self.mortgage_params)
+        self.simulate()
+
+    def simulate(self):
+        """ Full simulation from month 0, keeping checkpoints; returns the same tuple as generate_payment_plan. """
+        total_months = self.calculator.total_years * 12
+        self.checkpoints = {}
+        self.calculator.early_repayment_fees = 0
+        self.events = self.calculator.build_events(total_months)
+        self.dated_events = _loan_events(self.calculator, total_months, periodic=False, dated_only=True)
+        self.result = self.calculator.simulate_payment_plan(**self.cash_flows, checkpoints=self.checkpoints, checkpoint_interval=self.checkpoint_interval)
+        self.resimulated_months = total_months
+        return self.result
+
+    def apply(self, name, value):
+        """ Set one of the INCREMENTAL_PARAMETERS on the calculator, stored as MortgageCalculator.__init__ stores it. """
+        if name == 'arbitrary_early_repayments':
+            value = [rep for rep in value if _parse_date(rep['date']) >= self.calculator.start_date]
+        elif name in self.CONVERSIONS:
+            value = self.CONVERSIONS[name](value)
+        setattr(self.calculator, name, value)
+
+    def first_affected_month(self, changed, dated_events):
+        """ First month whose results can differ once the changed inputs are applied; dated_events holds their dated events. """
+        first_month = self.events.total_months
+        for name in changed:
+            if name == 'later_rate':
+                first_month = min(first_month, self.calculator.initial_years * 12)
+            elif name in self.LIMIT_PARAMETERS:
+                # A new limit can change every early repayment
+                months = [repayments[0][0] for repayments in (self.dated_events.entries('early_repayment'), dated_events.entries('early_repayment')) if repayments]
+                first_month = min([first_month] + months)
+            else:
+                # A new calendar changes the events of a kind from the first one that differs
+                for kind in self.EVENT_KINDS[name]:
+                    before, after = self.dated_events.entries(kind), dated_events.entries(kind)
+                    index = 0
+                    while index < min(len(before), len(after)) and before[index] == after[index]:
+                        index += 1
+                    first_month = min([first_month] + [entries[index][0] for entries in (before, after) if index < len(entries)])
+        return first_month
+
+    def update(self, **changes):
+        """ Apply edited mortgage inputs or cash flows and return the updated payment plan, as generate_payment_plan does.
+
+        Early repayment, limit, event and later_rate edits are applied to the existing calculator and event schedule;
+        the calculator is only rebuilt, and the plan simulated from month 0, when any other loan input changes.
+        """
+        current = {**self.mortgage_params, **self.cash_flows}
+        changed = [name for name, value in changes.items() if name not in current or value != current[name]]
+        if not changed:
+            return self.result
+        for name, value in changes.items():
+            (self.cash_flows if name in self.cash_flows else self.mortgage_params)[name] = value
+
+        if any(name not in self.INCREMENTAL_PARAMETERS for name in changed):
+            if any(name not in self.INCREMENTAL_PARAMETERS + list(self.cash_flows) for name in changed):
+                self.calculator = MortgageCalculator(**self.mortgage_params)
+            else:
+                for name in changed:
+                    if name in self.INCREMENTAL_PARAMETERS:
+                        self.apply(name, self.mortgage_params[name])
+            return self.simulate()
+
+        for name in changed:
+            self.apply(name, self.mortgage_params[name])
+        kinds = list(dict.fromkeys(kind for name in changed for kind in self.EVENT_KINDS.get(name, [])))
+        dated_events = _loan_events(self.calculator, self.events.total_months, periodic=False, dated_only=True) if kinds else self.dated_events
+        first_month = self.first_affected_month(changed, dated_events)
+        if first_month == 0:
+            return self.simulate()
+        # Only the changed kinds are patched, from the first affected month on; the periodic events are kept
+        self.events.replace(dated_events, kinds, first_month)
+        self.dated_events = dated_events
+        total_months = self.events.total_months
+        if first_month >= total_months:
+            self.resimulated_months = 0
+            return self.result
+
+        # Months before the checkpoint are kept; the later checkpoints are overwritten as the rest is re-simulated
+        checkpoint = first_month - first_month % self.checkpoint_interval
+        payment_plan, net_worth_progression = [Schedule.allocate(list(schedule.columns), len(schedule), schedule.start_date) for schedule in (self.result[0], self.result[5])]
+        payment_plan.values[:] = self.result[0].values
+        net_worth_progression.values[:] = self.result[5].values
+        with _stage('mortgage.simulate'):
+            state = self.calculator.simulate_months(self.checkpoints[checkpoint], self.cash_flows['monthly_salary'], self.cash_flows['monthly_expenses'], self.events,
+                                                    payment_plan, net_worth_progression, checkpoints=self.checkpoints, checkpoint_interval=self.checkpoint_interval)
+        self.result = (payment_plan, state.total_interest_paid, state.total_insurance_costs, state.total_maintenance_costs, state.total_early_repayment_fees,
+                       net_worth_progression, state.highlight_row)
+        self.resimulated_months = total_months - checkpoint
+        return self.result
+
+
+# Shared cache for callers that pass cache=AMORTIZATION_CACHE to generate_payment_plan
+AMORTIZATION_CACHE = AmortizationCache()
+
+
 class Rent_And_Invest_Calculator:
-    def __init__(self, initial_amount, annual_interest_rate=4.5, interest_payment_interval=1, annual_rent=100000, rent_cheques=2, years=25, monthly_salary=23456, monthly_expenses=12345, change_apartment_interval=3, move_in_costs=3000):
+    def __init__(self, initial_amount, annual_interest_rate=4.5, interest_payment_interval=1, annual_rent=100000, rent_cheques=2, years=25, monthly_salary=23456, monthly_expenses=12345, change_apartment_interval=3, move_in_costs=3000, start_date='2084-01-01'):
         self.initial_amount = initial_amount
         self.annual_interest_rate = annual_interest_rate / 100
         self.interest_payment_interval = interest_payment_interval
@@ -403,31 +1260,56 @@ class Rent_And_Invest_Calculator:
         self.change_apartment_interval = change_apartment_interval
         self.agency_fee_rate = 0.0525  # Agency fee is 5.25% of the annual rent
         self.move_in_costs = move_in_costs  # Move-in costs for each new apartment
+        self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
 
-    def get_payment_date(self, start_date, month):
+    @staticmethod
+    def get_payment_date(start_date, month):
         """ Calculate the payment date on the same day of the month, or the last day if necessary. """
         year = start_date.year + (start_date.month + month - 1) // 12
         month = (start_date.month + month - 1) % 12 + 1
         day = min(start_date.day, [31, 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1])
         return datetime(year, month, day)
 
-    def calculate_investment(self):
-        balance_progression = []
+    BALANCE_COLUMNS = ['Balance', 'Interest', 'Rent', 'EJARI Fee', 'Top Up', 'Move-in Costs']
+
+    def build_events(self, total_months, first_month=0):
+        """ EventSchedule of the months interest is paid, rent cheques fall due and the apartment changes; month 1 is the first month.
+
+        With first_month > 0 only the window of months first_month to total_months is built.
+        """
+        events = EventSchedule(self.start_date, total_months + 1, first_month)
+        events.add_every('interest_due', self.interest_payment_interval)
+        # Cheques fall due in months where month % (12 // rent_cheques) == 1, which never happens for monthly cheques
+        if 12 // self.rent_cheques > 1:
+            events.add_every('rent_due', 12 // self.rent_cheques, first_month=1)
+        events.add_every('apartment_change', self.change_apartment_interval * 12, first_month=1)
+        return events
+
+    @_timed('rent.simulate')
+    def calculate_investment(self, summary_only=False):
+        """ Simulate the rent & invest strategy month by month; with summary_only=True the schedule only keeps the final month. """
         balance = self.initial_amount
         monthly_interest_rate = (1 + self.annual_interest_rate) ** (1/12) - 1
         total_months = self.years * 12
         total_rental_costs = 0
         total_earned_interest = 0
 
+        # Per-month results are written in place into preallocated columns; dates are derived lazily from start_date
+        balance_progression = Schedule.allocate(self.BALANCE_COLUMNS, 1 if summary_only else total_months, self.start_date, first_month=1)
+        if summary_only:
+            balance_progression.month[0] = total_months
+
         # Calculate average monthly rent including agency fee
         average_monthly_rent = ((self.annual_rent + (self.annual_rent * self.agency_fee_rate) / self.change_apartment_interval) / 12)
 
-        for month in range(1, total_months + 1):
-            payment_date = self.get_payment_date(datetime.strptime(start_date, '%Y-%m-%d'), month)
+        events = self.build_events(total_months)
+        interest_due, rent_due, apartment_change = events.occurs('interest_due'), events.occurs('rent_due'), events.occurs('apartment_change')
+        _count('months_simulated', total_months)
 
+        for month in range(1, total_months + 1):
             # Apply interest
             interest = 0
-            if month % self.interest_payment_interval == 0:
+            if interest_due[month]:
                 interest = balance * monthly_interest_rate
                 balance += interest
                 total_earned_interest += interest
@@ -439,8 +1321,8 @@ class Rent_And_Invest_Calculator:
             # Apply rent payments and move-in costs if applicable
             rent_payment = 0
             move_in_costs = 0
-            if month % (12 // self.rent_cheques) == 1:
-                if month % (self.change_apartment_interval * 12) == 1:
+            if rent_due[month]:
+                if apartment_change[month]:
                     rent_payment = (self.annual_rent / self.rent_cheques) + (self.annual_rent * self.agency_fee_rate)
                     move_in_costs = self.move_in_costs
                 else:
@@ -453,20 +1335,32 @@ class Rent_And_Invest_Calculator:
             balance -= ejari_fee
             total_rental_costs += ejari_fee
 
-            balance_progression.append({
-                'Date': payment_date.strftime('%Y-%m-%d'),
-                'Balance': balance,
-                'Interest': interest,
-                'Rent': rent_payment,
-                'EJARI Fee': ejari_fee,
-                'Top Up': top_up_amount,
-                'Move-in Costs': move_in_costs
-            })
+            balance_progression.values[0 if summary_only else month - 1] = (balance, interest, rent_payment, ejari_fee, top_up_amount, move_in_costs)
 
         return balance_progression, balance, total_rental_costs, total_earned_interest
 
-    def print_balance_progression(self, balance_progression, final_balance, total_rental_costs, total_earned_interest):
-        df = pd.DataFrame(balance_progression)
+    def calculate_investment_fast(self, summary_only=False):
+        """ Same results as calculate_investment, computed by the array-based engine. """
+        balance_progression, final_balance, total_rental_costs, total_earned_interest = Rent_And_Invest_Batch_Calculator(
+            self.initial_amount, self.annual_interest_rate * 100, self.interest_payment_interval, self.annual_rent, self.rent_cheques, self.years,
+            self.monthly_salary, self.monthly_expenses, self.change_apartment_interval, self.move_in_costs, self.start_date.strftime('%Y-%m-%d')
+        ).calculate_investment(summary_only)
+        return balance_progression.scenario(0), final_balance[0], total_rental_costs[0], total_earned_interest[0]
+
+    def print_balance_progression(self, balance_progression, final_balance, total_rental_costs, total_earned_interest, yearly=False):
+        """ Print the balance progression table and totals; with yearly=True the table shows one row per calendar year. """
+        print("\n------ Rent & Invest Balance Progression ------\n")
+        renderer = TableRenderer(balance_progression)
+        _display_table(renderer.yearly() if yearly else renderer)
+        print(f"\nFinal Balance: AED {final_balance:,.2f}")
+        print(f"Total Rental Costs: AED {total_rental_costs:,.2f}")
+        print(f"Total Earned Interest: AED {total_earned_interest:,.2f}")
+
+    @_timed('table.style')
+    def style_balance_progression(self, balance_progression):
+        """ Styler of the balance progression table. """
+        import pandas as pd
+        df = balance_progression.to_dataframe()
         df.index += 1  # Set index to start at 1
         styled_df = df.style.set_table_styles([
             {'selector': 'thead th', 'props': [('font-size', '14pt'), ('border', '1px solid black'), ('font-weight', 'bold'), ('text-align', 'center'), ('vertical-align', 'middle')]},
@@ -475,23 +1369,18 @@ class Rent_And_Invest_Calculator:
           .set_properties(subset=['Date'], **{'white-space': 'nowrap'}) \
           .format("{:,.2f}", subset=pd.IndexSlice[:, df.columns.drop('Date')]) \
           .set_table_styles({'Date': [{'selector': 'td', 'props': [('text-align', 'center')]}]}, overwrite=False)
-        pd.set_option('display.max_columns', None)  # Show all columns
-        pd.set_option('display.width', 150)  # Set the display width
-        pd.set_option('display.float_format', '{:,.2f}'.format)  # Format float numbers
 
-        styled_df = styled_df.set_properties(**{'border': '1px solid black'}).set_table_styles(
+        return styled_df.set_properties(**{'border': '1px solid black'}).set_table_styles(
             [{'selector': 'thead th', 'props': [('font-weight', 'bold'), ('text-align', 'center'), ('border-bottom', '1px solid black')]},
              {'selector': 'tbody tr:nth-child(odd)', 'props': [('background-color', '#f2f2f2')]}]
         ).set_table_attributes('border="1" cellpadding="3" cellspacing="0" style="border-collapse: collapse"')
 
-        print("\n------ Rent & Invest Balance Progression ------\n")
-        display(styled_df)
-        print(f"\nFinal Balance: AED {final_balance:,.2f}")
-        print(f"Total Rental Costs: AED {total_rental_costs:,.2f}")
-        print(f"Total Earned Interest: AED {total_earned_interest:,.2f}")
-
+    @_timed('plot.balance_progression')
     def plot_balance_progression(self, balance_progression):
-        df = pd.DataFrame(balance_progression)
+        import matplotlib.pyplot as plt
+        import matplotlib.ticker as mticker
+        import seaborn as sns
+        df = balance_progression.to_dataframe()
         plt.figure(figsize=(18, 10))
         sns.lineplot(data=df, x='Date', y='Balance', label='Investment Balance', linewidth=2)
         plt.xlabel('Date')
@@ -504,53 +1393,2854 @@ class Rent_And_Invest_Calculator:
         plt.grid(True)
         plt.show()
 
-mortgage_calculator = MortgageCalculator(principal, initial_rate, initial_years, later_rate, total_years, property_price, property_size, maintenance_fees_rate, maintenance_fees_interval, life_insurance_rate, property_insurance_rate, insurance_payment_interval, annual_investment_rate, regular_early_repayment, regular_early_repayment_interval, property_value_factor, valuation_fee, conveyance_fee, bank_mortgage_opening_fee_rate, max_early_repayment_percent, start_date, first_regular_early_repayment_date, allow_exceed_early_repayment_limit, arbitrary_early_repayments)
-payment_plan, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, mortgage_net_worth_progression, highlight_row = mortgage_calculator.generate_payment_plan(monthly_salary, monthly_expenses, initial_savings)
-mortgage_calculator.print_payment_plan(payment_plan, total_interest_paid, highlight_row)
-mortgage_calculator.plot_payment_plan(payment_plan)
-mortgage_calculator.plot_net_worth_progression(mortgage_net_worth_progression)
-
-# Investment and rent comparison
-rent_invest_calculator = Rent_And_Invest_Calculator(initial_amount, annual_interest_rate=annual_investment_rate, annual_rent=annual_rent, rent_cheques=rent_cheques, years=years, monthly_salary=monthly_salary, monthly_expenses=monthly_expenses, change_apartment_interval=change_apartment_interval, move_in_costs=move_in_costs)
-balance_progression, final_balance, total_rental_costs, total_earned_interest = rent_invest_calculator.calculate_investment()
-rent_invest_calculator.print_balance_progression(balance_progression, final_balance, total_rental_costs, total_earned_interest)
-rent_invest_calculator.plot_balance_progression(balance_progression)
-
-# Compare net worth progression side-by-side
-mortgage_net_worth_df = pd.DataFrame(mortgage_net_worth_progression).rename(columns={'Net Worth': 'Net Worth (Mortgage)'})
-rent_invest_net_worth_df = pd.DataFrame(balance_progression).rename(columns={'Balance': 'Net Worth (Rent & Invest)'})
-
-comparison_df = pd.merge(mortgage_net_worth_df[['Date', 'Net Worth (Mortgage)']], rent_invest_net_worth_df[['Date', 'Net Worth (Rent & Invest)']], on='Date', how='outer')
-
-print("\n------ Comparison of Net Worth Progression ------\n")
-styled_comparison_df = comparison_df.style.set_table_styles([
-    {'selector': 'thead th', 'props': [('font-size', '14pt'), ('border', '1px solid black'), ('font-weight', 'bold'), ('text-align', 'center'), ('vertical-align', 'middle')]},
-    {'selector': 'tbody tr:nth-child(odd)', 'props': [('background-color', '#f2f2f2')]}
-]).set_properties(**{'border': '1px solid black', 'color': 'black', 'background-color': 'white'}) \
-  .set_properties(subset=['Date'], **{'white-space': 'nowrap'}) \
-  .format("{:,.2f}", subset=pd.IndexSlice[:, comparison_df.columns.drop('Date')]) \
-  .set_table_styles({'Date': [{'selector': 'td', 'props': [('text-align', 'center')]}]}, overwrite=False)
-pd.set_option('display.max_columns', None)  # Show all columns
-pd.set_option('display.width', 150)  # Set the display width
-pd.set_option('display.float_format', '{:,.2f}'.format)  # Format float numbers
-
-styled_comparison_df = styled_comparison_df.set_properties(**{'border': '1px solid black'}).set_table_styles(
-    [{'selector': 'thead th', 'props': [('font-weight', 'bold'), ('text-align', 'center'), ('border-bottom', '1px solid black')]},
-     {'selector': 'tbody tr:nth-child(odd)', 'props': [('background-color', '#f2f2f2')]}]
-).set_table_attributes('border="1" cellpadding="3" cellspacing="0" style="border-collapse: collapse"')
-
-display(styled_comparison_df)
-
-# Plot net worth comparison
-plt.figure(figsize=(18, 10))
-sns.lineplot(data=comparison_df, x='Date', y='Net Worth (Mortgage)', label='Net Worth (Mortgage)', linewidth=2)
-sns.lineplot(data=comparison_df, x='Date', y='Net Worth (Rent & Invest)', label='Net Worth (Rent & Invest)', linewidth=2)
-plt.xlabel('Date')
-plt.ylabel('Amount (AED)')
-plt.title('Net Worth Comparison')
-plt.legend(title='Components', loc='upper left')
-plt.xticks(np.arange(0, len(comparison_df['Date']) + 1, step=12), rotation=90)  # Add steps between months and rotate labels
-plt.ticklabel_format(style='plain', axis='y')  # Show full values
-plt.gca().yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f'{x:,.2f}'))
-plt.grid(True)
-plt.show()
+
+def _broadcast_scenarios(*values):
+    """ Broadcast scalars and per-scenario 1-D arrays to (n_scenarios,); 2-D per-month paths become (n_scenarios, months). """
+    values = [np.atleast_1d(np.asarray(value)) for value in values]
+    n_scenarios = np.broadcast_shapes(*[value.shape[:1] for value in values])[0]
+    return [np.broadcast_to(value, (n_scenarios,) + value.shape[1:]) for value in values]
+
+
+def _at_month(values, month):
+    """ Value of every scenario in the given month, for inputs that may be constant or per-month paths. """
+    return values[:, month] if values.ndim == 2 else values
+
+
+class MortgageBatchCalculator:
+    """ Vectorized counterpart of MortgageCalculator that advances many scenarios one month at a time.
+
+    Every numeric argument accepts a scalar or a 1-D array with one value per scenario; arrays are broadcast
+    against each other. later_rate, annual_investment_rate and property_value_factor may also be 2-D arrays of
+    shape (n_scenarios, months) giving a separate value for every month, e.g. sampled rate paths. The early repayment calendar (start_date, first_regular_early_repayment_date,
+    regular_early_repayment_interval and arbitrary_early_repayments) is shared by all scenarios, while the
+    regular early repayment amount may differ per scenario.
+    """
+    def __init__(self, principal, initial_rate, initial_years, later_rate, total_years, property_price, property_size, maintenance_fees_rate, maintenance_fees_interval, life_insurance_rate=0.216, property_insurance_rate=0.12, insurance_payment_interval=1, annual_investment_rate=4.5, regular_early_repayment=0, regular_early_repayment_interval=0, property_value_factor=1.0, valuation_fee=1750, conveyance_fee=5250, bank_mortgage_opening_fee_rate=1, max_early_repayment_percent=10, start_date='2084-01-01', first_regular_early_repayment_date='2085-01-01', allow_exceed_early_repayment_limit=False, arbitrary_early_repayments=[], events=[]):
+        (principal, initial_rate, initial_years, later_rate, total_years, property_price, property_size, maintenance_fees_rate,
+         maintenance_fees_interval, life_insurance_rate, property_insurance_rate, insurance_payment_interval, annual_investment_rate,
+         regular_early_repayment, property_value_factor, valuation_fee, conveyance_fee, bank_mortgage_opening_fee_rate,
+         max_early_repayment_percent, allow_exceed_early_repayment_limit) = _broadcast_scenarios(
+            principal, initial_rate, initial_years, later_rate, total_years, property_price, property_size, maintenance_fees_rate,
+            maintenance_fees_interval, life_insurance_rate, property_insurance_rate, insurance_payment_interval, annual_investment_rate,
+            regular_early_repayment, property_value_factor, valuation_fee, conveyance_fee, bank_mortgage_opening_fee_rate,
+            max_early_repayment_percent, allow_exceed_early_repayment_limit)
+        self.n_scenarios = len(principal)
+        self.principal = principal.astype(float)
+        self.initial_rate = initial_rate / 100 / 12  # Convert annual rate to monthly
+        self.initial_years = initial_years.astype(int)
+        self.later_rate = later_rate / 100 / 12  # Convert annual rate to monthly
+        self.total_years = total_years.astype(int)
+        self.property_price = property_price.astype(float)
+        self.maintenance_fees_interval = maintenance_fees_interval.astype(int)
+        self.regular_early_repayment = regular_early_repayment.astype(float)
+        self.regular_early_repayment_interval = regular_early_repayment_interval
+        self.total_months = self.total_years * 12
+        self.life_insurance_rate = life_insurance_rate / 100  # Convert annual rate to fraction
+        self.property_insurance_rate = property_insurance_rate / 100  # Convert annual rate to fraction
+        self.insurance_payment_interval = insurance_payment_interval.astype(int)
+        self.annual_investment_rate = annual_investment_rate / 100 / 12  # Monthly investment rate
+        self.valuation_fee = valuation_fee.astype(float)
+        self.conveyance_fee = conveyance_fee.astype(float)
+        self.bank_mortgage_opening_fee_rate = bank_mortgage_opening_fee_rate / 100  # Convert to fraction
+        self.property_value_factor = property_value_factor.astype(float)
+        self.maintenance_fees = property_size * maintenance_fees_rate  # Total maintenance fees per year
+        self.max_early_repayment_percent = max_early_repayment_percent / 100  # Convert to fraction
+        self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
+        self.first_regular_early_repayment_date = datetime.strptime(first_regular_early_repayment_date, '%Y-%m-%d')
+        self.allow_exceed_early_repayment_limit = allow_exceed_early_repayment_limit.astype(bool)
+        self.arbitrary_early_repayments = [rep for rep in arbitrary_early_repayments if _parse_date(rep['date']) >= self.start_date]
+        self.property_size = property_size
+        self.events = _check_events(events)
+
+    get_payment_date = staticmethod(MortgageCalculator.get_payment_date)
+
+    def select(self, members):
+        """ Calculator of only the given scenarios; shared parameters and the calendar are kept as they are. """
+        selected = copy.copy(self)
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray) and value.ndim and len(value) == self.n_scenarios:
+                setattr(selected, name, value[members])
+        selected.n_scenarios = len(selected.principal)
+        return selected
+
+    def build_events(self, total_months, periodic=False):
+        """ Shared early repayment calendar and custom events; maintenance and insurance intervals may differ per scenario. """
+        return _loan_events(self, total_months, periodic)
+
+    def calculate_payment(self, rate, n_months, principal):
+        """ Vectorized annuity payment; scenarios without outstanding principal pay nothing. """
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            growth = (1 + rate)**n_months
+            payment = principal * (rate * growth) / (growth - 1)
+        return np.where(principal <= 0, 0.0, payment)
+
+    def calculate_initial_costs(self, property_price):
+        dld_fee = 0.04 * property_price + 580  # DLD fee
+        property_registration_fee = np.where(property_price > 500000, 4000 * 1.05, 2000 * 1.05)  # Registration fee + 5% VAT
+        mortgage_registration_fee = 0.0025 * self.principal + 290  # Mortgage registration fee
+        brokerage_fee = 0.021 * property_price  # Brokerage fee
+        bank_mortgage_opening_fee = self.bank_mortgage_opening_fee_rate * self.principal  # Bank mortgage opening fee
+
+        initial_fees = (
+            dld_fee
+            + property_registration_fee
+            + mortgage_registration_fee
+            + brokerage_fee
+            + self.conveyance_fee
+            + self.valuation_fee
+            + bank_mortgage_opening_fee
+        )
+
+        return initial_fees
+
+    def calculate_early_repayment(self, early_repayment_amt, remaining_principal, investment_balance, annual_early_repayments):
+        """ Vectorized calculate_early_repayment: returns the applicable repayment, fee and updated annual counter per scenario. """
+        max_allowed_annual_repayment = self.principal * self.max_early_repayment_percent
+        remaining_annual_repayment_limit = max_allowed_annual_repayment - annual_early_repayments
+
+        exceeds_limit = early_repayment_amt > remaining_annual_repayment_limit
+        pays_fee = exceeds_limit & self.allow_exceed_early_repayment_limit
+        early_repayment_fee = np.where(pays_fee, np.minimum(0.01 * remaining_principal, 10000), 0.0)
+        early_repayment_amt = np.where(pays_fee & (early_repayment_amt + early_repayment_fee > investment_balance), investment_balance - early_repayment_fee, early_repayment_amt)
+        early_repayment_amt = np.where(exceeds_limit & ~self.allow_exceed_early_repayment_limit, remaining_annual_repayment_limit, early_repayment_amt)
+        early_repayment_amt = np.where(early_repayment_amt > remaining_principal, remaining_principal, early_repayment_amt)
+        actual_repayment_amt = np.where(early_repayment_amt > investment_balance, investment_balance, early_repayment_amt)
+
+        return actual_repayment_amt, early_repayment_fee, annual_early_repayments + actual_repayment_amt
+
+    @_timed('batch.mortgage')
+    def generate_payment_plan(self, monthly_salary, monthly_expenses, initial_savings, summary_only=False, columns=None, prune=None, prune_interval=12):
+        """ Run every scenario side by side.
+
+        Returns the same tuple as MortgageCalculator.generate_payment_plan, except that payment_plan and
+        net_worth_progression are batch Schedules with columns of shape (n_scenarios, months). Months past a
+        scenario's own total_years are NaN, totals are arrays and highlight_row is -1 where the investment balance
+        never covers the remaining principal. With summary_only=True the schedules only keep each scenario's
+        final month; columns optionally restricts the recorded columns to the given names.
+
+        prune is called as prune(month, scenarios, investment_balance, remaining_principal) every prune_interval
+        months with the indexes and state of the scenarios still simulated after that many months, and returns a
+        boolean mask of the ones to stop simulating. Their later months are NaN and their totals stop there.
+        """
+        monthly_salary, monthly_expenses, initial_savings = np.broadcast_arrays(*[np.atleast_1d(np.asarray(value, dtype=float)) for value in (monthly_salary, monthly_expenses, initial_savings)])
+        if len(monthly_salary) not in (1, self.n_scenarios):
+            raise ValueError(f"Expected {self.n_scenarios} values for salary/expenses/savings, got {len(monthly_salary)}")
+        net_monthly_income = monthly_salary - monthly_expenses
+
+        n = self.n_scenarios
+        remaining_principal = self.principal.copy()
+        total_interest_paid = np.zeros(n)
+        total_insurance_costs = np.zeros(n)
+        total_maintenance_costs = np.zeros(n)
+        annual_early_repayments = np.zeros(n)
+        total_early_repayment_fees = np.zeros(n)
+        highlight_row = np.full(n, -1)
+
+        # Calculate EMI for the initial period based on total loan duration
+        initial_months = self.initial_years * 12
+        total_months = int(self.total_months.max())
+        total_emi = self.calculate_payment(self.initial_rate, self.total_months, self.principal)
+
+        # Initial invested value calculation
+        down_payment = self.property_price - self.principal
+        initial_fees = self.calculate_initial_costs(self.property_price)
+        investment_balance = initial_savings - down_payment - initial_fees
+        investment_balance = np.broadcast_to(investment_balance, (n,)).copy()
+
+        for path in (self.later_rate, self.annual_investment_rate, self.property_value_factor):
+            if path.ndim == 2 and path.shape[1] < total_months:
+                raise ValueError(f"Per-month paths cover {path.shape[1]} months, {total_months} needed")
+
+        events = self.build_events(total_months)
+        repayment_offsets, repayment_amounts = events.table('early_repayment')
+        rate_offsets, rates = events.table('maintenance_fees_rate')
+        cost_offsets, costs = events.table('maintenance')
+        year_end = events.occurs('year_end')
+        maintenance_fees = self.maintenance_fees
+
+        # Columns are filled month by month as contiguous rows and transposed once at the end
+        plan_columns = [column for column in MortgageCalculator.PAYMENT_PLAN_COLUMNS if columns is None or column in columns]
+        net_worth_columns = [column for column in MortgageCalculator.NET_WORTH_COLUMNS if columns is None or column in columns]
+        recorded_columns = plan_columns + [column for column in net_worth_columns if column != 'Debts']  # 'Debts' is an alias of 'Remaining Principal'
+        if 'Debts' in net_worth_columns and 'Remaining Principal' not in recorded_columns:
+            recorded_columns.append('Remaining Principal')
+        history = {column: np.full((1 if summary_only else total_months, n), np.nan) for column in recorded_columns}
+        final_month = self.total_months - 1
+
+        # Pruned scenarios are dropped from every per-scenario array, so the remaining months only simulate the rest
+        calculator = self
+        scenarios = None  # Indexes of the scenarios still simulated, once some are pruned
+        totals = [total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, highlight_row]
+        scenario_months = 0
+
+        for month in range(total_months):
+            if prune is not None and month > 0 and month % prune_interval == 0:
+                drop = np.asarray(prune(month, np.arange(n) if scenarios is None else scenarios, investment_balance, remaining_principal), dtype=bool)
+                if drop.any():
+                    for full, values in zip(totals, (total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, highlight_row)):
+                        full[scenarios[drop] if scenarios is not None else drop] = values[drop]
+                    keep = ~drop
+                    scenarios = (np.arange(n) if scenarios is None else scenarios)[keep]
+                    calculator = calculator.select(keep)
+                    (remaining_principal, total_interest_paid, total_insurance_costs, total_maintenance_costs, annual_early_repayments, total_early_repayment_fees,
+                     highlight_row, initial_months, total_emi, investment_balance, final_month) = [values[keep] for values in (
+                        remaining_principal, total_interest_paid, total_insurance_costs, total_maintenance_costs, annual_early_repayments, total_early_repayment_fees,
+                        highlight_row, initial_months, total_emi, investment_balance, final_month)]
+                    if len(net_monthly_income) > 1:
+                        net_monthly_income = net_monthly_income[keep]
+                    if np.ndim(maintenance_fees):
+                        maintenance_fees = maintenance_fees[keep]
+                    if not len(scenarios):
+                        break
+            scenario_months += calculator.n_scenarios
+
+            active = month < calculator.total_months  # Scenarios with shorter loans are frozen once they end
+            all_active = active.all()
+
+            # Variable rate scenarios recalculate EMI from the remaining principal and remaining loan duration
+            is_later_period = month >= initial_months
+            later_rate = _at_month(calculator.later_rate, month)
+            rate = np.where(is_later_period, later_rate, calculator.initial_rate)
+            if is_later_period.any():
+                total_emi = np.where(is_later_period, calculator.calculate_payment(later_rate, calculator.total_months - month, remaining_principal), total_emi)
+
+            interest_payment = remaining_principal * rate
+            principal_payment = total_emi - interest_payment
+            total_early_repayment_amt = np.zeros(calculator.n_scenarios)
+            early_repayment_fee = np.zeros(calculator.n_scenarios)
+
+            # Apply every early repayment due this month in calendar order; the cap sees the updated annual counter
+            for event in range(repayment_offsets[month], repayment_offsets[month + 1]):
+                amount = repayment_amounts[event]
+                if scenarios is not None and np.ndim(amount):
+                    amount = amount[scenarios]
+                early_repayment_amt, fee, updated_annual_early_repayments = calculator.calculate_early_repayment(amount, remaining_principal, investment_balance, annual_early_repayments)
+                if not all_active:
+                    early_repayment_amt = np.where(active, early_repayment_amt, 0.0)
+                    fee = np.where(active, fee, 0.0)
+                    updated_annual_early_repayments = np.where(active, updated_annual_early_repayments, annual_early_repayments)
+                annual_early_repayments = updated_annual_early_repayments
+                total_early_repayment_amt += early_repayment_amt
+                total_early_repayment_fees += fee
+                early_repayment_fee = fee  # Like the scalar path, only the last event's fee enters this month's payment
+
+            # Apply the total early repayment amount once
+            remaining_principal = remaining_principal - total_early_repayment_amt
+
+            # Ensure the principal payment does not go negative
+            principal_payment = np.where(remaining_principal == 0, 0.0, principal_payment)
+
+            # Ensure the final payment does not go negative
+            is_final_payment = remaining_principal - principal_payment < 0
+            principal_payment = np.where(is_final_payment, remaining_principal, principal_payment)
+            total_emi = np.where(is_final_payment, principal_payment + interest_payment, total_emi)
+
+            # Only pay insurance if the principal is not fully paid off
+            new_remaining_principal = remaining_principal - principal_payment
+            is_insured = (new_remaining_principal > 0) & (month % calculator.insurance_payment_interval == 0)
+            life_insurance_cost = np.where(is_insured, new_remaining_principal * (calculator.life_insurance_rate / 12), 0.0)
+            property_insurance_cost = np.where(is_insured, calculator.property_price * (calculator.property_insurance_rate / 12), 0.0)
+            insurance_cost = life_insurance_cost + property_insurance_cost
+            for event in range(rate_offsets[month], rate_offsets[month + 1]):
+                maintenance_fees = calculator.property_size * rates[event]
+            maintenance_cost = np.where(month % calculator.maintenance_fees_interval == 0, maintenance_fees, 0.0)
+            for event in range(cost_offsets[month], cost_offsets[month + 1]):
+                maintenance_cost = maintenance_cost + costs[event]
+            total_monthly_payment = principal_payment + interest_payment + total_early_repayment_amt + early_repayment_fee + insurance_cost + maintenance_cost
+
+            # Calculate net cash flow and update investment balance
+            if month > 0:  # Apply investment interest from the second month
+                investment_interest = investment_balance * _at_month(calculator.annual_investment_rate, month)
+            else:
+                investment_interest = 0
+            net_cash_flow = net_monthly_income - total_monthly_payment + investment_interest
+            new_investment_balance = investment_balance + net_cash_flow
+
+            if all_active:
+                remaining_principal = new_remaining_principal
+                investment_balance = new_investment_balance
+                total_interest_paid += interest_payment
+                total_insurance_costs += insurance_cost
+                total_maintenance_costs += maintenance_cost
+            else:
+                remaining_principal = np.where(active, new_remaining_principal, remaining_principal)
+                investment_balance = np.where(active, new_investment_balance, investment_balance)
+                total_interest_paid += np.where(active, interest_payment, 0.0)
+                total_insurance_costs += np.where(active, insurance_cost, 0.0)
+                total_maintenance_costs += np.where(active, maintenance_cost, 0.0)
+
+            property_value = calculator.property_price * _at_month(calculator.property_value_factor, month)
+            net_worth = property_value - remaining_principal + investment_balance
+            for column, values in (('Principal', principal_payment), ('Interest', interest_payment), ('Early Repayment', total_early_repayment_amt),
+                                   ('ER Fee', early_repayment_fee), ('Insurance', insurance_cost), ('Maint', maintenance_cost),
+                                   ('Payments Sum', total_monthly_payment), ('Mortgage Balance', remaining_principal), ('Investments', investment_balance),
+                                   ('Net Cash Flow', net_cash_flow), ('Net Worth', net_worth), ('Property Value', property_value),
+                                   ('Investment Balance', investment_balance), ('Remaining Principal', remaining_principal)):
+                if column not in history:
+                    continue
+                rows = slice(None) if scenarios is None else scenarios
+                if summary_only:
+                    history[column][0, rows] = np.where(month == final_month, values, history[column][0, rows])
+                else:
+                    history[column][month, rows] = values if all_active else np.where(active, values, np.nan)
+
+            # Highlight the first month where investment balance is enough to fully repay remaining principal
+            highlight_row = np.where((highlight_row < 0) & active & (investment_balance >= remaining_principal), month, highlight_row)
+
+            # Reset annual early repayments at the end of the year
+            if year_end[month]:
+                annual_early_repayments = np.zeros(calculator.n_scenarios)
+
+        if scenarios is not None:
+            for full, values in zip(totals, (total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, highlight_row)):
+                full[scenarios] = values
+            total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, highlight_row = totals
+
+        recorded = {column: np.ascontiguousarray(values.T) for column, values in history.items()}
+        if 'Remaining Principal' in recorded:
+            recorded['Debts'] = recorded['Remaining Principal']
+        month_index = (self.total_months - 1)[:, None] if summary_only else np.arange(total_months)
+        payment_plan = Schedule({column: recorded[column] for column in plan_columns}, month_index, self.start_date)
+        net_worth_progression = Schedule({column: recorded[column] for column in net_worth_columns}, month_index, self.start_date)
+        _count('months_simulated', scenario_months)
+        _count('bytes_allocated', sum(values.nbytes for values in recorded.values()))
+
+        return payment_plan, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, net_worth_progression, highlight_row
+
+
+class Rent_And_Invest_Batch_Calculator:
+    """ Array-based counterpart of Rent_And_Invest_Calculator.
+
+    Every cash flow of the rent & invest strategy follows a fixed period, so the whole horizon is built as one
+    cash-flow matrix and compounding is applied as a discounted cumulative sum instead of a month-by-month loop.
+    Every argument accepts a scalar or a 1-D array with one value per scenario; annual_interest_rate may also be
+    a 2-D array of shape (n_scenarios, months) with a separate annual rate for every month.
+    """
+    def __init__(self, initial_amount, annual_interest_rate=4.5, interest_payment_interval=1, annual_rent=100000, rent_cheques=2, years=25, monthly_salary=23456, monthly_expenses=12345, change_apartment_interval=3, move_in_costs=3000, start_date='2084-01-01'):
+        (initial_amount, annual_interest_rate, interest_payment_interval, annual_rent, rent_cheques, years, monthly_salary,
+         monthly_expenses, change_apartment_interval, move_in_costs) = _broadcast_scenarios(
+            initial_amount, annual_interest_rate, interest_payment_interval, annual_rent, rent_cheques, years, monthly_salary,
+            monthly_expenses, change_apartment_interval, move_in_costs)
+        self.n_scenarios = len(initial_amount)
+        self.initial_amount = initial_amount.astype(float)
+        self.annual_interest_rate = annual_interest_rate / 100
+        self.interest_payment_interval = interest_payment_interval.astype(int)
+        self.annual_rent = annual_rent.astype(float)
+        self.rent_cheques = rent_cheques.astype(int)
+        self.ejari_fee_rate = 0.05  # EJARI fee is 5% of the rental contract
+        self.years = years.astype(int)
+        self.monthly_salary = monthly_salary.astype(float)
+        self.monthly_expenses = monthly_expenses.astype(float)
+        self.change_apartment_interval = change_apartment_interval.astype(int)
+        self.agency_fee_rate = 0.0525  # Agency fee is 5.25% of the annual rent
+        self.move_in_costs = move_in_costs.astype(float)  # Move-in costs for each new apartment
+        self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
+
+    get_payment_date = staticmethod(Rent_And_Invest_Calculator.get_payment_date)
+
+    def build_cash_flows(self, total_months):
+        """ Build the (n_scenarios, total_months) matrices of every periodic cash flow in one pass. """
+        months = np.arange(1, total_months + 1)
+        in_horizon = months <= (self.years * 12)[:, None]
+
+        # Rent cheques are due every 12 // rent_cheques months, agency fee and move-in costs on every apartment change
+        with np.errstate(divide='ignore', invalid='ignore'):
+            is_rent_month = (months % (12 // self.rent_cheques)[:, None] == 1) & in_horizon
+            is_move_month = is_rent_month & (months % (self.change_apartment_interval * 12)[:, None] == 1)
+        rent_payment = np.where(is_rent_month, (self.annual_rent / self.rent_cheques)[:, None], 0.0)
+        rent_payment = rent_payment + np.where(is_move_month, (self.annual_rent * self.agency_fee_rate)[:, None], 0.0)
+        move_in_costs = np.where(is_move_month, self.move_in_costs[:, None], 0.0)
+
+        ejari_fee = np.where(in_horizon, ((self.annual_rent * self.ejari_fee_rate) / 12)[:, None], 0.0)
+        top_up_amount = np.where(in_horizon, (self.monthly_salary - self.monthly_expenses)[:, None], 0.0)
+        is_interest_month = (months % self.interest_payment_interval[:, None] == 0) & in_horizon
+
+        return rent_payment, move_in_costs, ejari_fee, top_up_amount, is_interest_month
+
+    @_timed('batch.rent')
+    def calculate_investment(self, summary_only=False):
+        """ Vectorized calculate_investment for every scenario at once.
+
+        Returns the same tuple as Rent_And_Invest_Calculator.calculate_investment, except that balance_progression
+        is a batch Schedule with columns of shape (n_scenarios, months) and the totals are arrays. Months past a
+        scenario's own horizon repeat its final balance with zero cash flows. With summary_only=True the schedule
+        only keeps each scenario's final month.
+        """
+        total_months = int(self.years.max()) * 12
+        rent_payment, move_in_costs, ejari_fee, top_up_amount, is_interest_month = self.build_cash_flows(total_months)
+        monthly_interest_rate = (1 + self.annual_interest_rate) ** (1/12) - 1
+        if monthly_interest_rate.ndim == 1:
+            monthly_interest_rate = monthly_interest_rate[:, None]
+        elif monthly_interest_rate.shape[1] < total_months:
+            raise ValueError(f"annual_interest_rate paths cover {monthly_interest_rate.shape[1]} months, {total_months} needed")
+        else:
+            monthly_interest_rate = monthly_interest_rate[:, :total_months]
+
+        # balance[m] = growth[m] * balance[m-1] + cash_flow[m] is solved as a discounted cumulative sum
+        growth = np.where(is_interest_month, 1 + monthly_interest_rate, 1.0)
+        cumulative_growth = np.cumprod(growth, axis=1)
+        cash_flow = top_up_amount - (rent_payment + move_in_costs) - ejari_fee
+        balance = cumulative_growth * (self.initial_amount[:, None] + np.cumsum(cash_flow / cumulative_growth, axis=1))
+
+        previous_balance = np.concatenate([self.initial_amount[:, None], balance[:, :-1]], axis=1)
+        interest = (growth - 1) * previous_balance
+
+        final_month = self.years * 12 - 1
+        scenarios = np.arange(self.n_scenarios)
+        final_balance = balance[scenarios, final_month]
+        total_rental_costs = (rent_payment + move_in_costs + ejari_fee).sum(axis=1)
+        total_earned_interest = interest.sum(axis=1)
+
+        columns = dict(zip(Rent_And_Invest_Calculator.BALANCE_COLUMNS, (balance, interest, rent_payment, ejari_fee, top_up_amount, move_in_costs)))
+        if summary_only:
+            columns = {column: values[scenarios, final_month][:, None] for column, values in columns.items()}
+            balance_progression = Schedule(columns, (final_month + 1)[:, None], self.start_date)
+        else:
+            balance_progression = Schedule(columns, np.arange(1, total_months + 1), self.start_date)
+        _count('months_simulated', self.n_scenarios * total_months)
+        _count('bytes_allocated', balance_progression.nbytes)
+
+        return balance_progression, final_balance, total_rental_costs, total_earned_interest
+
+
+class StreamingHistogram:
+    """ Fixed-bin histogram of every month's values, summarising any number of paths in constant memory.
+
+    Values outside [low, high) land in two open-ended tail bins; exact minimum, maximum and mean are tracked
+    alongside, so percentiles stay bounded by the observed range.
+    """
+    def __init__(self, low, high, bins=2048):
+        self.low = np.asarray(low, dtype=float)
+        self.bins = bins
+        self.width = np.where(high > low, (high - self.low) / bins, 1.0)
+        months = len(self.low)
+        self.counts = np.zeros((months, bins + 2), dtype=np.int64)
+        self.minimum = np.full(months, np.inf)
+        self.maximum = np.full(months, -np.inf)
+        self.total = np.zeros(months)
+        self.n_paths = 0
+
+    def add(self, values):
+        """ Add a block of paths of shape (n_paths, months). """
+        months = len(self.low)
+        index = np.clip(np.floor((values - self.low) / self.width), -1, self.bins).astype(np.int64) + 1
+        index += np.arange(months) * (self.bins + 2)
+        self.counts += np.bincount(index.ravel(), minlength=self.counts.size).reshape(self.counts.shape)
+        self.minimum = np.minimum(self.minimum, values.min(axis=0))
+        self.maximum = np.maximum(self.maximum, values.max(axis=0))
+        self.total += values.sum(axis=0)
+        self.n_paths += len(values)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.total += other.total
+        self.n_paths += other.n_paths
+
+    @property
+    def mean(self):
+        return self.total / self.n_paths
+
+    def percentile(self, q):
+        """ Approximate q-th percentile of every month, interpolated linearly inside the matching bin. """
+        target = q / 100 * self.n_paths
+        cumulative = np.cumsum(self.counts, axis=1)
+        bin_index = np.minimum((cumulative < target).sum(axis=1), self.bins + 1)
+        months = np.arange(len(self.low))
+        count = self.counts[months, bin_index]
+        below = cumulative[months, bin_index] - count
+        fraction = np.where(count > 0, (target - below) / np.maximum(count, 1), 0.0)
+        value = self.low + (bin_index - 1 + fraction) * self.width
+        value = np.where(bin_index == 0, self.minimum, np.where(bin_index == self.bins + 1, self.maximum, value))
+        return np.clip(value, self.minimum, self.maximum)
+
+
+class MonteCarloResult:
+    """ Streaming summary of a Monte Carlo run: net worth histograms of both strategies and buy-vs-rent win counts. """
+    def __init__(self, mortgage_net_worth, rent_net_worth, buy_wins, buy_wins_final, start_date):
+        self.mortgage_net_worth = mortgage_net_worth
+        self.rent_net_worth = rent_net_worth
+        self.buy_wins = buy_wins  # Paths where buying is ahead, per month index
+        self.buy_wins_final = buy_wins_final
+        self.start_date = start_date
+        self.seed = None
+
+    @property
+    def n_paths(self):
+        return self.mortgage_net_worth.n_paths
+
+    def merge(self, other):
+        self.mortgage_net_worth.merge(other.mortgage_net_worth)
+        self.rent_net_worth.merge(other.rent_net_worth)
+        self.buy_wins += other.buy_wins
+        self.buy_wins_final += other.buy_wins_final
+
+    @property
+    def probability_buy_wins(self):
+        """ Share of paths where the mortgage net worth is at least the rent & invest net worth, per month index. """
+        return self.buy_wins / self.n_paths
+
+    @property
+    def probability_buy_wins_final(self):
+        """ Share of paths where buying ends the common horizon of both strategies with at least the rent & invest net worth. """
+        return self.buy_wins_final / self.n_paths
+
+    def percentile_bands(self, percentiles=(5, 25, 50, 75, 95)):
+        """ {'Mortgage': {p: curve}, 'Rent & Invest': {p: curve}} net worth percentile curves. """
+        return {
+            'Mortgage': {p: self.mortgage_net_worth.percentile(p) for p in percentiles},
+            'Rent & Invest': {p: self.rent_net_worth.percentile(p) for p in percentiles},
+        }
+
+
+def _simulate_monte_carlo_chunk(simulation, seed_sequence, n_paths, bounds, bins):
+    """ Worker entry point: simulate one chunk of paths and return only its histograms. """
+    mortgage_net_worth, rent_net_worth = simulation.simulate_paths(n_paths, np.random.default_rng(seed_sequence))
+    return simulation.summarize(mortgage_net_worth, rent_net_worth, bounds, bins)
+
+
+class MonteCarloSimulation:
+    """ Monte Carlo mode comparing buying and renting under stochastic rates, returns and property prices.
+
+    - the variable mortgage rate follows a mean-reverting (Ornstein-Uhlenbeck) path reverting to long_run_rate; it
+      starts at later_rate when the initial_years period ends, which is when it applies in the deterministic model
+    - monthly investment returns are lognormal around each side's annual rate (both sides share the same shocks)
+    - the property value factor follows a geometric random walk with the given annual appreciation
+
+    Rates and volatilities are in percent per year. mortgage_params and rent_params are the keyword arguments of
+    MortgageCalculator and Rent_And_Invest_Calculator. With zero volatilities every path equals the deterministic model.
+    """
+    def __init__(self, mortgage_params, rent_params, monthly_salary, monthly_expenses, initial_savings, long_run_rate=None, rate_mean_reversion=0.5, rate_volatility=1.0, rate_floor=0.0, investment_volatility=12.0, property_appreciation=0.0, property_volatility=5.0):
+        self.mortgage_params = dict(mortgage_params)
+        self.rent_params = dict(rent_params)
+        self.monthly_salary = monthly_salary
+        self.monthly_expenses = monthly_expenses
+        self.initial_savings = initial_savings
+        self.long_run_rate = self.mortgage_params['later_rate'] if long_run_rate is None else long_run_rate
+        self.rate_mean_reversion = rate_mean_reversion
+        self.rate_volatility = rate_volatility
+        self.rate_floor = rate_floor
+        self.investment_volatility = investment_volatility / 100
+        self.property_appreciation = property_appreciation / 100
+        self.property_volatility = property_volatility / 100
+        self.total_months = self.mortgage_params['total_years'] * 12
+        self.rent_months = self.rent_params.get('years', 25) * 12
+
+    def sample_rate_paths(self, n_paths, shocks):
+        """ Annual variable rate in percent for every path and month, using the exact OU monthly transition.
+
+        The rate holds at later_rate during the initial period, where it is not used, and evolves from its first variable month on.
+        """
+        decay = np.exp(-self.rate_mean_reversion / 12)
+        if self.rate_mean_reversion > 0:
+            step_volatility = self.rate_volatility * np.sqrt((1 - decay**2) / (2 * self.rate_mean_reversion))
+        else:
+            step_volatility = self.rate_volatility * np.sqrt(1 / 12)
+        rates = np.full(shocks.shape, float(self.mortgage_params['later_rate']))
+        current = rates[:, 0].copy()
+        for month in range(int(self.mortgage_params['initial_years'] * 12) + 1, shocks.shape[1]):
+            current = self.long_run_rate + (current - self.long_run_rate) * decay + step_volatility * shocks[:, month]
+            rates[:, month] = current
+        return np.maximum(rates, self.rate_floor)
+
+    def sample_monthly_returns(self, monthly_rate, shocks):
+        """ Lognormal monthly investment returns whose mean is the deterministic monthly_rate. """
+        drift = np.log1p(monthly_rate) - self.investment_volatility**2 / 24
+        return np.expm1(drift + self.investment_volatility / np.sqrt(12) * shocks)
+
+    def sample_property_paths(self, shocks):
+        """ Property value factor per month as a geometric random walk. """
+        drift = (np.log1p(self.property_appreciation) - self.property_volatility**2 / 2) / 12
+        log_growth = np.cumsum(drift + self.property_volatility / np.sqrt(12) * shocks, axis=1)
+        return self.mortgage_params.get('property_value_factor', 1.0) * np.exp(log_growth)
+
+    def simulate_paths(self, n_paths, rng):
+        """ Net worth of both strategies for n_paths sampled paths: arrays of shape (n_paths, months). """
+        months = max(self.total_months, self.rent_months)
+        rate_shocks, return_shocks, property_shocks = rng.standard_normal((3, n_paths, months))
+
+        # Each calculator keeps its own annual-to-monthly rate convention; both see the same return shocks
+        mortgage_returns = self.sample_monthly_returns(self.mortgage_params.get('annual_investment_rate', 4.5) / 100 / 12, return_shocks)
+        mortgage_params = dict(self.mortgage_params,
+                               later_rate=self.sample_rate_paths(n_paths, rate_shocks),
+                               annual_investment_rate=mortgage_returns * 12 * 100,
+                               property_value_factor=self.sample_property_paths(property_shocks))
+        net_worth_progression = MortgageBatchCalculator(**mortgage_params).generate_payment_plan(self.monthly_salary, self.monthly_expenses, self.initial_savings, columns=['Net Worth'])[5]
+
+        rent_returns = self.sample_monthly_returns((1 + self.rent_params.get('annual_interest_rate', 4.5) / 100) ** (1/12) - 1, return_shocks)
+        rent_params = dict(self.rent_params, annual_interest_rate=((1 + rent_returns) ** 12 - 1) * 100)
+        balance_progression = Rent_And_Invest_Batch_Calculator(**rent_params).calculate_investment()[0]
+
+        return net_worth_progression['Net Worth'][:, :self.total_months], balance_progression['Balance'][:, :self.rent_months]
+
+    def summarize(self, mortgage_net_worth, rent_net_worth, bounds, bins):
+        """ Reduce a block of paths to histograms and win counts (month n compares the n-th simulated month of both). """
+        (mortgage_low, mortgage_high), (rent_low, rent_high) = bounds
+        mortgage_histogram = StreamingHistogram(mortgage_low, mortgage_high, bins)
+        mortgage_histogram.add(mortgage_net_worth)
+        rent_histogram = StreamingHistogram(rent_low, rent_high, bins)
+        rent_histogram.add(rent_net_worth)
+        common_months = min(mortgage_net_worth.shape[1], rent_net_worth.shape[1])
+        buy_wins = (mortgage_net_worth[:, :common_months] >= rent_net_worth[:, :common_months]).sum(axis=0)
+        # With different horizons the final comparison is at the last month both strategies simulate
+        buy_wins_final = int(buy_wins[-1])
+        start_date = datetime.strptime(self.mortgage_params.get('start_date', '2084-01-01'), '%Y-%m-%d')
+        return MonteCarloResult(mortgage_histogram, rent_histogram, buy_wins, buy_wins_final, start_date)
+
+    @_timed('montecarlo.run')
+    def run(self, n_paths, seed=None, workers=None, chunk_size=5000, bins=2048):
+        """ Simulate n_paths paths split into fixed-size chunks across a process pool.
+
+        Chunk seeds are spawned from one SeedSequence and chunks are merged in order, so a given seed gives the
+        same result for any number of workers. Only per-chunk histograms are kept, never the paths themselves.
+
+        The histogram bins are fixed by the first chunk: its range, widened to where the extremes of n_paths normal
+        samples are expected. Values of later chunks beyond that still land in the open-ended tail bins, and
+        percentiles that fall into a tail bin report the exact minimum or maximum.
+        """
+        if n_paths < 1:
+            raise ValueError(f"n_paths must be at least 1, got {n_paths}")
+        seed_sequence = np.random.SeedSequence(seed)
+        chunk_sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+        chunk_seeds = seed_sequence.spawn(len(chunk_sizes))
+        workers = workers or os.cpu_count() or 1
+
+        # The first chunk runs in-process and fixes the histogram bins, so every worker bins identically.
+        # The expected maximum of n normal samples is about sqrt(2 ln n) standard deviations above the mean.
+        mortgage_net_worth, rent_net_worth = self.simulate_paths(chunk_sizes[0], np.random.default_rng(chunk_seeds[0]))
+        spread = np.sqrt(2 * np.log(n_paths)) + 2
+        bounds = []
+        for net_worth in (mortgage_net_worth, rent_net_worth):
+            center, deviation = net_worth.mean(axis=0), net_worth.std(axis=0)
+            low = np.minimum(net_worth.min(axis=0), center - spread * deviation) - 1
+            high = np.maximum(net_worth.max(axis=0), center + spread * deviation) + 1
+            bounds.append((low, high))
+        result = self.summarize(mortgage_net_worth, rent_net_worth, bounds, bins)
+        result.seed = seed_sequence.entropy
+        remaining_chunks = list(zip(chunk_seeds[1:], chunk_sizes[1:]))
+
+        if workers == 1 or not remaining_chunks:
+            for chunk_seed, size in remaining_chunks:
+                result.merge(_simulate_monte_carlo_chunk(self, chunk_seed, size, bounds, bins))
+            return result
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            for chunk_seed, size in remaining_chunks:
+                pending.append(executor.submit(_simulate_monte_carlo_chunk, self, chunk_seed, size, bounds, bins))
+                if len(pending) >= 2 * workers:  # Bound the number of chunk results held in memory
+                    result.merge(pending.popleft().result())
+            while pending:
+                result.merge(pending.popleft().result())
+        return result
+
+
+# Monthly history: months since year 0 (year * 12 + month - 1), EIBOR in percent per year and the investment return in percent per month
+HISTORY_DTYPE = np.dtype([('month', '<i4'), ('eibor', '<f8'), ('investment_return', '<f8')])
+
+
+def load_rate_history(path):
+    """ Memory-mapped monthly history of HISTORY_DTYPE from a .npy file, or from a CSV file converted once to a .npy file next to it.
+
+    The CSV holds date (YYYY-MM or YYYY-MM-DD), eibor and investment_return columns; its .npy copy is rebuilt when
+    the CSV is newer. Months must be consecutive.
+    """
+    if not path.endswith('.npy'):
+        binary_path = path + '.npy'
+        if not os.path.exists(binary_path) or os.path.getmtime(binary_path) < os.path.getmtime(path):
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f))
+            history = np.empty(len(rows), dtype=HISTORY_DTYPE)
+            for i, row in enumerate(rows):
+                year, month = row['date'].split('-')[:2]
+                history[i] = (int(year) * 12 + int(month) - 1, float(row['eibor']), float(row['investment_return']))
+            # Written under a temporary name first, so concurrent readers never map a partial file
+            temporary_path = f'{binary_path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'wb') as f:
+                np.save(f, history)
+            os.replace(temporary_path, binary_path)
+        path = binary_path
+
+    history = np.load(path, mmap_mode='r')
+    if history.dtype != HISTORY_DTYPE:
+        raise ValueError(f"Expected a history of {HISTORY_DTYPE}, got {history.dtype}")
+    if (np.diff(history['month']) != 1).any():
+        raise ValueError("History months must be consecutive")
+    return history
+
+
+class HistoricalBacktest:
+    """ Backtest of buying against renting over every rolling start month of a historical rate and return history.
+
+    After the fixed initial_rate period the mortgage floats at EIBOR plus margin (percent), reset every reset_interval
+    months to the EIBOR of the reset month, and investments on both sides earn the historical monthly return. Every
+    month with total_years of history after it starts one window, optionally limited to first_start..last_start.
+    start_date is the window's first month rather than a label: the scenario's payment calendar, dated early
+    repayments and events keep their offset from it, so December limit resets follow the real calendar. Windows run
+    in one MortgageBatchCalculator batch per calendar month of their start and one Rent_And_Invest_Batch_Calculator batch.
+    """
+    def __init__(self, scenario, history, margin, reset_interval=1, first_start=None, last_start=None):
+        self.scenario = {**SCENARIO_DEFAULTS, **scenario}
+        self.history = load_rate_history(history) if isinstance(history, str) else history
+        self.margin = margin
+        self.reset_interval = reset_interval
+        self.total_months = int(self.scenario['total_years']) * 12
+
+        starts = np.arange(max(len(self.history) - self.total_months + 1, 0))
+        start_months = self.history['month'][starts]
+        if first_start is not None:
+            starts = starts[start_months >= self.month_of(first_start)]
+        if last_start is not None:
+            starts = starts[self.history['month'][starts] <= self.month_of(last_start)]
+        if not len(starts):
+            raise ValueError(f"No window of {self.total_months} months in a history of {len(self.history)} months")
+        self.starts = starts
+
+    @staticmethod
+    def month_of(date):
+        date = _parse_date(date)
+        return date.year * 12 + date.month - 1
+
+    def shift(self, date, months):
+        """ 'YYYY-MM-DD' date moved by a number of months, on the same day or the last day of shorter months. """
+        return MortgageCalculator.get_payment_date(_parse_date(date), months).strftime('%Y-%m-%d')
+
+    def paths(self, starts):
+        """ Monthly later_rate, mortgage annual_investment_rate and rent annual_interest_rate paths of the windows starting at the given history rows. """
+        months = np.arange(self.total_months)
+        resets = months // self.reset_interval * self.reset_interval
+        later_rate = self.history['eibor'][starts[:, None] + resets] + self.margin
+        returns = self.history['investment_return'][starts[:, None] + months] / 100
+        # Each calculator keeps its own annual-to-monthly rate convention; both earn the same monthly return
+        return later_rate, returns * 12 * 100, ((1 + returns) ** 12 - 1) * 100
+
+    @_timed('backtest.run')
+    def run(self, percentiles=(5, 25, 50, 75, 95), n_worst=5):
+        """ Outcome of every window, its distribution and the worst windows.
+
+        Returns a dict of arrays in start order: 'start_date', final 'mortgage_net_worth' and 'rent_net_worth', the
+        'net_worth_difference' (buy minus rent), 'break_even_month' (-1 if buying never catches up),
+        'total_interest_paid' and the 'mean_later_rate' over the floating period. 'percentiles' maps each percentile
+        to the net worth difference, 'probability_buy_wins' is the share of windows where buying ends ahead and
+        'worst' holds the indexes of the n_worst windows with the lowest difference, worst first.
+        """
+        scenario = self.scenario
+        n_windows = len(self.starts)
+        later_rate, mortgage_rate, rent_rate = self.paths(self.starts)
+        start_months = np.asarray(self.history['month'][self.starts])
+        offsets = start_months - self.month_of(scenario['start_date'])
+        start_dates = np.array([self.shift(scenario['start_date'], int(offset)) for offset in offsets], dtype=object)
+
+        mortgage_net_worth = np.empty((n_windows, self.total_months))
+        total_interest_paid = np.empty(n_windows)
+        for calendar_month in np.unique(start_months % 12):
+            # Windows starting in the same calendar month share one calendar up to whole years
+            members = np.flatnonzero(start_months % 12 == calendar_month)
+            offset = int(offsets[members[0]])
+            mortgage_params = {name: scenario[name] for name in MORTGAGE_PARAMETERS if name in scenario}
+            mortgage_params.update(
+                principal=np.full(len(members), float(scenario['principal'])), later_rate=later_rate[members], annual_investment_rate=mortgage_rate[members],
+                start_date=start_dates[members[0]], first_regular_early_repayment_date=self.shift(scenario['first_regular_early_repayment_date'], offset),
+                arbitrary_early_repayments=[dict(rep, date=self.shift(rep['date'], offset)) for rep in scenario['arbitrary_early_repayments']],
+                events=[dict(event, date=self.shift(event['date'], offset)) for event in scenario['events']])
+            _, interest, _, _, _, net_worth_progression, _ = MortgageBatchCalculator(**mortgage_params).generate_payment_plan(
+                scenario['monthly_salary'], scenario['monthly_expenses'], scenario['initial_savings'], columns=['Net Worth'])
+            mortgage_net_worth[members] = net_worth_progression['Net Worth']
+            total_interest_paid[members] = interest
+
+        rent_invest_calculator = Rent_And_Invest_Batch_Calculator(
+            np.full(n_windows, float(scenario['initial_savings'])), annual_interest_rate=rent_rate, years=scenario['total_years'],
+            monthly_salary=scenario['monthly_salary'], monthly_expenses=scenario['monthly_expenses'], **{name: scenario[name] for name in RENT_PARAMETERS})
+        rent_net_worth = rent_invest_calculator.calculate_investment()[0]['Balance']
+
+        difference = mortgage_net_worth[:, -1] - rent_net_worth[:, -1]
+        buy_ahead = mortgage_net_worth >= rent_net_worth
+        initial_months = int(scenario['initial_years']) * 12
+        return {
+            'start_date': start_dates,
+            'mortgage_net_worth': mortgage_net_worth[:, -1],
+            'rent_net_worth': rent_net_worth[:, -1],
+            'net_worth_difference': difference,
+            'break_even_month': np.where(buy_ahead.any(axis=1), buy_ahead.argmax(axis=1), -1),
+            'total_interest_paid': total_interest_paid,
+            'mean_later_rate': later_rate[:, initial_months:].mean(axis=1) if initial_months < self.total_months else np.full(n_windows, np.nan),
+            'percentiles': dict(zip(percentiles, np.percentile(difference, percentiles).tolist())),
+            'probability_buy_wins': float((difference >= 0).mean()),
+            'worst': np.argsort(difference, kind='stable')[:n_worst],
+        }
+
+
+MORTGAGE_PARAMETERS = [name for name in inspect.signature(MortgageCalculator.__init__).parameters if name != 'self']
+RENT_PARAMETERS = ['interest_payment_interval', 'annual_rent', 'rent_cheques', 'change_apartment_interval', 'move_in_costs']
+CASH_FLOW_PARAMETERS = ['monthly_salary', 'monthly_expenses', 'initial_savings']
+# The early repayment calendar is shared within a batch, so scenarios are grouped by it
+CALENDAR_PARAMETERS = ['start_date', 'first_regular_early_repayment_date', 'regular_early_repayment_interval', 'arbitrary_early_repayments', 'events']
+# Calculator defaults of every optional scenario parameter
+SCENARIO_DEFAULTS = {name: parameter.default for calculator in (Rent_And_Invest_Calculator, MortgageCalculator)
+                     for name, parameter in inspect.signature(calculator.__init__).parameters.items()
+                     if name in MORTGAGE_PARAMETERS + RENT_PARAMETERS + CASH_FLOW_PARAMETERS and parameter.default is not inspect.Parameter.empty}
+
+
+def _batch_calculators(scenarios, n_scenarios):
+    """ MortgageBatchCalculator and Rent_And_Invest_Batch_Calculator of scenarios that share one early repayment calendar. """
+    mortgage_params = {name: scenarios[name] for name in MORTGAGE_PARAMETERS if name in scenarios}
+    mortgage_params['principal'] = np.broadcast_to(scenarios['principal'], (n_scenarios,))
+    mortgage_calculator = MortgageBatchCalculator(**mortgage_params)
+
+    # The rent & invest side starts from the same savings and invests at the same annual rate
+    rent_params = {name: scenarios[name] for name in RENT_PARAMETERS if name in scenarios}
+    rent_invest_calculator = Rent_And_Invest_Batch_Calculator(
+        np.broadcast_to(scenarios['initial_savings'], (n_scenarios,)), annual_interest_rate=scenarios.get('annual_investment_rate', 4.5),
+        years=scenarios['total_years'], monthly_salary=scenarios['monthly_salary'], monthly_expenses=scenarios['monthly_expenses'],
+        start_date=scenarios.get('start_date', '2084-01-01'), **rent_params)
+    return mortgage_calculator, rent_invest_calculator
+
+
+def _calendar_groups(scenarios, n_scenarios):
+    """ (members, scenarios) of every group of scenarios sharing one calendar, with the calendar parameters as plain values. """
+    varying_calendar = [name for name in CALENDAR_PARAMETERS if isinstance(scenarios.get(name), np.ndarray)]
+    if not varying_calendar:
+        yield np.arange(n_scenarios), scenarios
+        return
+
+    labels = [json.dumps([scenarios[name][i] for name in varying_calendar], sort_keys=True, default=str) for i in range(n_scenarios)]
+    _, first_index, group = np.unique(labels, return_index=True, return_inverse=True)
+    for group_id, first in enumerate(first_index):
+        members = np.flatnonzero(group == group_id)
+        group_scenarios = select_scenarios(scenarios, members)
+        group_scenarios.update({name: scenarios[name][first] for name in varying_calendar})
+        yield members, group_scenarios
+
+
+def _evaluate_scenario_group(scenarios, n_scenarios):
+    """ Evaluate scenarios that share one early repayment calendar. """
+    mortgage_calculator, rent_invest_calculator = _batch_calculators(scenarios, n_scenarios)
+    _, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, net_worth_progression, _ = mortgage_calculator.generate_payment_plan(
+        scenarios['monthly_salary'], scenarios['monthly_expenses'], scenarios['initial_savings'], columns=['Net Worth'])
+    balance_progression, final_balance, total_rental_costs, _ = rent_invest_calculator.calculate_investment()
+
+    mortgage_net_worth = net_worth_progression['Net Worth']
+    rent_net_worth = balance_progression['Balance']
+    scenario_index = np.arange(n_scenarios)
+    final_mortgage_net_worth = mortgage_net_worth[scenario_index, mortgage_calculator.total_months - 1]
+
+    # Month n compares the n-th simulated month of both strategies
+    common_months = min(mortgage_net_worth.shape[1], rent_net_worth.shape[1])
+    buy_ahead = mortgage_net_worth[:, :common_months] >= rent_net_worth[:, :common_months]
+    break_even_month = np.where(buy_ahead.any(axis=1), buy_ahead.argmax(axis=1), -1)
+
+    total_cost_of_ownership = (mortgage_calculator.property_price + mortgage_calculator.calculate_initial_costs(mortgage_calculator.property_price)
+                               + total_interest_paid + total_insurance_costs + total_maintenance_costs + total_early_repayment_fees)
+
+    return {
+        'mortgage_net_worth': final_mortgage_net_worth,
+        'rent_net_worth': final_balance,
+        'net_worth_difference': final_mortgage_net_worth - final_balance,
+        'total_interest_paid': total_interest_paid,
+        'total_cost_of_ownership': total_cost_of_ownership,
+        'total_rental_costs': total_rental_costs,
+        'break_even_month': break_even_month,
+    }
+
+
+def _is_per_scenario(name, value):
+    """ Calendar parameters vary per scenario only as object arrays; a plain list is one shared repayment list. """
+    if name in CALENDAR_PARAMETERS:
+        return isinstance(value, np.ndarray)
+    return np.ndim(value) == 1
+
+
+def select_scenarios(scenarios, members):
+    """ Subset of columnar scenarios at the given indexes; shared scalar parameters are kept as they are. """
+    return {name: value[members] if _is_per_scenario(name, value) else value for name, value in scenarios.items()}
+
+
+def scenarios_to_columns(rows, base, parameters=None):
+    """ Columnar form of a list of scenario dicts; parameters missing from a row fall back to base. """
+    if parameters is None:
+        parameters = list(dict.fromkeys(name for row in rows for name in row))
+    columns = {}
+    for name in parameters:
+        values = [row.get(name, base.get(name)) for row in rows]
+        if name in CALENDAR_PARAMETERS:
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+        else:
+            column = np.asarray(values)
+        columns[name] = column
+    return columns
+
+
+@_timed('scenarios.evaluate')
+def evaluate_scenarios(scenarios):
+    """ Evaluate buying and renting for a batch of scenarios and return summary metrics as a dict of arrays.
+
+    scenarios maps parameter names to a scalar or a 1-D array with one value per scenario. Names are the
+    MortgageCalculator arguments plus monthly_salary, monthly_expenses, initial_savings and the rent & invest
+    arguments (annual_rent, rent_cheques, change_apartment_interval, move_in_costs, interest_payment_interval).
+    The rent side reuses initial_savings, total_years and annual_investment_rate. Calendar parameters may vary per
+    scenario when given as object arrays; scenarios are then evaluated in groups sharing one calendar.
+    """
+    lengths = {len(value) for name, value in scenarios.items() if _is_per_scenario(name, value)}
+    if len(lengths) > 1:
+        raise ValueError(f"Scenario arrays have different lengths: {sorted(lengths)}")
+    n_scenarios = lengths.pop() if lengths else 1
+
+    if not any(isinstance(scenarios.get(name), np.ndarray) for name in CALENDAR_PARAMETERS):
+        return _evaluate_scenario_group(scenarios, n_scenarios)
+
+    metrics = None
+    for members, group_scenarios in _calendar_groups(scenarios, n_scenarios):
+        group_metrics = _evaluate_scenario_group(group_scenarios, len(members))
+        if metrics is None:
+            metrics = {name: np.empty(n_scenarios, dtype=values.dtype) for name, values in group_metrics.items()}
+        for name, values in group_metrics.items():
+            metrics[name][members] = values
+    return metrics
+
+
+def _run_sweep_chunk(path, base, scenarios, first_scenario, output_format):
+    """ Worker entry point: evaluate one chunk of a sweep and write it atomically. """
+    import pyarrow as pa
+
+    n_scenarios = len(next(iter(scenarios.values())))
+    metrics = evaluate_scenarios({**base, **scenarios})
+    columns = {'scenario_id': np.arange(first_scenario, first_scenario + n_scenarios)}
+    for name, values in scenarios.items():
+        columns[name] = [json.dumps(value, default=str) for value in values] if values.dtype == object else values
+    columns.update(metrics)
+    table = pa.table(columns)
+
+    temporary_path = path + '.tmp'
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, temporary_path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, temporary_path)
+    os.replace(temporary_path, path)  # A chunk file only ever appears complete
+    return n_scenarios
+
+
+def print_sweep_progress(completed, total, elapsed):
+    """ ParameterSweep.run progress callback printing one line per chunk. """
+    print(f"Sweep: {completed}/{total} chunks, {elapsed:.1f}s elapsed")
+
+
+class ParameterSweep:
+    """ Parallel parameter sweep writing summary metrics in fixed-size Parquet or Arrow chunks.
+
+    Scenarios come either from a grid (parameter -> list of values, expanded lazily as a cartesian product) or
+    from an explicit list of scenario dicts, on top of the base parameters. Chunks are evaluated with the batch
+    engines in a process pool and written as part-NNNNNN files; an interrupted sweep resumes from the chunks
+    already on disk.
+    """
+    def __init__(self, output_dir, base, grid=None, scenarios=None, chunk_size=10000, output_format='parquet'):
+        if (grid is None) == (scenarios is None):
+            raise ValueError("Provide exactly one of grid or scenarios")
+        if output_format not in ('parquet', 'arrow'):
+            raise ValueError(f"Unsupported output format: {output_format}")
+        self.output_dir = output_dir
+        self.base = dict(base)
+        self.grid = {name: list(values) for name, values in grid.items()} if grid is not None else None
+        self.scenarios = scenarios
+        self.scenario_parameters = list(dict.fromkeys(name for scenario in scenarios for name in scenario)) if scenarios is not None else None
+        self.chunk_size = chunk_size
+        self.output_format = output_format
+        self.n_scenarios = int(np.prod([len(values) for values in self.grid.values()])) if grid is not None else len(scenarios)
+        self.n_chunks = -(-self.n_scenarios // chunk_size)
+
+    def chunk_path(self, index):
+        extension = 'parquet' if self.output_format == 'parquet' else 'arrow'
+        return os.path.join(self.output_dir, f'part-{index:06d}.{extension}')
+
+    def chunk(self, index):
+        """ Columnar scenarios of one chunk: {parameter: array}, only for parameters that vary. """
+        start, stop = index * self.chunk_size, min((index + 1) * self.chunk_size, self.n_scenarios)
+        if self.grid is not None:
+            positions = np.unravel_index(np.arange(start, stop), [len(values) for values in self.grid.values()])
+            columns = {}
+            for (name, values), position in zip(self.grid.items(), positions):
+                if name in CALENDAR_PARAMETERS:
+                    column = np.empty(len(position), dtype=object)
+                    column[:] = [values[i] for i in position]
+                else:
+                    column = np.asarray(values)[position]
+                columns[name] = column
+            return columns
+
+        return scenarios_to_columns(self.scenarios[start:stop], self.base, self.scenario_parameters)
+
+    def check_manifest(self):
+        """ Write the sweep definition next to the chunks, or make sure a resumed sweep matches it. """
+        definition = json.dumps({'base': self.base, 'grid': self.grid, 'scenarios': self.scenarios, 'chunk_size': self.chunk_size, 'output_format': self.output_format}, sort_keys=True, default=str)
+        manifest = {'definition_hash': hashlib.sha256(definition.encode()).hexdigest(), 'n_scenarios': self.n_scenarios, 'n_chunks': self.n_chunks, 'chunk_size': self.chunk_size}
+        manifest_path = os.path.join(self.output_dir, 'sweep.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                existing = json.load(manifest_file)
+            if existing['definition_hash'] != manifest['definition_hash']:
+                raise ValueError(f"{self.output_dir} holds a different sweep; use a new output directory to start over")
+        else:
+            with open(manifest_path, 'w') as manifest_file:
+                json.dump(manifest, manifest_file, indent=2)
+
+    @_timed('sweep.run')
+    def run(self, workers=None, progress=None):
+        """ Evaluate every missing chunk and return the number of scenarios written in this call.
+
+        progress, if given, is called as progress(completed_chunks, n_chunks, elapsed_seconds) after every chunk;
+        pass print_sweep_progress to print a progress line.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.check_manifest()
+        workers = workers or os.cpu_count() or 1
+        if progress is None:
+            def progress(completed, total, elapsed):
+                pass
+
+        pending_chunks = [index for index in range(self.n_chunks) if not os.path.exists(self.chunk_path(index))]
+        completed = self.n_chunks - len(pending_chunks)
+        written = 0
+        start_time = time.perf_counter()
+
+        if workers == 1:
+            for index in pending_chunks:
+                written += _run_sweep_chunk(self.chunk_path(index), self.base, self.chunk(index), index * self.chunk_size, self.output_format)
+                completed += 1
+                progress(completed, self.n_chunks, time.perf_counter() - start_time)
+            return written
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = set()
+            for index in pending_chunks:
+                in_flight.add(executor.submit(_run_sweep_chunk, self.chunk_path(index), self.base, self.chunk(index), index * self.chunk_size, self.output_format))
+                if len(in_flight) < 2 * workers:  # Bound the number of chunks held in memory
+                    continue
+                done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    written += future.result()
+                    completed += 1
+                    progress(completed, self.n_chunks, time.perf_counter() - start_time)
+            for future in concurrent.futures.as_completed(in_flight):
+                written += future.result()
+                completed += 1
+                progress(completed, self.n_chunks, time.perf_counter() - start_time)
+        return written
+
+    def read_results(self):
+        """ Load every completed chunk as one pandas DataFrame, ordered by scenario_id. """
+        import pyarrow as pa
+
+        tables = []
+        for index in range(self.n_chunks):
+            path = self.chunk_path(index)
+            if not os.path.exists(path):
+                continue
+            if self.output_format == 'parquet':
+                import pyarrow.parquet as pq
+                tables.append(pq.read_table(path))
+            else:
+                import pyarrow.feather as feather
+                tables.append(feather.read_table(path))
+        return pa.concat_tables(tables).to_pandas()
+
+
+# Inputs that only take whole values make the net worth difference a step function, so they cannot be solved for
+DISCRETE_PARAMETERS = ['initial_years', 'total_years', 'maintenance_fees_interval', 'insurance_payment_interval', 'regular_early_repayment_interval',
+                       'interest_payment_interval', 'rent_cheques', 'change_apartment_interval', 'allow_exceed_early_repayment_limit'] + CALENDAR_PARAMETERS
+
+
+class BreakEvenSolver:
+    """ Finds the value of one input at which buying and renting end the horizon with the same net worth.
+
+    Each query brackets the chosen parameter and is refined with the Illinois variant of regula falsi, which
+    keeps a sign-changing bracket like bisection but converges superlinearly. All active queries for one parameter
+    are evaluated together through evaluate_scenarios, one batch per iteration, so answering a query takes a few
+    dozen evaluations rather than a brute-force scan.
+    """
+    def __init__(self, base, net_worth_tolerance=1.0, relative_tolerance=1e-9, max_iterations=60):
+        self.base = dict(base)
+        self.net_worth_tolerance = net_worth_tolerance  # AED
+        self.relative_tolerance = relative_tolerance
+        self.max_iterations = max_iterations
+
+    def solve(self, parameter, bracket=None, **overrides):
+        """ Solve a single query; returns a dict of scalars (see solve_batch). """
+        result = self.solve_batch([dict(overrides, parameter=parameter, bracket=bracket)])
+        return {name: values[0] for name, values in result.items()}
+
+    @_timed('breakeven.solve')
+    def solve_batch(self, queries):
+        """ Solve many queries at once.
+
+        Each query is a dict with 'parameter' (the input to solve for), an optional 'bracket' (low, high), by default
+        a quarter to four times the base value, and any parameter overrides on top of the base scenario. Returns a
+        dict of arrays in query order: the threshold 'value', the remaining 'net_worth_difference', the first
+        'crossover_month' of the net worth curves at that value (-1 if buying never catches up), the number of
+        'evaluations' and whether the query 'converged'. Queries whose bracket does not change sign get NaN.
+        """
+        n_queries = len(queries)
+        result = {
+            'parameter': np.array([query['parameter'] for query in queries], dtype=object),
+            'value': np.full(n_queries, np.nan),
+            'net_worth_difference': np.full(n_queries, np.nan),
+            'crossover_month': np.full(n_queries, -1),
+            'evaluations': np.zeros(n_queries, dtype=int),
+            'converged': np.zeros(n_queries, dtype=bool),
+        }
+
+        for parameter in dict.fromkeys(result['parameter']):
+            if parameter in DISCRETE_PARAMETERS:
+                raise ValueError(f"{parameter} only takes whole values and cannot be solved for")
+            members = np.flatnonzero(result['parameter'] == parameter)
+            group_queries = [queries[i] for i in members]
+            scenarios = self.build_scenarios(group_queries)
+
+            if parameter not in scenarios and parameter not in SCENARIO_DEFAULTS:
+                raise ValueError(f"Unknown scenario parameter: {parameter}")
+            base_value = np.broadcast_to(np.asarray(scenarios.get(parameter, SCENARIO_DEFAULTS.get(parameter)), dtype=float), (len(members),))
+            low = np.array([query['bracket'][0] if query.get('bracket') is not None else 0.25 * base_value[i] for i, query in enumerate(group_queries)], dtype=float)
+            high = np.array([query['bracket'][1] if query.get('bracket') is not None else 4 * base_value[i] for i, query in enumerate(group_queries)], dtype=float)
+
+            for name, values in zip(('value', 'net_worth_difference', 'crossover_month', 'evaluations', 'converged'), self.solve_group(parameter, scenarios, low, high)):
+                result[name][members] = values
+        return result
+
+    def build_scenarios(self, queries):
+        """ Columnar scenarios for a group of queries: the base scenario overlaid with every query's overrides. """
+        overrides = [{name: value for name, value in query.items() if name not in ('parameter', 'bracket')} for query in queries]
+        return {**self.base, **scenarios_to_columns(overrides, self.base)}
+
+    def evaluate(self, parameter, scenarios, members, values):
+        """ Final net worth difference and crossover month for the given queries with parameter set to values. """
+        subset = select_scenarios(scenarios, members)
+        subset[parameter] = values
+        metrics = evaluate_scenarios(subset)
+        return metrics['net_worth_difference'], metrics['break_even_month']
+
+    def solve_group(self, parameter, scenarios, low, high):
+        n_queries = len(low)
+        every_query = np.arange(n_queries)
+        f_low, crossover_low = self.evaluate(parameter, scenarios, every_query, low)
+        f_high, crossover_high = self.evaluate(parameter, scenarios, every_query, high)
+        evaluations = np.full(n_queries, 2)
+
+        # Start from the better endpoint; queries without a sign change are reported as unsolved
+        use_low = np.abs(f_low) <= np.abs(f_high)
+        value = np.where(use_low, low, high)
+        difference = np.where(use_low, f_low, f_high)
+        crossover_month = np.where(use_low, crossover_low, crossover_high)
+        bracketed = np.sign(f_low) != np.sign(f_high)
+        converged = np.abs(difference) <= self.net_worth_tolerance
+        value[~bracketed & ~converged] = np.nan
+        difference[~bracketed & ~converged] = np.nan
+        crossover_month[~bracketed & ~converged] = -1
+
+        last_side = np.zeros(n_queries, dtype=int)  # -1 when low was replaced last, +1 for high
+        for _ in range(self.max_iterations):
+            active = np.flatnonzero(bracketed & ~converged)
+            if len(active) == 0:
+                break
+
+            # Regula falsi step, falling back to bisection if rounding pushes it out of the bracket
+            a, b, fa, fb = low[active], high[active], f_low[active], f_high[active]
+            x = (a * fb - b * fa) / (fb - fa)
+            x = np.where((x > np.minimum(a, b)) & (x < np.maximum(a, b)), x, (a + b) / 2)
+            fx, crossover = self.evaluate(parameter, scenarios, active, x)
+            evaluations[active] += 1
+            value[active], difference[active], crossover_month[active] = x, fx, crossover
+
+            replaces_high = np.sign(fx) == np.sign(fb)
+            # Illinois: halve the retained endpoint's value when the same side moves twice in a row
+            f_low[active] = np.where(replaces_high & (last_side[active] == 1), fa / 2, fa)
+            f_high[active] = np.where(~replaces_high & (last_side[active] == -1), fb / 2, fb)
+            high[active] = np.where(replaces_high, x, b)
+            f_high[active] = np.where(replaces_high, fx, f_high[active])
+            low[active] = np.where(replaces_high, a, x)
+            f_low[active] = np.where(replaces_high, f_low[active], fx)
+            last_side[active] = np.where(replaces_high, 1, -1)
+
+            width = np.abs(high[active] - low[active])
+            converged[active] = (np.abs(fx) <= self.net_worth_tolerance) | (width <= self.relative_tolerance * np.maximum(np.abs(x), 1))
+
+        return value, difference, crossover_month, evaluations, converged
+
+
+class SensitivityAnalysis:
+    """ How much each numeric input moves the outcome: tornado chart data for both calculators.
+
+    Every numeric input of the base scenario is moved down and up by a relative step (whole-valued inputs by at least
+    one unit, never below one), and the base plus all 2N perturbed scenarios are evaluated together in a single
+    evaluate_scenarios batch. Inputs that are zero in the base scenario stay at zero unless given an absolute step.
+    """
+    def __init__(self, base, step=0.1, steps=None, parameters=None):
+        self.base = dict(base)
+        self.step = step
+        self.steps = steps or {}  # absolute step per parameter, overriding the relative one
+        self.parameters = parameters or [name for name in MORTGAGE_PARAMETERS + RENT_PARAMETERS + CASH_FLOW_PARAMETERS
+                                         if isinstance(self.value(name), (int, float)) and not isinstance(self.value(name), bool)]
+
+    def value(self, parameter):
+        return self.base.get(parameter, SCENARIO_DEFAULTS.get(parameter))
+
+    def perturb(self, parameter):
+        """ (low, high) values of one input. """
+        value = self.value(parameter)
+        delta = self.steps.get(parameter, abs(value) * self.step)
+        if parameter in DISCRETE_PARAMETERS:
+            delta = max(round(delta), 1) if delta else 0
+            return max(value - delta, min(value, 1)), value + delta
+        return value - delta, value + delta
+
+    @_timed('sensitivity.run')
+    def run(self):
+        """ Effect of every input, ranked by swing (largest first).
+
+        Returns a dict of arrays: 'parameter', its 'base_value', 'low_value' and 'high_value', the change of the
+        final net worth difference (buy minus rent) at the low and high value ('low_change', 'high_change'), the
+        change of the break-even month ('break_even_low_change', 'break_even_high_change'; NaN where buying never
+        catches up in one of the scenarios) and the 'swing' between the two net worth changes. The base scenario's
+        'base_net_worth_difference' and 'base_break_even_month' are included as scalars.
+        """
+        values = [self.perturb(parameter) for parameter in self.parameters]
+        rows = [{}] + [{parameter: value} for parameter, (low, high) in zip(self.parameters, values) for value in (low, high)]
+        base = {**SCENARIO_DEFAULTS, **self.base}
+        metrics = evaluate_scenarios({**base, **scenarios_to_columns(rows, base, self.parameters)})
+
+        difference = metrics['net_worth_difference']
+        break_even = np.where(metrics['break_even_month'] >= 0, metrics['break_even_month'], np.nan)
+        low_change, high_change = difference[1::2] - difference[0], difference[2::2] - difference[0]
+        swing = np.abs(high_change - low_change)
+        order = np.argsort(-swing, kind='stable')
+        return {
+            'parameter': np.array(self.parameters, dtype=object)[order],
+            'base_value': np.array([self.value(parameter) for parameter in self.parameters], dtype=float)[order],
+            'low_value': np.array([low for low, _ in values], dtype=float)[order],
+            'high_value': np.array([high for _, high in values], dtype=float)[order],
+            'low_change': low_change[order],
+            'high_change': high_change[order],
+            'break_even_low_change': (break_even[1::2] - break_even[0])[order],
+            'break_even_high_change': (break_even[2::2] - break_even[0])[order],
+            'swing': swing[order],
+            'base_net_worth_difference': difference[0].item(),
+            'base_break_even_month': int(metrics['break_even_month'][0]),
+        }
+
+
+class OfferComparison:
+    """ Ranks K mortgage offers against M rental plans on one integer month axis, each side simulated in one batch.
+
+    offers are dicts of MortgageCalculator parameters and rental_plans dicts of rent & invest parameters (RENT_PARAMETERS),
+    each applied on top of base and optionally carrying a 'name'. Month n holds the n-th simulated month of every
+    strategy, as in evaluate_scenarios; the horizon defaults to the shortest offer term. With top_k, the offers are
+    checked once a year against bounds on their net worth at the horizon and stop being simulated as soon as at least
+    top_k strategies are certain to end ahead of them.
+    """
+    def __init__(self, base, offers, rental_plans, top_k=None, horizon_years=None):
+        self.base = dict(base)
+        self.offers = [dict(offer) for offer in offers]
+        self.rental_plans = [dict(plan) for plan in rental_plans]
+        for kind, rows, parameters in (('offer', self.offers, MORTGAGE_PARAMETERS), ('rental plan', self.rental_plans, RENT_PARAMETERS)):
+            for row in rows:
+                unknown = sorted(set(row) - set(parameters) - {'name'})
+                if unknown:
+                    raise ValueError(f"Unknown {kind} parameters: {', '.join(unknown)}")
+        if not self.offers and not self.rental_plans:
+            raise ValueError("Provide at least one offer or rental plan")
+        self.top_k = top_k
+        terms = [offer.get('total_years', self.base['total_years']) for offer in self.offers]
+        self.horizon_years = horizon_years or min(terms, default=self.base['total_years'])
+        if any(term < self.horizon_years for term in terms):
+            raise ValueError(f"Every offer must run for the {self.horizon_years}-year horizon")
+        self.names = ([offer.pop('name', f'offer {i + 1}') for i, offer in enumerate(self.offers)]
+                      + [plan.pop('name', f'rent {i + 1}') for i, plan in enumerate(self.rental_plans)])
+
+    def bounds(self, calculator, events, net_monthly_income, month, scenarios, investment_balance, remaining_principal):
+        """ (lower, upper, certain): bounds on the net worth at the horizon of offers simulated up to month, and where they hold.
+
+        Every remaining payment lowers the final net worth by its value compounded to the horizon, less the principal
+        it repays. The principal can fall no slower than the instalments alone repay it and no faster than they do
+        plus the scheduled early repayments, which brackets the loan interest, life insurance and returns forgone on
+        repaid principal; maintenance fees and one-off costs are known from the calendar. Insurance is only counted as
+        certain while the lowest principal is above 1, as the final payment can leave a rounding residue.
+
+        All of this assumes early repayments between zero and their scheduled amounts. The calculator caps a repayment
+        at the investment balance (less the fee above the annual cap), so a balance below that turns the repayment into
+        new borrowing and the principal grows. The bounds are therefore only certain for offers whose balance stays
+        above the largest fee in every remaining month, even with every cost and principal payment at its most.
+        """
+        horizon = self.horizon_years * 12
+        n_months = horizon - month
+        elapsed = np.arange(n_months + 1)  # Column j is the start of month `month + j`
+        due_months = month + elapsed[:-1]
+        rate = calculator.annual_investment_rate[scenarios, None]
+        compounding = (1 + rate) ** (n_months - 1 - elapsed[:-1])  # Value at the horizon of one unit paid in each remaining month
+        cash = investment_balance * compounding[:, 0] * (1 + rate[:, 0]) + net_monthly_income[scenarios] * compounding.sum(axis=1)
+        property_value = calculator.property_price[scenarios] * calculator.property_value_factor[scenarios]
+
+        # Principal without early repayments: the fixed initial instalment, then the rest amortized over the remaining term
+        initial_rate, later_rate = calculator.initial_rate[scenarios, None], calculator.later_rate[scenarios, None]
+        initial_months = np.clip(calculator.initial_years[scenarios, None] * 12 - month, 0, None)
+        initial_emi = calculator.calculate_payment(calculator.initial_rate, calculator.total_months, calculator.principal)[scenarios, None]
+        initial_growth = (1 + initial_rate) ** np.minimum(elapsed, initial_months)
+        principal_ceiling = remaining_principal[:, None] * initial_growth - initial_emi * (initial_growth - 1) / initial_rate
+        later_start = principal_ceiling[np.arange(len(scenarios)), np.minimum(initial_months[:, 0], n_months)][:, None]
+        later_growth = (1 + later_rate) ** (calculator.total_months[scenarios, None] - month - initial_months)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            amortized = later_start * (later_growth - (1 + later_rate) ** (elapsed - initial_months)) / (later_growth - 1)
+        principal_ceiling = np.maximum(np.where(elapsed <= initial_months, principal_ceiling, amortized), 0.0)
+
+        # Early repayments take off at most their scheduled amounts within the annual cap; in the initial period
+        # the fixed instalment repays that much more principal again at the initial rate
+        repayment_offsets, repayment_amounts = events.table('early_repayment')
+        scheduled = np.zeros((len(scenarios), n_months + 1))
+        for j in range(n_months):
+            for event in range(repayment_offsets[month + j], repayment_offsets[month + j + 1]):
+                amount = repayment_amounts[event]
+                scheduled[:, j + 1] += amount[scenarios] if np.ndim(amount) else amount
+        year_ends = np.concatenate([[0], np.cumsum(events.occurs('year_end')[month:horizon])])
+        cap_windows = np.where(elapsed > 0, 1 + year_ends[np.maximum(elapsed - 1, 0)], 0)  # Annual caps opened before each month
+        annual_cap = np.where(calculator.allow_exceed_early_repayment_limit, np.inf, calculator.principal * calculator.max_early_repayment_percent)[scenarios, None]
+        early_repaid = np.minimum(np.cumsum(scheduled, axis=1), np.where(cap_windows > 0, annual_cap * np.maximum(cap_windows, 1), 0.0))
+        principal_floor = np.maximum(principal_ceiling - early_repaid * initial_growth, 0.0)
+
+        # Principal repaid k months before the horizon forgoes (1 + rate)^k - 1 of returns
+        forgone = compounding - 1
+        marginal = forgone - np.concatenate([forgone[:, 1:], np.zeros((len(scenarios), 1))], axis=1)
+        least_forgone = ((remaining_principal[:, None] - principal_ceiling[:, 1:]) * marginal).sum(axis=1)
+        most_forgone = ((remaining_principal[:, None] - principal_floor[:, 1:]) * marginal).sum(axis=1)
+
+        loan_rate = np.where(due_months < calculator.initial_years[scenarios, None] * 12, initial_rate, later_rate)
+        insured = due_months % calculator.insurance_payment_interval[scenarios, None] == 0
+        property_insurance = calculator.property_price[scenarios, None] * calculator.property_insurance_rate[scenarios, None] / 12
+        life_insurance_rate = calculator.life_insurance_rate[scenarios, None] / 12
+        maintenance_due = due_months % calculator.maintenance_fees_interval[scenarios, None] == 0
+        _, rates = events.table('maintenance_fees_rate')
+        maintenance_fees = calculator.maintenance_fees[scenarios, None]
+        fee_rates = [calculator.property_size[scenarios, None] * rate for rate in rates]
+        cost_offsets, costs = events.table('maintenance')
+        one_off_costs = np.array([sum(costs[cost_offsets[month + j]:cost_offsets[month + j + 1]]) for j in range(n_months)], dtype=float)
+        least_costs = (principal_floor[:, :-1] * loan_rate
+                       + np.where(insured & (principal_floor[:, 1:] > 1), principal_floor[:, 1:] * life_insurance_rate + property_insurance, 0.0)
+                       + np.where(maintenance_due, np.minimum.reduce([maintenance_fees] + fee_rates), 0.0) + one_off_costs)
+        repayment_fees = np.where(calculator.allow_exceed_early_repayment_limit[scenarios, None] & (scheduled[:, 1:] > 0), np.minimum(0.01 * principal_ceiling[:, :-1], 10000), 0.0)
+        most_costs = (principal_ceiling[:, :-1] * loan_rate
+                      + np.where(insured, principal_ceiling[:, 1:] * life_insurance_rate + property_insurance, 0.0)
+                      + np.where(maintenance_due, np.maximum.reduce([maintenance_fees] + fee_rates), 0.0) + one_off_costs + repayment_fees)
+
+        # Lowest investment balance at the start of every remaining month: income and costs compounded to that month,
+        # and the principal repaid by then at its most, compounded as if it were all paid in the first month
+        growth = (1 + rate) ** elapsed
+        discounted = np.cumsum(np.concatenate([np.zeros((len(scenarios), 1)), (net_monthly_income[scenarios, None] - most_costs) / growth[:, 1:]], axis=1), axis=1)
+        balance_floor = (investment_balance[:, None] + discounted - (remaining_principal[:, None] - principal_floor)) * growth
+        largest_fee = np.where(calculator.allow_exceed_early_repayment_limit[scenarios], np.minimum(0.01 * remaining_principal, 10000), 0.0)
+        certain = (balance_floor[:, :-1] >= largest_fee[:, None]).all(axis=1)
+
+        base = property_value - remaining_principal + cash
+        return base - most_forgone - (most_costs * compounding).sum(axis=1), base - least_forgone - (least_costs * compounding).sum(axis=1), certain
+
+    @_timed('offers.run')
+    def run(self):
+        """ Ranking of every offer and rental plan by net worth at the horizon (largest first).
+
+        Returns a dict of arrays in rank order: 'strategy' names, 'kind' ('buy' or 'rent'), 'final_net_worth',
+        'net_worth' paths of shape (strategies, months), 'crossover_month' where crossover_month[i, j] is the first
+        month strategy i is at least level with strategy j (-1 if never) among the strategies simulated to the
+        horizon, and for offers dropped by top_k the
+        'pruned_month' (-1 otherwise) and the 'upper_bound' their net worth could have reached. Pruned offers come
+        last, by upper bound, with NaN net worth from the pruned month on. 'months' is the horizon in months.
+        """
+        base = {**SCENARIO_DEFAULTS, **self.base}
+        n_offers, n_plans = len(self.offers), len(self.rental_plans)
+        months = self.horizon_years * 12
+        net_worth = np.full((n_offers + n_plans, months), np.nan)
+        pruned_month = np.full(n_offers + n_plans, -1)
+        upper_bound = np.full(n_offers + n_plans, np.nan)
+        # Net worth every strategy is certain to reach at the horizon, which offers are pruned against
+        lower_bound = np.full(n_offers + n_plans, -np.inf)
+
+        if n_plans:
+            plans = {**base, **scenarios_to_columns(self.rental_plans, base)}
+            rent_invest_calculator = Rent_And_Invest_Batch_Calculator(
+                np.full(n_plans, base['initial_savings']), annual_interest_rate=base.get('annual_investment_rate', 4.5), years=self.horizon_years,
+                monthly_salary=base['monthly_salary'], monthly_expenses=base['monthly_expenses'], start_date=base.get('start_date', '2084-01-01'),
+                **{name: plans[name] for name in RENT_PARAMETERS if name in plans})
+            net_worth[n_offers:] = rent_invest_calculator.calculate_investment()[0]['Balance']
+            lower_bound[n_offers:] = net_worth[n_offers:, -1]
+
+        if n_offers:
+            columns = {**base, **scenarios_to_columns(self.offers, base)}
+            for members, group in _calendar_groups(columns, n_offers):
+                mortgage_params = {name: group[name] for name in MORTGAGE_PARAMETERS if name in group}
+                mortgage_params['principal'] = np.broadcast_to(group['principal'], (len(members),))
+                mortgage_calculator = MortgageBatchCalculator(**mortgage_params)
+                events = mortgage_calculator.build_events(int(mortgage_calculator.total_months.max()))
+                net_monthly_income = np.broadcast_to(np.asarray(group['monthly_salary'], dtype=float) - group['monthly_expenses'], (len(members),))
+                pruned = np.zeros(len(members), dtype=bool)
+
+                def prune(month, scenarios, investment_balance, remaining_principal):
+                    # Months past the horizon are never compared, so every offer stops there
+                    if month >= months:
+                        return np.ones(len(scenarios), dtype=bool)
+                    if self.top_k is None or self.top_k >= len(lower_bound):
+                        return np.zeros(len(scenarios), dtype=bool)
+                    lower, upper, certain = self.bounds(mortgage_calculator, events, net_monthly_income, month, scenarios, investment_balance, remaining_principal)
+                    # Offers whose balance may run out keep being simulated and do not raise the threshold
+                    certain_members = members[scenarios[certain]]
+                    lower_bound[certain_members] = np.maximum(lower_bound[certain_members], lower[certain])
+                    threshold = np.partition(lower_bound, -self.top_k)[-self.top_k]
+                    drop = certain & (upper < threshold - 1e-9 * abs(threshold))  # Fully determined offers have equal bounds up to rounding
+                    pruned[scenarios[drop]] = True
+                    pruned_month[members[scenarios[drop]]] = month
+                    upper_bound[members[scenarios[drop]]] = upper[drop]
+                    _count('offers_pruned', int(drop.sum()))
+                    return drop
+
+                prunable = (all(values.ndim == 1 for values in (mortgage_calculator.later_rate, mortgage_calculator.annual_investment_rate, mortgage_calculator.property_value_factor))
+                            and (mortgage_calculator.annual_investment_rate >= 0).all())
+                net_worth_progression = mortgage_calculator.generate_payment_plan(group['monthly_salary'], group['monthly_expenses'], group['initial_savings'],
+                                                                                  columns=['Net Worth'], prune=prune if prunable else None)[5]
+                net_worth[members] = net_worth_progression['Net Worth'][:, :months]
+                lower_bound[members[~pruned]] = net_worth[members[~pruned], -1]
+
+        final_net_worth = net_worth[:, -1]
+        order = np.lexsort((-np.nan_to_num(upper_bound, nan=-np.inf), -np.nan_to_num(final_net_worth, nan=-np.inf), pruned_month >= 0))
+        net_worth = net_worth[order]
+        ranked = net_worth[:np.count_nonzero(pruned_month < 0)]
+        crossover_month = np.empty((len(ranked), len(ranked)), dtype=int)
+        for i, path in enumerate(ranked):
+            ahead = path >= ranked
+            crossover_month[i] = np.where(ahead.any(axis=1), ahead.argmax(axis=1), -1)
+        return {
+            'strategy': np.array(self.names, dtype=object)[order],
+            'kind': np.array(['buy'] * n_offers + ['rent'] * n_plans, dtype=object)[order],
+            'final_net_worth': final_net_worth[order],
+            'net_worth': net_worth,
+            'crossover_month': crossover_month,
+            'pruned_month': pruned_month[order],
+            'upper_bound': upper_bound[order],
+            'months': months,
+        }
+
+
+class EarlyRepaymentOptimizer:
+    """ Searches the yearly early repayments that maximize the final net worth or minimize the total interest paid.
+
+    One repayment is made every year on the anniversary of first_regular_early_repayment_date, in place of the
+    scenario's regular and arbitrary early repayments. The annual cap and the fee rule are the calculator's own: amounts
+    range up to the cap, or up to the whole principal with allow_exceed_early_repayment_limit, paying the fee above it.
+    Schedules whose investment balance goes negative in any month are rejected.
+
+    The search is a coordinate search on a grid of amounts. Every candidate schedule is one scenario of a
+    MortgageBatchCalculator batch carrying its own amounts, so one batch tries every grid value for every year with
+    the other years fixed. The best changes of all years are then applied together if that improves on the best single
+    change, and once no change improves the grid step is halved around the current amounts down to min_step.
+    """
+    OBJECTIVES = ['net_worth', 'interest']
+
+    def __init__(self, scenario, objective='net_worth', step=None, min_step=1000, max_iterations=50):
+        if objective not in self.OBJECTIVES:
+            raise ValueError(f"Unknown objective {objective!r}, expected one of {', '.join(self.OBJECTIVES)}")
+        if (step is not None and step <= 0) or min_step <= 0:
+            raise ValueError("Amount steps must be positive")
+        self.scenario = {**SCENARIO_DEFAULTS, **scenario, 'regular_early_repayment': 0, 'arbitrary_early_repayments': []}
+        self.objective = objective
+        self.min_step = min_step
+        self.max_iterations = max_iterations  # per grid step
+        self.calculator = MortgageBatchCalculator(**{name: self.scenario[name] for name in MORTGAGE_PARAMETERS if name in self.scenario})
+        if self.calculator.n_scenarios != 1:
+            raise ValueError("Optimize one scenario at a time")
+
+        # Repayment dates: every anniversary of the first early repayment date within the loan term
+        total_months = int(self.calculator.total_months[0])
+        events = EventSchedule(self.calculator.start_date, total_months)
+        dates = [self.calculator.get_payment_date(self.calculator.first_regular_early_repayment_date, 12 * year) for year in range(self.calculator.total_years[0] + 1)]
+        dates = [date for date in dates if date >= self.calculator.start_date and events.month_index(date) < total_months]
+        self.dates = [date.strftime('%Y-%m-%d') for date in dates]
+        self.months = np.array([events.month_index(date) for date in dates], dtype=int)
+
+        cap = self.calculator.principal[0] * self.calculator.max_early_repayment_percent[0]
+        self.max_amount = self.calculator.principal[0] if self.calculator.allow_exceed_early_repayment_limit[0] else cap
+        self.step = step or self.max_amount / 10
+        self.evaluations = 0
+        self.batches = 0
+
+    def evaluate(self, amounts, columns=('Investments', 'Net Worth')):
+        """ Payment plan and totals of candidate schedules, one row of yearly amounts per candidate, simulated in one batch. """
+        amounts = np.atleast_2d(amounts)
+        calculator = self.calculator.select(np.zeros(len(amounts), dtype=int))
+        calculator.arbitrary_early_repayments = [{'date': date, 'amount': amounts[:, year]} for year, date in enumerate(self.dates)]
+        self.evaluations += len(amounts)
+        self.batches += 1
+        return calculator.generate_payment_plan(self.scenario['monthly_salary'], self.scenario['monthly_expenses'], self.scenario['initial_savings'], columns=list(columns))
+
+    def score(self, amounts):
+        """ Objective of candidate schedules (larger is better), -inf where the investment balance goes negative. """
+        payment_plan, total_interest_paid, _, _, _, net_worth_progression, _ = self.evaluate(amounts)
+        objective = net_worth_progression['Net Worth'][:, -1] if self.objective == 'net_worth' else -total_interest_paid
+        return np.where(payment_plan['Investments'].min(axis=1) >= 0, objective, -np.inf)
+
+    def search(self, amounts, step, values):
+        """ Improve amounts by changing years to the given values (an array per year); returns the new amounts and score. """
+        current = self.score(amounts)[0]
+        for _ in range(self.max_iterations):
+            # One candidate per year and value, differing from the current amounts in that year only
+            proposals = values(amounts, step)
+            years = np.concatenate([np.full(len(year_values), year) for year, year_values in enumerate(proposals)])
+            candidates = np.tile(amounts, (len(years), 1))
+            candidates[np.arange(len(years)), years] = np.concatenate(proposals)
+            changed = candidates[np.arange(len(years)), years] != amounts[years]
+            candidates, years = candidates[changed], years[changed]
+            if not len(candidates):
+                break
+            scores = self.score(candidates)
+            improves = scores > current + 1e-9 * max(abs(current), 1)
+            if not improves.any():
+                break
+
+            # Best change of every year, all applied at once, against the single best change
+            best = np.argmax(scores)
+            combined = amounts.copy()
+            for year in np.unique(years[improves]):
+                members = np.flatnonzero(improves & (years == year))
+                combined[year] = candidates[members[np.argmax(scores[members])], year]
+            combined_score = self.score(combined)[0]
+            if combined_score > scores[best]:
+                amounts, current = combined, combined_score
+            else:
+                amounts, current = candidates[best], scores[best]
+        return amounts, current
+
+    @_timed('optimize.run')
+    def run(self):
+        """ Best yearly early repayments found.
+
+        Returns a dict: the repayment 'dates' and 'amounts' actually repaid, the matching 'arbitrary_early_repayments'
+        (the non-zero ones, to pass to MortgageCalculator), the final 'net_worth', 'total_interest_paid' and
+        'total_early_repayment_fees' with them, the same for no early repayments ('baseline_net_worth',
+        'baseline_total_interest_paid'), and the number of simulated 'evaluations' and 'batches'.
+        """
+        n_years = len(self.dates)
+        amounts = np.zeros(n_years)
+        if not np.isfinite(self.score(amounts)[0]):
+            raise ValueError("The investment balance goes negative even without early repayments")
+
+        # Nothing to search without repayment dates or with a cap of zero: the result is the baseline
+        if n_years and self.max_amount > 0:
+            # Coarse pass over the whole grid, then refinements around the current amounts
+            grid = np.unique(np.r_[np.arange(0, self.max_amount, self.step), self.max_amount])
+            amounts, _ = self.search(amounts, self.step, lambda amounts, step: [grid] * n_years)
+            step = self.step / 2
+            while step >= self.min_step:
+                amounts, _ = self.search(amounts, step, lambda amounts, step: [np.clip(amount + step * np.array([-2, -1, 1, 2]), 0, self.max_amount) for amount in amounts])
+                step /= 2
+
+        # Report what was repaid: amounts past the payoff or above the investment balance are cut by the calculator
+        payment_plan, total_interest_paid, _, _, total_early_repayment_fees, net_worth_progression, _ = self.evaluate(
+            np.vstack([amounts, np.zeros(n_years)]), columns=('Early Repayment', 'Net Worth'))
+        repaid = payment_plan['Early Repayment'][0, self.months]
+        return {
+            'dates': list(self.dates),
+            'amounts': repaid,
+            'arbitrary_early_repayments': [{'date': date, 'amount': amount} for date, amount in zip(self.dates, repaid.tolist()) if amount > 0],
+            'net_worth': net_worth_progression['Net Worth'][0, -1].item(),
+            'total_interest_paid': total_interest_paid[0].item(),
+            'total_early_repayment_fees': total_early_repayment_fees[0].item(),
+            'baseline_net_worth': net_worth_progression['Net Worth'][1, -1].item(),
+            'baseline_total_interest_paid': total_interest_paid[1].item(),
+            'evaluations': self.evaluations,
+            'batches': self.batches,
+        }
+
+
+@_timed('compare.merge')
+def compare_net_worth(mortgage_net_worth_progression, balance_progression):
+    """ DataFrame of both net worth progressions side by side, merged on the date. """
+    import pandas as pd
+    mortgage_net_worth_df = mortgage_net_worth_progression.to_dataframe().rename(columns={'Net Worth': 'Net Worth (Mortgage)'})
+    rent_invest_net_worth_df = balance_progression.to_dataframe().rename(columns={'Balance': 'Net Worth (Rent & Invest)'})
+    return pd.merge(mortgage_net_worth_df[['Date', 'Net Worth (Mortgage)']], rent_invest_net_worth_df[['Date', 'Net Worth (Rent & Invest)']], on='Date', how='outer')
+
+
+@_timed('table.style')
+def style_comparison(comparison_df):
+    """ Styler of the net worth comparison table. """
+    import pandas as pd
+    styled_comparison_df = comparison_df.style.set_table_styles([
+        {'selector': 'thead th', 'props': [('font-size', '14pt'), ('border', '1px solid black'), ('font-weight', 'bold'), ('text-align', 'center'), ('vertical-align', 'middle')]},
+        {'selector': 'tbody tr:nth-child(odd)', 'props': [('background-color', '#f2f2f2')]}
+    ]).set_properties(**{'border': '1px solid black', 'color': 'black', 'background-color': 'white'}) \
+      .set_properties(subset=['Date'], **{'white-space': 'nowrap'}) \
+      .format("{:,.2f}", subset=pd.IndexSlice[:, comparison_df.columns.drop('Date')]) \
+      .set_table_styles({'Date': [{'selector': 'td', 'props': [('text-align', 'center')]}]}, overwrite=False)
+
+    return styled_comparison_df.set_properties(**{'border': '1px solid black'}).set_table_styles(
+        [{'selector': 'thead th', 'props': [('font-weight', 'bold'), ('text-align', 'center'), ('border-bottom', '1px solid black')]},
+         {'selector': 'tbody tr:nth-child(odd)', 'props': [('background-color', '#f2f2f2')]}]
+    ).set_table_attributes('border="1" cellpadding="3" cellspacing="0" style="border-collapse: collapse"')
+
+
+class StreamingSimulation:
+    """ Simulation of both strategies at daily, weekly or monthly steps, yielded step by step.
+
+    The loan side follows the monthly payment plan (early repayments are capped as in the monthly simulation);
+    between payment dates both investment accounts accrue interest every step. The mortgage side keeps its nominal
+    monthly rate compounded daily and the rent & invest side its effective annual rate. With income_step='weekly'
+    salary and expenses arrive every 7 days after the start date as 12/52 of the monthly amounts. Each side runs for
+    its own horizon and then keeps its final balances. Rows are produced as the simulation runs and both monthly
+    simulations advance WINDOW_MONTHS at a time, so memory does not grow with the horizon or the number of steps.
+    With step='monthly' the rows reproduce the payment plan and balance progression of the monthly calculators.
+    """
+    STEP_DAYS = {'daily': 1, 'weekly': 7, 'monthly': None}
+    COLUMNS = ['Investments', 'Mortgage Balance', 'Net Worth (Mortgage)', 'Net Worth (Rent & Invest)', 'Interest (Mortgage)', 'Interest (Rent & Invest)']
+    INTEREST_COLUMNS = [4, 5]  # summed by aggregation; the other columns keep their value at the end of the period
+    WINDOW_MONTHS = 12
+
+    def __init__(self, mortgage_calculator, rent_invest_calculator, monthly_salary, monthly_expenses, initial_savings, step='daily', income_step='monthly'):
+        if step not in self.STEP_DAYS:
+            raise ValueError(f"step must be one of {', '.join(self.STEP_DAYS)}, got {step!r}")
+        if income_step not in ('monthly', 'weekly'):
+            raise ValueError(f"income_step must be 'monthly' or 'weekly', got {income_step!r}")
+        self.mortgage_calculator = mortgage_calculator
+        self.rent_invest_calculator = rent_invest_calculator
+        self.monthly_salary = monthly_salary
+        self.monthly_expenses = monthly_expenses
+        self.initial_savings = initial_savings
+        self.step = step
+        self.income_step = income_step
+
+    def payment_date(self, month):
+        return self.mortgage_calculator.get_payment_date(self.mortgage_calculator.start_date, month)
+
+    def step_dates(self, last_month):
+        """ Dates of all steps: every payment date for monthly steps, otherwise every step_days days up to and including the last payment date. """
+        if self.step == 'monthly':
+            for month in range(last_month + 1):
+                yield self.payment_date(month)
+            return
+        date, end, step = self.payment_date(0), self.payment_date(last_month), timedelta(days=self.STEP_DAYS[self.step])
+        while date < end:
+            yield date
+            date += step
+        yield end
+
+    def mortgage_payments(self):
+        """ (payments sum, mortgage balance) of every month of the loan, simulated WINDOW_MONTHS at a time. """
+        calculator = self.mortgage_calculator
+        total_months = calculator.total_years * 12
+        payment_plan = Schedule.allocate(calculator.PAYMENT_PLAN_COLUMNS, self.WINDOW_MONTHS, calculator.start_date)
+        net_worth_progression = Schedule.allocate(calculator.NET_WORTH_COLUMNS, self.WINDOW_MONTHS, calculator.start_date)
+        state = calculator.initial_state(self.initial_savings)
+        for first_month in range(0, total_months, self.WINDOW_MONTHS):
+            end_month = min(first_month + self.WINDOW_MONTHS, total_months)
+            events = calculator.build_events(end_month, first_month=first_month)
+            state = calculator.simulate_months(state, self.monthly_salary, self.monthly_expenses, events, payment_plan, net_worth_progression, end_month=end_month)
+            rows = end_month - first_month
+            yield from zip(payment_plan['Payments Sum'][:rows].tolist(), payment_plan['Mortgage Balance'][:rows].tolist())
+
+    def rent_events(self):
+        """ (interest due, rent due, apartment change) of every month 1 to years * 12 of the rent & invest side, built WINDOW_MONTHS at a time. """
+        calculator = self.rent_invest_calculator
+        total_months = calculator.years * 12
+        for first_month in range(1, total_months + 1, self.WINDOW_MONTHS):
+            events = calculator.build_events(min(first_month + self.WINDOW_MONTHS - 1, total_months), first_month=first_month)
+            yield from zip(events.occurs('interest_due'), events.occurs('rent_due'), events.occurs('apartment_change'))
+
+    def __iter__(self):
+        """ (date, *COLUMNS) after every step. """
+        mortgage_calculator, rent_invest_calculator = self.mortgage_calculator, self.rent_invest_calculator
+        total_months, rent_months = mortgage_calculator.total_years * 12, rent_invest_calculator.years * 12
+        last_month = max(total_months, rent_months)
+        mortgage_payments, rent_events = self.mortgage_payments(), self.rent_events()
+        _count('months_simulated', rent_months)
+
+        monthly = self.step == 'monthly'
+        weekly_income = self.income_step == 'weekly'
+        mortgage_rate = mortgage_calculator.annual_investment_rate  # monthly
+        mortgage_daily_rate = mortgage_rate * 12 / 365
+        rent_rate = rent_invest_calculator.annual_interest_rate  # effective annual
+        rent_monthly_rate = (1 + rent_rate) ** (1/12) - 1
+        property_value = mortgage_calculator.property_price * mortgage_calculator.property_value_factor
+        net_monthly_income = self.monthly_salary - self.monthly_expenses
+        rent_top_up = rent_invest_calculator.monthly_salary - rent_invest_calculator.monthly_expenses
+        ejari_fee = (rent_invest_calculator.annual_rent * rent_invest_calculator.ejari_fee_rate) / 12
+        week = timedelta(days=7)
+        # Past its last payment date a side keeps its balances: no more interest or income
+        mortgage_end, rent_end = self.payment_date(total_months), self.payment_date(rent_months)
+
+        investments = self.initial_savings - (mortgage_calculator.property_price - mortgage_calculator.principal) - mortgage_calculator.calculate_initial_costs(mortgage_calculator.property_price)
+        rent_balance = rent_invest_calculator.initial_amount
+        remaining_principal = mortgage_calculator.principal
+        month = 0
+        month_date = self.payment_date(0)
+        next_income = month_date + week
+        previous = None
+        for date in self.step_dates(last_month):
+            mortgage_interest = rent_interest = 0
+            if previous is not None and not monthly:
+                if previous < mortgage_end:
+                    mortgage_interest = investments * ((1 + mortgage_daily_rate) ** (min(date, mortgage_end) - previous).days - 1)
+                    investments += mortgage_interest
+                if previous < rent_end:
+                    rent_interest = rent_balance * ((1 + rent_rate) ** ((min(date, rent_end) - previous).days / 365) - 1)
+                    rent_balance += rent_interest
+            previous = date
+
+            while weekly_income and next_income <= date:
+                if next_income <= mortgage_end:
+                    investments += net_monthly_income * 12 / 52
+                if next_income <= rent_end:
+                    rent_balance += rent_top_up * 12 / 52
+                next_income += week
+
+            # Payment dates in this step: mortgage month `month` and rent & invest month `month` (which starts at 1)
+            while month <= last_month and month_date <= date:
+                if month < total_months:
+                    payment, remaining_principal = next(mortgage_payments)
+                    investment_interest = investments * mortgage_rate if monthly and month > 0 else 0
+                    mortgage_interest += investment_interest
+                    investments += (0 if weekly_income else net_monthly_income) - payment + investment_interest
+                if 0 < month <= rent_months:
+                    interest_due, rent_due, apartment_change = next(rent_events)
+                    if monthly and interest_due:
+                        interest = rent_balance * rent_monthly_rate
+                        rent_balance += interest
+                        rent_interest += interest
+                    if not weekly_income:
+                        rent_balance += rent_top_up
+                    if rent_due:
+                        if apartment_change:
+                            rent_payment = (rent_invest_calculator.annual_rent / rent_invest_calculator.rent_cheques) + (rent_invest_calculator.annual_rent * rent_invest_calculator.agency_fee_rate)
+                            move_in_costs = rent_invest_calculator.move_in_costs
+                        else:
+                            rent_payment = rent_invest_calculator.annual_rent / rent_invest_calculator.rent_cheques
+                            move_in_costs = 0
+                        rent_balance -= (rent_payment + move_in_costs)
+                    rent_balance -= ejari_fee
+                month += 1
+                month_date = self.payment_date(month)
+
+            yield (date, investments, remaining_principal, property_value - remaining_principal + investments, rent_balance, mortgage_interest, rent_interest)
+
+    def rows(self, aggregate=None):
+        """ Rows of every step, or with aggregate='monthly'/'yearly' one row per calendar month/year: the last step's values with interest summed. """
+        if aggregate is None:
+            yield from self
+            return
+        if aggregate not in ('monthly', 'yearly'):
+            raise ValueError(f"aggregate must be None, 'monthly' or 'yearly', got {aggregate!r}")
+        period, last, interest = None, None, [0.0, 0.0]
+        for row in self:
+            key = (row[0].year, row[0].month) if aggregate == 'monthly' else row[0].year
+            if key != period and last is not None:
+                yield last[:5] + tuple(interest)
+                interest = [0.0, 0.0]
+            period, last = key, row
+            interest[0] += row[5]
+            interest[1] += row[6]
+        if last is not None:
+            yield last[:5] + tuple(interest)
+
+    def chunks(self, chunk_size=4096, aggregate=None):
+        """ Columns of up to chunk_size rows at a time, as {'Date': ..., column: array} dicts. """
+        rows = self.rows(aggregate)
+        while True:
+            block = list(itertools.islice(rows, chunk_size))
+            if not block:
+                return
+            values = np.array([row[1:] for row in block])
+            _count('rows_materialized', len(block))
+            yield {'Date': np.array([row[0].strftime('%Y-%m-%d') for row in block]), **{column: values[:, i] for i, column in enumerate(self.COLUMNS)}}
+
+    @_timed('stream.write')
+    def write(self, path, aggregate=None, chunk_size=4096):
+        """ Stream the rows to a CSV file, or a Parquet file (needs pyarrow) when path ends in .parquet; returns the row count. """
+        n_rows = 0
+        if path.lower().endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            writer = None
+            try:
+                for chunk in self.chunks(chunk_size, aggregate):
+                    table = pa.table(chunk)
+                    writer = writer or pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table)
+                    n_rows += len(chunk['Date'])
+            finally:
+                if writer is not None:
+                    writer.close()
+            return n_rows
+
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Date'] + self.COLUMNS)
+            for chunk in self.chunks(chunk_size, aggregate):
+                writer.writerows(zip(chunk['Date'].tolist(), *[chunk[column].tolist() for column in self.COLUMNS]))
+                n_rows += len(chunk['Date'])
+        return n_rows
+
+
+class ChartExporter:
+    """ Writes the report charts to PNG or SVG files without pyplot, for batch reports.
+
+    Figures are plain matplotlib Figures, so no GUI backend or global figure registry is involved. Months are
+    placed on a numeric axis in years, the payment plan is drawn as stacked step areas instead of one bar per
+    month and component, and with yearly=True every series is reduced to one point per calendar year first.
+    """
+    PAYMENT_COMPONENTS = ['Principal', 'Interest', 'Insurance', 'Maint']
+
+    def __init__(self, output_dir, output_format='png', yearly=False, dpi=100, figsize=(18, 10)):
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.yearly = yearly
+        self.dpi = dpi
+        self.figsize = figsize
+
+    def series(self, schedule):
+        """ (x positions in years, columns) of a schedule, with one point per calendar year when yearly. """
+        if self.yearly:
+            table, _ = aggregate_yearly(schedule)
+            return table['Year'].astype(float), table
+        return schedule.start_date.year + (schedule.start_date.month - 1 + schedule.month) / 12, schedule
+
+    def axes(self, title, ylabel):
+        from matplotlib.figure import Figure
+        import matplotlib.ticker as mticker
+        figure = Figure(figsize=self.figsize)
+        ax = figure.add_subplot()
+        ax.set_title(title)
+        ax.set_xlabel('Year')
+        ax.set_ylabel(ylabel)
+        ax.xaxis.set_major_locator(mticker.MultipleLocator(1))
+        ax.xaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f'{x:.0f}'))
+        ax.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f'{x:,.2f}'))
+        ax.tick_params(axis='x', labelrotation=90)
+        ax.grid(True)
+        return figure, ax
+
+    def save(self, figure, name):
+        """ Write the figure and release its artists; returns the file path. """
+        path = os.path.join(self.output_dir, f'{name}.{self.output_format}')
+        figure.savefig(path, format=self.output_format, dpi=self.dpi)
+        figure.clear()
+        _count('charts_exported')
+        return path
+
+    @_timed('chart.payment_plan')
+    def payment_plan(self, payment_plan, name='payment_plan'):
+        x, table = self.series(payment_plan)
+        edges = np.r_[x, x[-1] + (1 if self.yearly else 1 / 12)]
+        figure, ax = self.axes('Mortgage Payment Plan', 'Amount (AED)')
+        bottom = np.zeros(len(edges))
+        for column in self.PAYMENT_COMPONENTS:
+            top = bottom + np.r_[table[column], table[column][-1]]
+            ax.fill_between(edges, bottom, top, step='post', label=column, linewidth=0)
+            bottom = top
+        ax.legend(title='Components', loc='upper right')
+        return self.save(figure, name)
+
+    @_timed('chart.net_worth_progression')
+    def net_worth_progression(self, net_worth_progression, name='net_worth_progression'):
+        x, table = self.series(net_worth_progression)
+        figure, ax = self.axes('Net Worth Progression', 'Amount (AED)')
+        for column in ['Net Worth', 'Investment Balance', 'Property Value', 'Debts']:
+            ax.plot(x, table[column], label=column, linewidth=2)
+        ax.legend(title='Components', loc='upper left')
+        return self.save(figure, name)
+
+    @_timed('chart.balance_progression')
+    def balance_progression(self, balance_progression, name='balance_progression'):
+        x, table = self.series(balance_progression)
+        figure, ax = self.axes('Investment Balance Progression', 'Balance (AED)')
+        ax.plot(x, table['Balance'], label='Investment Balance', linewidth=2)
+        ax.legend(title='Components', loc='upper left')
+        return self.save(figure, name)
+
+    @_timed('chart.comparison')
+    def comparison(self, net_worth_progression, balance_progression, name='comparison'):
+        figure, ax = self.axes('Net Worth Comparison', 'Amount (AED)')
+        for schedule, column, label in ((net_worth_progression, 'Net Worth', 'Net Worth (Mortgage)'), (balance_progression, 'Balance', 'Net Worth (Rent & Invest)')):
+            x, table = self.series(schedule)
+            ax.plot(x, table[column], label=label, linewidth=2)
+        ax.legend(title='Components', loc='upper left')
+        return self.save(figure, name)
+
+    def export(self, payment_plan, net_worth_progression, balance_progression, prefix=''):
+        """ Write all four charts, named with the given prefix; returns their paths. """
+        return [self.payment_plan(payment_plan, prefix + 'payment_plan'), self.net_worth_progression(net_worth_progression, prefix + 'net_worth_progression'),
+                self.balance_progression(balance_progression, prefix + 'balance_progression'),
+                self.comparison(net_worth_progression, balance_progression, prefix + 'comparison')]
+
+
+def build_calculators(scenario):
+    """ MortgageCalculator and Rent_And_Invest_Calculator of one scenario, paired as in evaluate_scenarios. """
+    mortgage_calculator = MortgageCalculator(**{name: scenario[name] for name in MORTGAGE_PARAMETERS if name in scenario})
+    rent_invest_calculator = Rent_And_Invest_Calculator(
+        scenario['initial_savings'], annual_interest_rate=scenario.get('annual_investment_rate', 4.5), years=scenario['total_years'],
+        monthly_salary=scenario['monthly_salary'], monthly_expenses=scenario['monthly_expenses'], start_date=scenario.get('start_date', '2084-01-01'),
+        **{name: scenario[name] for name in RENT_PARAMETERS if name in scenario})
+    return mortgage_calculator, rent_invest_calculator
+
+
+def _export_scenario_charts(exporter, scenario, prefix):
+    """ Worker: simulate one scenario and export its charts. """
+    mortgage_calculator, rent_invest_calculator = build_calculators(scenario)
+    payment_plan, _, _, _, _, net_worth_progression, _ = mortgage_calculator.generate_payment_plan(
+        scenario['monthly_salary'], scenario['monthly_expenses'], scenario['initial_savings'])
+    balance_progression = rent_invest_calculator.calculate_investment()[0]
+    return exporter.export(payment_plan, net_worth_progression, balance_progression, prefix)
+
+
+def export_scenario_charts(base, rows, output_dir, output_format='png', yearly=False, workers=None):
+    """ Export the charts of every scenario row, on top of the example values and base, and return their paths per row.
+
+    Files are named <row number>_<chart>.<format>. Scenarios are rendered in a process pool with at most two
+    scenarios per worker in flight, so memory stays bounded for any number of rows.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    base = {**EXAMPLE_SCENARIO, **base}
+    exporter = ChartExporter(output_dir, output_format, yearly)
+    jobs = [({**base, **row}, f'{index:05d}_') for index, row in enumerate(rows)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [_export_scenario_charts(exporter, scenario, prefix) for scenario, prefix in jobs]
+
+    paths = [None] * len(jobs)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        for index, (scenario, prefix) in enumerate(jobs):
+            in_flight[executor.submit(_export_scenario_charts, exporter, scenario, prefix)] = index
+            if len(in_flight) < 2 * workers:  # Bound the number of scenarios held in memory
+                continue
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                paths[in_flight.pop(future)] = future.result()
+        for future in concurrent.futures.as_completed(in_flight):
+            paths[in_flight[future]] = future.result()
+    return paths
+
+
+def run_example():
+    """ Print the tables and show the plots for the example values at the top of this module. """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as mticker
+    import seaborn as sns
+
+    mortgage_calculator = MortgageCalculator(principal, initial_rate, initial_years, later_rate, total_years, property_price, property_size, maintenance_fees_rate, maintenance_fees_interval, life_insurance_rate, property_insurance_rate, insurance_payment_interval, annual_investment_rate, regular_early_repayment, regular_early_repayment_interval, property_value_factor, valuation_fee, conveyance_fee, bank_mortgage_opening_fee_rate, max_early_repayment_percent, start_date, first_regular_early_repayment_date, allow_exceed_early_repayment_limit, arbitrary_early_repayments)
+    payment_plan, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, mortgage_net_worth_progression, highlight_row = mortgage_calculator.generate_payment_plan(monthly_salary, monthly_expenses, initial_savings)
+    mortgage_calculator.print_payment_plan(payment_plan, total_interest_paid, highlight_row, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, monthly_salary)
+    mortgage_calculator.plot_payment_plan(payment_plan)
+    mortgage_calculator.plot_net_worth_progression(mortgage_net_worth_progression)
+
+    # Investment and rent comparison
+    rent_invest_calculator = Rent_And_Invest_Calculator(initial_amount, annual_interest_rate=annual_investment_rate, annual_rent=annual_rent, rent_cheques=rent_cheques, years=years, monthly_salary=monthly_salary, monthly_expenses=monthly_expenses, change_apartment_interval=change_apartment_interval, move_in_costs=move_in_costs, start_date=start_date)
+    balance_progression, final_balance, total_rental_costs, total_earned_interest = rent_invest_calculator.calculate_investment()
+    rent_invest_calculator.print_balance_progression(balance_progression, final_balance, total_rental_costs, total_earned_interest)
+    rent_invest_calculator.plot_balance_progression(balance_progression)
+
+    # Compare net worth progression side-by-side
+    comparison_df = compare_net_worth(mortgage_net_worth_progression, balance_progression)
+
+    print("\n------ Comparison of Net Worth Progression ------\n")
+    _display_table(TableRenderer(comparison_df, index_start=0))
+
+    # Plot net worth comparison
+    with _stage('plot.comparison'):
+        plt.figure(figsize=(18, 10))
+        sns.lineplot(data=comparison_df, x='Date', y='Net Worth (Mortgage)', label='Net Worth (Mortgage)', linewidth=2)
+        sns.lineplot(data=comparison_df, x='Date', y='Net Worth (Rent & Invest)', label='Net Worth (Rent & Invest)', linewidth=2)
+        plt.xlabel('Date')
+        plt.ylabel('Amount (AED)')
+        plt.title('Net Worth Comparison')
+        plt.legend(title='Components', loc='upper left')
+        plt.xticks(np.arange(0, len(comparison_df['Date']) + 1, step=12), rotation=90)  # Add steps between months and rotate labels
+        plt.ticklabel_format(style='plain', axis='y')  # Show full values
+        plt.gca().yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f'{x:,.2f}'))
+        plt.grid(True)
+        plt.show()
+
+
+class InteractiveDashboard:
+    """ Notebook mode: widgets for the calculator inputs that recompute and redraw only what an edit affects.
+
+    Mortgage inputs re-simulate the payment plan with IncrementalPaymentPlan, from the first month the edit can affect;
+    rent inputs only re-run the rent & invest side; salary, expenses, savings, the investment rate, the term and the
+    start date affect both. The charts of run_example share one figure whose bars and lines are created once and
+    updated in place: they are blitted over the saved axes. The x axes span the longest term of the term slider and
+    term edits only ever widen the y limits, so browsing terms blits; the exception is an edit whose data outgrows the
+    y limits of an axis (or, for other inputs, fills less than half of them), which redraws the whole figure once.
+    Tables render only the page being shown. Use `%matplotlib widget` (ipympl) for in-place
+    figure updates; other backends show a new image of the figure after every edit, which renders the whole figure.
+    """
+    # (minimum, maximum, step) of every input with a slider; whole-valued inputs get integer sliders
+    WIDGETS = {
+        'property_price': (200000, 10000000, 10000), 'principal': (0, 8000000, 10000), 'initial_rate': (0, 15, 0.05), 'initial_years': (0, 10, 1),
+        'later_rate': (0, 15, 0.05), 'total_years': (5, 30, 1), 'regular_early_repayment': (0, 500000, 1000), 'max_early_repayment_percent': (0, 100, 1),
+        'annual_investment_rate': (0, 15, 0.1), 'monthly_salary': (0, 200000, 500), 'monthly_expenses': (0, 200000, 500), 'initial_savings': (0, 10000000, 10000),
+        'annual_rent': (10000, 1000000, 1000), 'change_apartment_interval': (1, 10, 1), 'move_in_costs': (0, 50000, 500),
+    }
+    # Inputs of the rent & invest side besides RENT_PARAMETERS
+    RENT_INPUTS = ['initial_savings', 'annual_investment_rate', 'total_years', 'monthly_salary', 'monthly_expenses', 'start_date']
+    PAYMENT_COLUMNS = ['Principal', 'Interest', 'Insurance', 'Maint']
+    NET_WORTH_COLUMNS = [('Net Worth', 'Net Worth'), ('Investment Balance', 'Investment Balance'), ('Property Value', 'Property Value'), ('Debts', 'Debts')]
+    TABLES = ['Mortgage Payment Plan', 'Rent & Invest Balance Progression', 'Net Worth Comparison']
+
+    def __init__(self, scenario=None, figsize=(18, 12), page_size=120):
+        self.scenario = {**SCENARIO_DEFAULTS, **EXAMPLE_SCENARIO, **(scenario or {})}
+        self.figsize = figsize
+        self.page_size = page_size
+        self.plan = IncrementalPaymentPlan({name: self.scenario[name] for name in MORTGAGE_PARAMETERS},
+                                           *[self.scenario[name] for name in CASH_FLOW_PARAMETERS])
+        self.mortgage_result = self.plan.result
+        self.rent_result = self.simulate_rent()
+        self.figure = None
+        self.table = self.TABLES[0]
+        self.page = 0
+        self.last_update_seconds = None
+
+    def simulate_rent(self):
+        scenario = self.scenario
+        calculator = Rent_And_Invest_Calculator(
+            scenario['initial_savings'], annual_interest_rate=scenario['annual_investment_rate'], years=scenario['total_years'], monthly_salary=scenario['monthly_salary'],
+            monthly_expenses=scenario['monthly_expenses'], start_date=scenario['start_date'], **{name: scenario[name] for name in RENT_PARAMETERS})
+        return calculator.calculate_investment_fast()
+
+    @_timed('dashboard.update')
+    def update(self, **changes):
+        """ Apply edited inputs, recompute the affected side(s) and update the figure; returns the names of the recomputed parts. """
+        start = time.perf_counter()
+        changed = [name for name, value in changes.items() if value != self.scenario.get(name)]
+        self.scenario.update(changes)
+        recomputed = []
+        mortgage_changes = {name: self.scenario[name] for name in changed if name in MORTGAGE_PARAMETERS + CASH_FLOW_PARAMETERS}
+        if mortgage_changes:
+            self.mortgage_result = self.plan.update(**mortgage_changes)
+            recomputed.append('mortgage')
+        if any(name in RENT_PARAMETERS + self.RENT_INPUTS for name in changed):
+            self.rent_result = self.simulate_rent()
+            recomputed.append('rent')
+        if recomputed and self.figure is not None:
+            # A shorter term shows a shorter stretch of the same curves: keep the limits of the longer one
+            self.draw(mortgage='mortgage' in recomputed, rent='rent' in recomputed, shrink='total_years' not in changed)
+        self.last_update_seconds = time.perf_counter() - start
+        return recomputed
+
+    def build_figure(self, blit=True):
+        """ Figure with the payment plan, both net worth progressions and the comparison; artists are created once.
+
+        blit=False draws the data with the rest of the figure, for backends that show static images of it.
+        """
+        import matplotlib.pyplot as plt
+        import matplotlib.ticker as mticker
+        self.figure, axes = plt.subplots(2, 2, figsize=self.figsize)
+        self.axes = dict(zip(['payment_plan', 'net_worth_progression', 'balance_progression', 'comparison'], axes.flat))
+        # Months 0 to the longest term of the slider on the x axes, so that term edits do not change them
+        self.months_shown = 12 * max(self.WIDGETS['total_years'][1], self.scenario['total_years']) + 1
+        for (name, ax), title in zip(self.axes.items(), ['Mortgage Payment Plan', 'Net Worth Progression', 'Investment Balance Progression', 'Net Worth Comparison']):
+            ax.set_title(title)
+            ax.set_ylabel('Amount (AED)')
+            ax.grid(True)
+            ax.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f'{x:,.0f}'))
+            # x is the month number; label whole years with the calendar year
+            ax.xaxis.set_major_locator(mticker.MultipleLocator(12 * 5))
+            ax.xaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: str(self.plan.calculator.start_date.year + int(x) // 12)))
+            ax.set_xlim(-0.5, self.months_shown - 0.5)
+
+        # Data artists are animated: a full draw renders the axes, then they are blitted on top of the saved background
+        self.blit = blit
+        animated = blit
+        self.bars = [self.axes['payment_plan'].stairs([0], [0, 1], baseline=0, fill=True, label=column, animated=animated) for column in self.PAYMENT_COLUMNS]
+        self.lines = {}
+        for column, label in self.NET_WORTH_COLUMNS:
+            self.lines['net_worth_progression', column] = self.axes['net_worth_progression'].plot([], [], label=label, linewidth=2, animated=animated)[0]
+        self.lines['balance_progression', 'Balance'] = self.axes['balance_progression'].plot([], [], label='Investment Balance', linewidth=2, animated=animated)[0]
+        self.lines['comparison', 'Mortgage'] = self.axes['comparison'].plot([], [], label='Net Worth (Mortgage)', linewidth=2, animated=animated)[0]
+        self.lines['comparison', 'Rent'] = self.axes['comparison'].plot([], [], label='Net Worth (Rent & Invest)', linewidth=2, animated=animated)[0]
+        self.background = None
+        if blit:
+            self.figure.canvas.mpl_connect('draw_event', self.on_draw)
+        for ax in self.axes.values():
+            ax.legend(title='Components', loc='upper left')
+        self.figure.tight_layout()
+        self.draw(mortgage=True, rent=True)
+        return self.figure
+
+    def on_draw(self, event):
+        """ After a full draw: keep the background without the data and draw the data on top. """
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        for artist in self.bars + list(self.lines.values()):
+            self.figure.draw_artist(artist)
+
+    def fit_limits(self, ax, low, high, shrink=True):
+        """ Keep the y limits of an axis while the data fits and (with shrink) fills at least half of them, else set new ones with headroom; returns whether they changed. """
+        y0, y1 = ax.get_ylim()
+        if y0 <= low and high <= y1 and (not shrink or high - low >= (y1 - y0) / 2):
+            return False
+        margin = 0.25 * (high - low) or 1.0
+        ax.set_ylim(min(low - margin, 0), high + margin)
+        return True
+
+    def draw(self, mortgage=True, rent=True, shrink=True):
+        """ Set the data of the affected artists and blit them; the whole figure is only redrawn when limits change. """
+        with _stage('dashboard.draw'):
+            ranges = {}  # axis -> (months, low, high) of its new data
+            if mortgage:
+                payment_plan, net_worth_progression = self.mortgage_result[0], self.mortgage_result[5]
+                months = np.arange(len(payment_plan))
+                # Monthly stacked bars as one filled step patch per component instead of a rectangle per month
+                edges = np.arange(len(months) + 1) - 0.5
+                bottom = np.zeros(len(months))
+                for column, patch in zip(self.PAYMENT_COLUMNS, self.bars):
+                    top = bottom + payment_plan[column]
+                    patch.set_data(top, edges, baseline=bottom)
+                    bottom = top
+                ranges['payment_plan'] = (len(months), 0.0, bottom.max())
+                for column, _ in self.NET_WORTH_COLUMNS:
+                    self.lines['net_worth_progression', column].set_data(months, net_worth_progression[column])
+                values = [net_worth_progression[column] for column, _ in self.NET_WORTH_COLUMNS]
+                ranges['net_worth_progression'] = (len(months), min(values.min() for values in values), max(values.max() for values in values))
+                # Rent & invest month n falls on the date of mortgage month n, as in compare_net_worth
+                self.lines['comparison', 'Mortgage'].set_data(months, net_worth_progression['Net Worth'])
+            if rent:
+                balance_progression = self.rent_result[0]
+                self.lines['balance_progression', 'Balance'].set_data(np.arange(len(balance_progression)), balance_progression['Balance'])
+                self.lines['comparison', 'Rent'].set_data(balance_progression.month, balance_progression['Balance'])
+                ranges['balance_progression'] = (len(balance_progression), balance_progression['Balance'].min(), balance_progression['Balance'].max())
+            if mortgage or rent:
+                comparison = [line.get_ydata() for line in (self.lines['comparison', 'Mortgage'], self.lines['comparison', 'Rent'])]
+                ranges['comparison'] = (len(comparison[0]) + 1, min(values.min() for values in comparison), max(values.max() for values in comparison))
+
+            rescaled = [self.fit_limits(self.axes[name], low, high, shrink) for name, (_, low, high) in ranges.items()]
+            # Only a term beyond the slider (set from code) widens the x axes
+            months = max(n_months for n_months, _, _ in ranges.values()) if ranges else 0
+            widened = months > self.months_shown
+            if widened:
+                self.months_shown = months
+                for ax in self.axes.values():
+                    ax.set_xlim(-0.5, self.months_shown - 0.5)
+            canvas = self.figure.canvas
+            if any(rescaled) or widened or not self.blit or self.background is None or not canvas.supports_blit:
+                canvas.draw_idle()
+            else:
+                canvas.restore_region(self.background)
+                self.draw_artists()
+                canvas.blit(self.figure.bbox)
+
+    def table_renderer(self, table=None):
+        """ TableRenderer of one of TABLES for the current results. """
+        table = table or self.table
+        if table == self.TABLES[0]:
+            return TableRenderer(self.mortgage_result[0], self.mortgage_result[6])
+        if table == self.TABLES[1]:
+            return TableRenderer(self.rent_result[0])
+        return TableRenderer(compare_net_worth(self.mortgage_result[5], self.rent_result[0]), index_start=0)
+
+    def table_html(self, table=None, page=None):
+        """ HTML of one page of a table; only that page is formatted. """
+        renderer = self.table_renderer(table)
+        pages = renderer.pages(self.page_size)
+        page = min(self.page if page is None else page, len(pages) - 1)
+        return renderer.html(pages[page]), len(pages)
+
+    def summary(self):
+        """ One-line totals of both strategies. """
+        _, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, net_worth_progression, _ = self.mortgage_result
+        balance_progression, final_balance, total_rental_costs, _ = self.rent_result
+        return (f"Net worth: buy {net_worth_progression['Net Worth'][-1]:,.0f} AED, rent & invest {final_balance:,.0f} AED. "
+                f"Interest {total_interest_paid:,.0f}, insurance {total_insurance_costs:,.0f}, maintenance {total_maintenance_costs:,.0f}, "
+                f"early repayment fees {total_early_repayment_fees:,.0f}, rental costs {total_rental_costs:,.0f} AED.")
+
+    def show(self):
+        """ Display the widgets, figure, summary and table pages in a notebook. """
+        import ipywidgets as widgets
+        import matplotlib
+        import matplotlib.pyplot as plt
+        from IPython.display import display
+
+        interactive_backend = 'ipympl' in matplotlib.get_backend() or matplotlib.get_backend() == 'widget'
+        with plt.ioff():
+            figure = self.build_figure(blit=interactive_backend)
+        figure_output = widgets.Output()
+        status = widgets.HTML()
+        table_choice = widgets.Dropdown(options=self.TABLES, value=self.table, description='Table')
+        page = widgets.BoundedIntText(value=0, min=0, max=0, description='Page')
+        table_output = widgets.HTML()
+
+        def refresh_table(*_):
+            self.table, self.page = table_choice.value, page.value
+            html_page, n_pages = self.table_html()
+            page.max = n_pages - 1
+            table_output.value = html_page
+
+        def refresh_figure():
+            if interactive_backend:
+                return  # The canvas widget redraws itself after draw_idle
+            figure_output.clear_output(wait=True)
+            with figure_output:
+                display(figure)
+
+        def on_change(name, value):
+            self.update(**{name: value})
+            refresh_figure()
+            status.value = f"{html.escape(self.summary())} <i>Updated in {self.last_update_seconds * 1000:.0f} ms.</i>"
+            refresh_table()
+
+        controls = []
+        for name, (low, high, step) in self.WIDGETS.items():
+            value = min(max(self.scenario[name], low), high)
+            slider = (widgets.IntSlider if isinstance(step, int) else widgets.FloatSlider)(
+                value=value, min=low, max=high, step=step, description=name.replace('_', ' '), continuous_update=False, style={'description_width': 'initial'})
+            controls.append((name, slider))
+        controls.append(('rent_cheques', widgets.Dropdown(options=[1, 2, 3, 4, 6, 12], value=self.scenario['rent_cheques'], description='rent cheques')))
+        for name, control in controls:
+            control.observe(lambda change, name=name: on_change(name, change['new']), names='value')
+        table_choice.observe(lambda change: (setattr(page, 'value', 0), refresh_table()), names='value')
+        page.observe(refresh_table, names='value')
+
+        status.value = html.escape(self.summary())
+        refresh_table()
+        display(widgets.VBox([widgets.GridBox([control for _, control in controls], layout=widgets.Layout(grid_template_columns='repeat(3, 1fr)')), status,
+                              figure.canvas if interactive_backend else figure_output, widgets.HBox([table_choice, page]), table_output]))
+        refresh_figure()
+
+
+def _parse_csv_value(value):
+    """ CSV cells are strings: numbers, booleans and JSON lists (e.g. arbitrary_early_repayments) are converted back. """
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    if value.startswith(('[', '{')):
+        return json.loads(value)
+    return value
+
+
+def read_scenarios(path):
+    """ Read scenarios from a JSON or CSV file and return (base, rows).
+
+    JSON holds either a list of scenario objects or {"base": {...}, "scenarios": [...]}. CSV holds one scenario per
+    row with parameter names as headers; empty cells fall back to the base scenario.
+    """
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            return {}, [{name: _parse_csv_value(value) for name, value in row.items() if value != ''} for row in csv.DictReader(f)]
+        data = json.load(f)
+    if isinstance(data, list):
+        return {}, data
+    return data.get('base', {}), data.get('scenarios', [{}])
+
+
+def write_results(path, rows):
+    """ Write result rows as CSV when path ends in .csv, as JSON otherwise; '-' or None writes JSON to stdout. """
+    if path in (None, '-'):
+        json.dump(rows, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    elif path.lower().endswith('.csv'):
+        fieldnames = list(dict.fromkeys(name for row in rows for name in row))
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows({name: json.dumps(value) if isinstance(value, (list, dict)) else value for name, value in row.items()} for row in rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+def run_scenarios(base, rows, store=None):
+    """ Evaluate scenario rows on top of the example values.
+
+    Every result row lists the parameters set by any row (filled in from base where a row leaves them out), followed by
+    the summary metrics of evaluate_scenarios. With a ResultStore, only scenarios not stored yet are evaluated.
+    """
+    base = {**EXAMPLE_SCENARIO, **base}
+    if not rows:
+        return []
+    parameters = list(dict.fromkeys(name for row in rows for name in row))
+    if store is not None:
+        metrics = store.evaluate(rows, base)
+        return [{**{name: row.get(name, base.get(name)) for name in parameters}, **metrics[i]} for i, row in enumerate(rows)]
+    metrics = evaluate_scenarios({**base, **scenarios_to_columns(rows, base, parameters)})
+    return [{**{name: row.get(name, base.get(name)) for name in parameters}, **{name: values[i].item() for name, values in metrics.items()}} for i, row in enumerate(rows)]
+
+
+SCENARIO_PARAMETERS = MORTGAGE_PARAMETERS + RENT_PARAMETERS + CASH_FLOW_PARAMETERS
+
+
+# Everything the results of evaluate_scenarios depend on; a change to any of it invalidates stored results
+MODEL_CODE = [_parse_date, EventSchedule, _check_events, _loan_events, MortgageCalculator, Rent_And_Invest_Calculator, _broadcast_scenarios, _at_month, Schedule,
+              MortgageBatchCalculator, Rent_And_Invest_Batch_Calculator, _batch_calculators, _calendar_groups, _evaluate_scenario_group, evaluate_scenarios]
+
+
+@functools.lru_cache(maxsize=None)
+def model_version():
+    """ Hash of the source of the calculation code. """
+    return hashlib.sha256(''.join(inspect.getsource(code) for code in MODEL_CODE).encode()).hexdigest()[:16]
+
+
+def scenario_key(scenario):
+    """ Canonical hash of a full scenario and the model version; numbers are compared as floats, as in MortgageCalculator.loan_key. """
+    scenario = {name: scenario.get(name, SCENARIO_DEFAULTS.get(name)) for name in SCENARIO_PARAMETERS}
+    scenario = {name: float(value) if isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)) else value for name, value in scenario.items()}
+    repayments = sorted(scenario['arbitrary_early_repayments'], key=lambda x: _parse_date(x['date']))
+    scenario['arbitrary_early_repayments'] = [[_parse_date(rep['date']).isoformat(), float(rep['amount'])] for rep in repayments]
+    # Events of different types or dates apply independently of their order; same-date events of one type keep it
+    events = sorted(scenario['events'], key=lambda x: (_parse_date(x['date']), x['type']))
+    scenario['events'] = [[_parse_date(event['date']).isoformat(), event['type'], float(event['amount'])] for event in events]
+    return hashlib.sha256(json.dumps([model_version(), scenario], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _scenario_schedules(columns, n_scenarios):
+    """ Payment plan, net worth and balance progression columns of every scenario, trimmed to its own term. """
+    schedules = [None] * n_scenarios
+    for members, group in _calendar_groups(columns, n_scenarios):
+        mortgage_calculator, rent_invest_calculator = _batch_calculators(group, len(members))
+        payment_plan, _, _, _, _, net_worth_progression, _ = mortgage_calculator.generate_payment_plan(group['monthly_salary'], group['monthly_expenses'], group['initial_savings'])
+        balance_progression = rent_invest_calculator.calculate_investment()[0]
+        for j, i in enumerate(members):
+            n_months = int(mortgage_calculator.total_years[j]) * 12
+            schedules[i] = {f'{name}/{column}': values[:n_months] for name, schedule in (('payment_plan', payment_plan), ('net_worth_progression', net_worth_progression),
+                                                                                      ('balance_progression', balance_progression))
+                            for column, values in schedule.scenario(j).columns.items()}
+    return schedules
+
+
+class ResultStore:
+    """ On-disk store of scenario results, keyed by scenario_key: a hash of the full scenario and the model version.
+
+    An SQLite index in WAL mode holds the summary metrics of evaluate_scenarios, so readers in other threads and processes
+    are never blocked by a writer. Schedules are .npz files written under a temporary name and renamed into place.
+    Entries of other model versions are removed on opening, and the least recently used entries are evicted once the
+    store takes more than max_bytes.
+    """
+    def __init__(self, path, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()  # one connection per thread
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.join(path, 'schedules'), exist_ok=True)
+        with self.connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, model_version TEXT, metrics TEXT, has_schedules INTEGER, nbytes INTEGER, accessed REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+            stale = [key for key, in db.execute('SELECT key FROM results WHERE model_version != ?', (model_version(),))]
+            db.execute('DELETE FROM results WHERE model_version != ?', (model_version(),))
+        self.remove_schedules(stale)
+
+    def connection(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            import sqlite3
+            db = self.local.db = sqlite3.connect(os.path.join(self.path, 'index.sqlite'), timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def schedule_path(self, key):
+        return os.path.join(self.path, 'schedules', key + '.npz')
+
+    def remove_schedules(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.schedule_path(key))
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return self.connection().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    @_timed('store.get')
+    def get_many(self, keys, schedules=False):
+        """ Stored metrics of every key (None if missing); with schedules=True only entries with schedules count. """
+        found = {}
+        db = self.connection()
+        for first in range(0, len(keys), 500):  # Stay below SQLite's limit on query parameters
+            chunk = keys[first:first + 500]
+            rows = db.execute(f"SELECT key, metrics, has_schedules FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((key, json.loads(metrics)) for key, metrics, has_schedules in rows if has_schedules or not schedules)
+        if found:
+            with db:
+                db.executemany('UPDATE results SET accessed = ? WHERE key = ?', [(time.time(), key) for key in found])
+        results = [found.get(key) for key in keys]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return results
+
+    def load_schedules(self, key):
+        """ Schedule columns stored with a key, or None (also when a concurrent eviction removed them). """
+        try:
+            with np.load(self.schedule_path(key)) as schedules:
+                return dict(schedules)
+        except FileNotFoundError:
+            return None
+
+    @_timed('store.put')
+    def put_many(self, keys, metrics, schedules=None):
+        """ Store metrics dicts, and optionally schedule dicts of arrays, under their keys in one transaction, then evict. """
+        rows = []
+        for i, (key, values) in enumerate(zip(keys, metrics)):
+            nbytes = 0
+            if schedules is not None:
+                temporary_path = f'{self.schedule_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(temporary_path, 'wb') as f:
+                    np.savez(f, **schedules[i])
+                nbytes = os.path.getsize(temporary_path)
+                os.replace(temporary_path, self.schedule_path(key))
+            encoded = json.dumps(values)
+            rows.append((key, model_version(), encoded, schedules is not None, nbytes + len(encoded) + len(key), time.time()))
+        with self.connection() as db:
+            db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.evict()
+
+    def evict(self):
+        """ Remove the least recently used entries until the store takes at most max_bytes. """
+        with self.connection() as db:
+            total = db.execute('SELECT COALESCE(SUM(nbytes), 0) FROM results').fetchone()[0]
+            evicted = []
+            for key, nbytes in db.execute('SELECT key, nbytes FROM results ORDER BY accessed').fetchall():
+                if total <= self.max_bytes:
+                    break
+                evicted.append(key)
+                total -= nbytes
+            db.executemany('DELETE FROM results WHERE key = ?', [(key,) for key in evicted])
+        self.remove_schedules(evicted)
+        self.evictions += len(evicted)
+
+    def evaluate(self, rows, base=None, schedules=False):
+        """ Metrics of scenario rows on top of base (and the calculator defaults), evaluating only the ones not stored yet in one batch.
+
+        With schedules=True, returns (metrics, schedules) lists, the schedules being dicts of 'payment_plan/<column>',
+        'net_worth_progression/<column>' and 'balance_progression/<column>' arrays.
+        """
+        base = {**SCENARIO_DEFAULTS, **(base or {})}
+        keys = [scenario_key({**base, **row}) for row in rows]
+        metrics = self.get_many(keys, schedules)
+        stored = [self.load_schedules(key) if values is not None else None for key, values in zip(keys, metrics)] if schedules else None
+        missing = [i for i, values in enumerate(metrics) if values is None or (schedules and stored[i] is None)]
+        if missing:
+            # Repeated scenarios are evaluated once
+            unique = list({keys[i]: i for i in reversed(missing)}.values())
+            columns = {**base, **scenarios_to_columns([rows[i] for i in unique], base)}
+            computed = evaluate_scenarios(columns)
+            computed = {keys[i]: {name: values[j].item() for name, values in computed.items()} for j, i in enumerate(unique)}
+            computed_schedules = dict(zip((keys[i] for i in unique), _scenario_schedules(columns, len(unique)))) if schedules else None
+            self.put_many(list(computed), list(computed.values()), list(computed_schedules.values()) if schedules else None)
+            for i in missing:
+                metrics[i] = computed[keys[i]]
+                if schedules:
+                    stored[i] = computed_schedules[keys[i]]
+        return (metrics, stored) if schedules else metrics
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        nbytes = self.connection().execute('SELECT COALESCE(SUM(nbytes), 0) FROM results').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0, 'evictions': self.evictions,
+                'entries': len(self), 'nbytes': nbytes, 'model_version': model_version()}
+
+
+def _schedule_json(schedule, dates, n_rows):
+    """ JSON form of the first n_rows months of a single-scenario schedule: {'Date': [...], column: [...]}. """
+    return {'Date': dates[:n_rows].tolist(), **{column: values[:n_rows].tolist() for column, values in schedule.columns.items()}}
+
+
+class EvaluationService:
+    """ Long-lived asyncio HTTP/JSON service evaluating scenarios on top of the example values (and base).
+
+        POST /evaluate   a scenario object -> parameters and summary metrics, as the `run` command returns them
+        POST /schedules  a scenario object -> payment plan, net worth and balance progressions, totals and comparison
+        GET  /metrics    request, latency, throughput, batching and cache statistics
+        GET  /health
+
+    Requests arriving within batch_window seconds of each other are evaluated together in one vectorized batch,
+    in a worker thread so the event loop keeps accepting requests. Responses are cached by a hash of the endpoint
+    and the full scenario, and identical requests in flight share one evaluation.
+    """
+    ENDPOINTS = ['/evaluate', '/schedules']
+
+    def __init__(self, base=None, batch_window=0.005, max_batch=256, cache_entries=4096, store=None):
+        self.base = {**EXAMPLE_SCENARIO, **(base or {})}
+        self.store = store  # optional ResultStore behind the in-memory cache, kept across restarts
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache = collections.OrderedDict()
+        self.cache_entries = cache_entries
+        self.in_flight = {}
+        self.queues = {}
+        self.batchers = []
+        self.started = time.time()
+        self.requests = collections.Counter()
+        self.errors = 0  # invalid requests
+        self.internal_errors = 0  # failures while evaluating valid requests
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.batched_scenarios = 0
+        self.latencies = collections.deque(maxlen=10000)  # (finish time, seconds) of recent requests
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """ Start listening and batching; returns the asyncio server (port 0 picks a free port). """
+        import asyncio
+        self.queues = {endpoint: asyncio.Queue() for endpoint in self.ENDPOINTS}
+        self.batchers = [asyncio.ensure_future(self.run_batches(endpoint)) for endpoint in self.ENDPOINTS]
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def serve_forever(self, host='127.0.0.1', port=8080):
+        """ Run the service until interrupted. """
+        import asyncio
+
+        async def serve():
+            server = await self.start(host, port)
+            print(f"Serving on http://{host}:{server.sockets[0].getsockname()[1]}")
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def handle_connection(self, reader, writer):
+        """ HTTP/1.1 with keep-alive: one request after another on the same connection. """
+        import asyncio
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                start = time.perf_counter()
+                status, payload = await self.handle(method, path, body)
+                self.latencies.append((time.time(), time.perf_counter() - start))
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, method, path, body):
+        """ (status line, JSON body) of one request. """
+        self.requests[path] += 1
+        if method == 'GET' and path == '/health':
+            return '200 OK', b'{"status": "ok"}'
+        if method == 'GET' and path == '/metrics':
+            return '200 OK', json.dumps(self.metrics()).encode()
+        if path not in self.ENDPOINTS:
+            return '404 Not Found', json.dumps({'error': f"Unknown endpoint {method} {path}"}).encode()
+        if method != 'POST':
+            return '405 Method Not Allowed', json.dumps({'error': f"Use POST {path}"}).encode()
+        try:
+            scenario = self.parse_scenario(body)
+        except (ValueError, TypeError) as error:
+            self.errors += 1
+            return '400 Bad Request', json.dumps({'error': str(error)}).encode()
+        try:
+            return '200 OK', await self.submit(path, scenario)
+        except Exception as error:
+            # The request was valid, so a failure while evaluating it is the service's own
+            self.internal_errors += 1
+            return '500 Internal Server Error', json.dumps({'error': f"{type(error).__name__}: {error}"}).encode()
+
+    @staticmethod
+    def parse_scenario(body):
+        """ Scenario object of a request body; ValueError or TypeError if it is not valid JSON of known, well-typed parameters. """
+        scenario = json.loads(body or b'{}')
+        if not isinstance(scenario, dict):
+            raise ValueError("Expected a JSON object of scenario parameters")
+        unknown = sorted(set(scenario) - set(SCENARIO_PARAMETERS))
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(unknown)}")
+        for name, value in scenario.items():
+            if name in ('start_date', 'first_regular_early_repayment_date'):
+                values = [('date', value)]
+            elif name in ('arbitrary_early_repayments', 'events'):
+                if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+                    raise TypeError(f"{name} must be a list of objects")
+                if name == 'events':
+                    _check_events(value)
+                values = [(key, item.get(key)) for item in value for key in ('date', 'amount')]
+            else:
+                values = [('amount', value)]
+            for kind, item in values:
+                if kind == 'date':
+                    if not isinstance(item, str):
+                        raise TypeError(f"{name} dates must be 'YYYY-MM-DD' strings, got {item!r}")
+                    _parse_date(item)
+                elif not isinstance(item, (int, float)):
+                    raise TypeError(f"{name} must be a number, got {item!r}")
+        return scenario
+
+    async def submit(self, endpoint, scenario):
+        """ Cached response for the scenario, or the response of the batch it joins. """
+        import asyncio
+        key = hashlib.sha256(json.dumps([endpoint, {**self.base, **scenario}], sort_keys=True, default=str).encode()).hexdigest()
+        if key in self.cache:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.cache_misses += 1
+        if key not in self.in_flight:
+            self.in_flight[key] = asyncio.get_running_loop().create_future()
+            await self.queues[endpoint].put((key, scenario))
+        return await asyncio.shield(self.in_flight[key])
+
+    async def run_batches(self, endpoint):
+        """ Collect queued scenarios for up to batch_window seconds and evaluate them as one batch. """
+        import asyncio
+        queue = self.queues[endpoint]
+        evaluate = self.evaluate_batch if endpoint == '/evaluate' else self.schedules_batch
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            self.batched_scenarios += len(batch)
+            scenarios = [scenario for _, scenario in batch]
+            try:
+                # Evaluated in a copy of the serving context, so an active instrument() also records the worker threads
+                results = await loop.run_in_executor(None, contextvars.copy_context().run, evaluate, scenarios)
+            except Exception:
+                # One invalid scenario fails its whole batch; evaluate them one by one to only fail that one
+                results = []
+                for scenario in scenarios:
+                    try:
+                        results.append((await loop.run_in_executor(None, contextvars.copy_context().run, evaluate, [scenario]))[0])
+                    except Exception as error:
+                        results.append(error)
+
+            for (key, _), result in zip(batch, results):
+                future = self.in_flight.pop(key)
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                    continue
+                payload = json.dumps(result).encode()
+                self.cache[key] = payload
+                if len(self.cache) > self.cache_entries:
+                    self.cache.popitem(last=False)
+                future.set_result(payload)
+
+    def evaluate_batch(self, scenarios):
+        """ Parameters and summary metrics of every scenario, evaluated in one batch. """
+        if self.store is not None:
+            return [{**scenario, **metrics} for scenario, metrics in zip(scenarios, self.store.evaluate(scenarios, self.base))]
+        metrics = evaluate_scenarios({**self.base, **scenarios_to_columns(scenarios, self.base)})
+        return [{**scenario, **{name: values[i].item() for name, values in metrics.items()}} for i, scenario in enumerate(scenarios)]
+
+    def schedules_batch(self, scenarios):
+        """ Schedules, totals and net worth comparison of every scenario, simulated in one batch per calendar. """
+        columns = {**self.base, **scenarios_to_columns(scenarios, self.base)}
+        results = [None] * len(scenarios)
+        for members, group in _calendar_groups(columns, len(scenarios)):
+            mortgage_calculator, rent_invest_calculator = _batch_calculators(group, len(members))
+            (payment_plan, total_interest_paid, total_insurance_costs, total_maintenance_costs, total_early_repayment_fees, net_worth_progression,
+             highlight_row) = mortgage_calculator.generate_payment_plan(group['monthly_salary'], group['monthly_expenses'], group['initial_savings'])
+            balance_progression, final_balance, total_rental_costs, total_earned_interest = rent_invest_calculator.calculate_investment()
+            mortgage_dates, rent_dates = payment_plan.dates, balance_progression.dates
+            total_cost_of_ownership = (mortgage_calculator.property_price + mortgage_calculator.calculate_initial_costs(mortgage_calculator.property_price)
+                                       + total_interest_paid + total_insurance_costs + total_maintenance_costs + total_early_repayment_fees)
+
+            for j, i in enumerate(members):
+                n_months = int(mortgage_calculator.total_years[j]) * 12
+                mortgage_net_worth = net_worth_progression['Net Worth'][j, :n_months].tolist()
+                rent_net_worth = balance_progression['Balance'][j, :n_months].tolist()
+                results[i] = {
+                    'totals': {
+                        'total_interest_paid': total_interest_paid[j].item(), 'total_insurance_costs': total_insurance_costs[j].item(),
+                        'total_maintenance_costs': total_maintenance_costs[j].item(), 'total_early_repayment_fees': total_early_repayment_fees[j].item(),
+                        'total_cost_of_ownership': total_cost_of_ownership[j].item(), 'highlight_row': int(highlight_row[j]) if highlight_row[j] >= 0 else None,
+                        'final_balance': final_balance[j].item(), 'total_rental_costs': total_rental_costs[j].item(),
+                        'total_earned_interest': total_earned_interest[j].item(),
+                    },
+                    'payment_plan': _schedule_json(payment_plan.scenario(j), mortgage_dates, n_months),
+                    'net_worth_progression': _schedule_json(net_worth_progression.scenario(j), mortgage_dates, n_months),
+                    'balance_progression': _schedule_json(balance_progression.scenario(j), rent_dates, n_months),
+                    # Month n of rent & invest falls on the date of mortgage month n, as in compare_net_worth
+                    'comparison': {'Date': mortgage_dates[:n_months].tolist() + rent_dates[n_months - 1:n_months].tolist(),
+                                   'Net Worth (Mortgage)': mortgage_net_worth + [None], 'Net Worth (Rent & Invest)': [None] + rent_net_worth},
+                }
+        return results
+
+    def metrics(self):
+        """ Request counts, latency percentiles and throughput over the last minute, batching and cache statistics. """
+        now = time.time()
+        recent = [latency for finished, latency in self.latencies if finished >= now - 60]
+        latencies = np.array([latency for _, latency in self.latencies])
+        percentiles = np.percentile(latencies, [50, 95, 99]) * 1000 if len(latencies) else [None] * 3
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'uptime_seconds': now - self.started,
+            'requests': dict(self.requests),
+            'errors': self.errors,
+            'internal_errors': self.internal_errors,
+            'latency_ms': dict(zip(['p50', 'p95', 'p99'], [None if value is None else float(value) for value in percentiles])),
+            'requests_per_second': len(recent) / min(60, max(now - self.started, 1e-9)),
+            'batches': self.batches,
+            'mean_batch_size': self.batched_scenarios / self.batches if self.batches else None,
+            'cache': {'entries': len(self.cache), 'hits': self.cache_hits, 'misses': self.cache_misses, 'hit_rate': self.cache_hits / lookups if lookups else 0.0},
+            'store': self.store.stats if self.store is not None else None,
+        }
+
+
+def main(argv=None):
+    """ Command line entry point: the example report by default, headless scenario evaluation with `run`, chart export with `charts`, offer ranking with `offers`, early repayment optimization with `optimize`, historical backtests with `backtest`, streaming simulation with `stream` or the HTTP service with `serve`. """
+    parser = argparse.ArgumentParser(description='Mortgage vs. rent & invest calculator')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('example', help='print the example tables and plots (default)')
+    run_parser = commands.add_parser('run', help='evaluate scenarios from a JSON or CSV file without tables or plots')
+    run_parser.add_argument('input', help='JSON or CSV file with one scenario per object/row')
+    run_parser.add_argument('-o', '--output', help='results file, .csv or .json (default: JSON on stdout)')
+    run_parser.add_argument('--store', help='result store directory: reuse results of scenarios evaluated before and store new ones')
+    charts_parser = commands.add_parser('charts', help='export the charts of every scenario in a JSON or CSV file as PNG or SVG files')
+    charts_parser.add_argument('input', help='JSON or CSV file with one scenario per object/row')
+    charts_parser.add_argument('-d', '--output-dir', default='charts', help='directory for the chart files (default: charts)')
+    charts_parser.add_argument('--format', default='png', choices=['png', 'svg'], help='image format (default: png)')
+    charts_parser.add_argument('--yearly', action='store_true', help='plot one point per calendar year')
+    charts_parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    sensitivity_parser = commands.add_parser('sensitivity', help='rank every numeric input by its effect on the final net worth difference')
+    sensitivity_parser.add_argument('--base', help='JSON file with parameters applied on top of the example values')
+    sensitivity_parser.add_argument('--step', type=float, default=0.1, help='relative step down and up (default: 0.1)')
+    sensitivity_parser.add_argument('-o', '--output', help='results file, .csv or .json (default: JSON on stdout)')
+    offers_parser = commands.add_parser('offers', help='rank mortgage offers against rental plans from a JSON file')
+    offers_parser.add_argument('input', help='JSON file with {"base": {...}, "offers": [...], "rental_plans": [...]}')
+    offers_parser.add_argument('--top-k', type=int, help='stop simulating offers that cannot reach the top k')
+    offers_parser.add_argument('--horizon-years', type=int, help='comparison horizon (default: the shortest offer term)')
+    offers_parser.add_argument('-o', '--output', help='results file, .csv or .json (default: JSON on stdout)')
+    optimize_parser = commands.add_parser('optimize', help='search the yearly early repayments that maximize net worth or minimize interest')
+    optimize_parser.add_argument('--base', help='JSON file with parameters applied on top of the example values')
+    optimize_parser.add_argument('--objective', default='net_worth', choices=EarlyRepaymentOptimizer.OBJECTIVES, help='what to optimize (default: net_worth)')
+    optimize_parser.add_argument('--min-step', type=float, default=1000, help='finest amount step in AED (default: 1000)')
+    optimize_parser.add_argument('-o', '--output', help='results file, .csv or .json (default: JSON on stdout)')
+    backtest_parser = commands.add_parser('backtest', help='run one scenario over every rolling start month of a historical EIBOR and return series')
+    backtest_parser.add_argument('history', help='CSV (date, eibor, investment_return) or .npy history file')
+    backtest_parser.add_argument('--margin', type=float, required=True, help='margin over EIBOR in percent after the fixed period')
+    backtest_parser.add_argument('--base', help='JSON file with parameters applied on top of the example values')
+    backtest_parser.add_argument('--reset-interval', type=int, default=1, help='months between rate resets (default: 1)')
+    backtest_parser.add_argument('--from', dest='first_start', help='first start date of a window (default: the start of the history)')
+    backtest_parser.add_argument('--to', dest='last_start', help='last start date of a window (default: the last one with a full term of history)')
+    backtest_parser.add_argument('--worst', type=int, default=5, help='number of worst windows to print (default: 5)')
+    backtest_parser.add_argument('-o', '--output', help='results file with one row per window, .csv or .json (default: JSON on stdout)')
+    stream_parser = commands.add_parser('stream', help='write a daily or weekly simulation of one scenario to CSV or Parquet as it runs')
+    stream_parser.add_argument('output', help='.csv or .parquet file')
+    stream_parser.add_argument('--base', help='JSON file with parameters applied on top of the example values')
+    stream_parser.add_argument('--step', default='daily', choices=list(StreamingSimulation.STEP_DAYS), help='simulation step (default: daily)')
+    stream_parser.add_argument('--income-step', default='monthly', choices=['monthly', 'weekly'], help='how often salary and expenses arrive (default: monthly)')
+    stream_parser.add_argument('--aggregate', choices=['monthly', 'yearly'], help='write one row per calendar month or year instead of every step')
+    serve_parser = commands.add_parser('serve', help='run the HTTP/JSON evaluation service')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: 8080)')
+    serve_parser.add_argument('--base', help='JSON file with base parameters applied under every request')
+    serve_parser.add_argument('--batch-window-ms', type=float, default=5, help='how long to collect requests into one batch (default: 5)')
+    serve_parser.add_argument('--max-batch', type=int, default=256, help='largest batch (default: 256)')
+    serve_parser.add_argument('--store', help='result store directory kept across restarts')
+    parser.add_argument('--timings', help='write stage timings and counters of the run to this JSON file')
+    parser.add_argument('--trace', help='write a Chrome trace (chrome://tracing, Perfetto) of the run to this file')
+    args = parser.parse_args(argv)
+
+    with contextlib.ExitStack() as stack:
+        probe = stack.enter_context(instrument()) if args.timings or args.trace else None
+        if args.command == 'run':
+            base, rows = read_scenarios(args.input)
+            write_results(args.output, run_scenarios(base, rows, ResultStore(args.store) if args.store else None))
+        elif args.command == 'sensitivity':
+            base = dict(EXAMPLE_SCENARIO)
+            if args.base:
+                with open(args.base) as f:
+                    base.update(json.load(f))
+            result = SensitivityAnalysis(base, args.step).run()
+            columns = [name for name, values in result.items() if isinstance(values, np.ndarray)]
+            write_results(args.output, [{name: result[name][i].item() if name != 'parameter' else result[name][i] for name in columns} for i in range(len(result['parameter']))])
+        elif args.command == 'offers':
+            with open(args.input) as f:
+                data = json.load(f)
+            result = OfferComparison({**EXAMPLE_SCENARIO, **data.get('base', {})}, data.get('offers', []), data.get('rental_plans', []),
+                                     args.top_k, args.horizon_years).run()
+            rows = []
+            for i, strategy in enumerate(result['strategy']):
+                pruned = result['pruned_month'][i] >= 0
+                rows.append({'rank': None if pruned else i + 1, 'strategy': strategy, 'kind': result['kind'][i],
+                             'final_net_worth': None if pruned else result['final_net_worth'][i].item(),
+                             'pruned_month': int(result['pruned_month'][i]) if pruned else None,
+                             'upper_bound': result['upper_bound'][i].item() if pruned else None,
+                             'crossover_months': {other: int(month) for other, month in zip(result['strategy'], result['crossover_month'][i]) if other != strategy} if not pruned else None})
+            write_results(args.output, rows)
+        elif args.command == 'optimize':
+            scenario = dict(EXAMPLE_SCENARIO)
+            if args.base:
+                with open(args.base) as f:
+                    scenario.update(json.load(f))
+            result = EarlyRepaymentOptimizer(scenario, args.objective, min_step=args.min_step).run()
+            print(f"Net worth {result['net_worth']:,.2f} AED ({result['baseline_net_worth']:,.2f} without early repayments), "
+                  f"total interest {result['total_interest_paid']:,.2f} AED ({result['baseline_total_interest_paid']:,.2f})", file=sys.stderr)
+            write_results(args.output, [{'date': date, 'amount': amount} for date, amount in zip(result['dates'], result['amounts'].tolist())])
+        elif args.command == 'backtest':
+            scenario = dict(EXAMPLE_SCENARIO)
+            if args.base:
+                with open(args.base) as f:
+                    scenario.update(json.load(f))
+            result = HistoricalBacktest(scenario, args.history, args.margin, args.reset_interval, args.first_start, args.last_start).run(n_worst=args.worst)
+            print(f"{len(result['start_date'])} windows, buying ends ahead in {result['probability_buy_wins']:.1%}; net worth difference percentiles: "
+                  + ', '.join(f"{p}%: {value:,.0f}" for p, value in result['percentiles'].items()), file=sys.stderr)
+            for i in result['worst']:
+                print(f"  worst: {result['start_date'][i]} {result['net_worth_difference'][i]:,.0f} AED at a mean floating rate of {result['mean_later_rate'][i]:.2f}%", file=sys.stderr)
+            columns = [name for name, values in result.items() if isinstance(values, np.ndarray) and name != 'worst']
+            write_results(args.output, [{name: result[name][i] if name == 'start_date' else result[name][i].item() for name in columns} for i in range(len(result['start_date']))])
+        elif args.command == 'stream':
+            scenario = dict(EXAMPLE_SCENARIO)
+            if args.base:
+                with open(args.base) as f:
+                    scenario.update(json.load(f))
+            mortgage_calculator, rent_invest_calculator = build_calculators(scenario)
+            simulation = StreamingSimulation(mortgage_calculator, rent_invest_calculator, scenario['monthly_salary'], scenario['monthly_expenses'],
+                                             scenario['initial_savings'], args.step, args.income_step)
+            print(f"Wrote {simulation.write(args.output, args.aggregate)} rows to {args.output}")
+        elif args.command == 'serve':
+            base = None
+            if args.base:
+                with open(args.base) as f:
+                    base = json.load(f)
+            EvaluationService(base, args.batch_window_ms / 1000, args.max_batch, store=ResultStore(args.store) if args.store else None).serve_forever(args.host, args.port)
+        elif args.command == 'charts':
+            base, rows = read_scenarios(args.input)
+            paths = export_scenario_charts(base, rows, args.output_dir, args.format, args.yearly, args.workers)
+            print(f"Exported {sum(len(row_paths) for row_paths in paths)} charts to {args.output_dir}")
+        else:
+            run_example()
+
+    if args.timings:
+        probe.write_json(args.timings)
+    if args.trace:
+        probe.write_chrome_trace(args.trace)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import numpy as np
+
+import rent_vs_buy_dubai as calc
+
+
+def generate(scenario, cache=None):
+    mortgage_calculator, _ = calc.build_calculators(scenario)
+    return mortgage_calculator.generate_payment_plan(scenario['monthly_salary'], scenario['monthly_expenses'], scenario['initial_savings'], cache=cache)
+
+
+def test_cached_plan_matches_simulation_when_only_property_size_differs():
+    """ Same maintenance fees from a different size and rate must not share the loan side once the rate changes. """
+    events = [{'date': '2090-01-01', 'type': 'maintenance_fees_rate', 'amount': 20}]
+    cache = calc.AmortizationCache()
+    for size, rate in [(850, 18), (1700, 9)]:
+        scenario = {**calc.EXAMPLE_SCENARIO, 'property_size': size, 'maintenance_fees_rate': rate, 'events': events}
+        cached = generate(scenario, cache)
+        mortgage_calculator, _ = calc.build_calculators(scenario)
+        expected = mortgage_calculator.simulate_payment_plan(scenario['monthly_salary'], scenario['monthly_expenses'], scenario['initial_savings'])
+        assert cached[3] == expected[3]
+        np.testing.assert_array_equal(cached[0].values, expected[0].values)
+        np.testing.assert_array_equal(cached[5].values, expected[5].values)
+    assert cache.misses == 2
+
+
+def test_generate_payment_plan_does_not_cache_by_default():
+    calc.AMORTIZATION_CACHE.clear()
+    generate(calc.EXAMPLE_SCENARIO)
+    assert len(calc.AMORTIZATION_CACHE) == 0 and calc.AMORTIZATION_CACHE.misses == 0
+
+
+def test_clear_resets_statistics():
+    cache = calc.AmortizationCache()
+    generate(calc.EXAMPLE_SCENARIO, cache)
+    generate(calc.EXAMPLE_SCENARIO, cache)
+    cache.clear()
+    assert cache.stats['hits'] == cache.stats['misses'] == cache.stats['entries'] == 0
+
+
+def test_loan_key_accepts_mixed_repayment_dates():
+    repayments = [{'date': '2086-03-01', 'amount': 50000}, {'date': datetime(2085, 6, 1), 'amount': 50000}]
+    mortgage_calculator, _ = calc.build_calculators({**calc.EXAMPLE_SCENARIO, 'arbitrary_early_repayments': repayments})
+    same_dates, _ = calc.build_calculators({**calc.EXAMPLE_SCENARIO, 'arbitrary_early_repayments': [
+        {'date': '2085-06-01', 'amount': 50000}, {'date': '2086-03-01', 'amount': 50000}]})
+    assert mortgage_calculator.loan_key() == same_dates.loan_key()
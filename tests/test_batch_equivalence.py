@@ -0,0 +1,97 @@
+import calendar
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+N_SCENARIOS = 200
+
+
+def random_scenarios(seed, n=N_SCENARIOS):
+    """ Columns of n random scenarios sharing the example calendar. """
+    rng = np.random.default_rng(seed)
+    property_price = rng.uniform(800000, 4000000, n)
+    return {
+        **calc.EXAMPLE_SCENARIO,
+        'property_price': property_price, 'principal': property_price * rng.uniform(0.5, 0.8, n),
+        'initial_rate': rng.uniform(1, 7, n), 'initial_years': rng.integers(1, 6, n), 'later_rate': rng.uniform(2, 9, n),
+        'total_years': rng.integers(5, 31, n), 'property_size': rng.uniform(500, 2500, n), 'maintenance_fees_rate': rng.uniform(5, 30, n),
+        'life_insurance_rate': rng.uniform(0, 0.5, n), 'property_insurance_rate': rng.uniform(0, 0.3, n),
+        'regular_early_repayment': rng.choice([0, 50000, 200000], n), 'max_early_repayment_percent': rng.uniform(5, 25, n),
+        'property_value_factor': rng.uniform(0.7, 1.5, n), 'annual_investment_rate': rng.uniform(0, 9, n),
+        'monthly_salary': rng.uniform(15000, 60000, n), 'monthly_expenses': rng.uniform(5000, 20000, n),
+        'initial_savings': property_price * rng.uniform(0.3, 0.7, n),
+        'annual_rent': rng.uniform(50000, 250000, n), 'rent_cheques': rng.choice([1, 2, 4, 12], n), 'change_apartment_interval': rng.integers(1, 6, n),
+    }
+
+
+def scenario(columns, i):
+    return {name: value[i] if isinstance(value, np.ndarray) else value for name, value in columns.items()}
+
+
+def scalar_results(columns, summary_only):
+    for i in range(N_SCENARIOS):
+        row = scenario(columns, i)
+        mortgage_calculator, rent_invest_calculator = calc.build_calculators(row)
+        yield (i, int(row['total_years']) * 12,
+               mortgage_calculator.generate_payment_plan(row['monthly_salary'], row['monthly_expenses'], row['initial_savings'], summary_only),
+               rent_invest_calculator.calculate_investment(summary_only))
+
+
+def random_dates(rng, n, first_year=2084, last_year=2114):
+    """ n random dates, half of them on the last days of their month. """
+    dates = []
+    for _ in range(n):
+        year, month = int(rng.integers(first_year, last_year)), int(rng.integers(1, 13))
+        last_day = calendar.monthrange(year, month)[1]
+        day = int(rng.integers(last_day - 3, last_day + 1)) if rng.random() < 0.5 else int(rng.integers(1, last_day + 1))
+        dates.append(f'{year}-{month:02d}-{day:02d}')
+    return dates
+
+
+def assert_batch_matches_scalar(columns, summary_only):
+    mortgage_calculator, rent_invest_calculator = calc._batch_calculators(columns, N_SCENARIOS)
+    mortgage = mortgage_calculator.generate_payment_plan(columns['monthly_salary'], columns['monthly_expenses'], columns['initial_savings'], summary_only)
+    rent = rent_invest_calculator.calculate_investment(summary_only)
+
+    for i, n_months, expected_mortgage, expected_rent in scalar_results(columns, summary_only):
+        n_rows = 1 if summary_only else n_months
+        for total in range(1, 5):
+            np.testing.assert_allclose(mortgage[total][i], expected_mortgage[total], rtol=1e-6)
+        for batch, expected in ((mortgage[0], expected_mortgage[0]), (mortgage[5], expected_mortgage[5])):
+            for column in expected.columns:
+                np.testing.assert_allclose(batch[column][i, :n_rows], expected[column], rtol=1e-6, atol=1e-3, err_msg=f'scenario {i} {column}')
+        for total in range(1, 4):
+            np.testing.assert_allclose(rent[total][i], expected_rent[total], rtol=1e-6)
+        for column in expected_rent[0].columns:
+            np.testing.assert_allclose(rent[0][column][i, :n_rows], expected_rent[0][column], rtol=1e-6, atol=1e-3, err_msg=f'scenario {i} {column}')
+
+
+@pytest.mark.parametrize('summary_only', [False, True])
+def test_batch_calculators_match_scalar_calculators(summary_only):
+    assert_batch_matches_scalar(random_scenarios(seed=2084), summary_only)
+
+
+@pytest.mark.parametrize('start_date', ['2084-01-31', '2084-01-30', '2084-02-29', '2084-08-31'])
+def test_month_index_is_the_first_payment_date_on_or_after_the_date(start_date):
+    events = calc.EventSchedule(start_date, 12 * 30)
+    payment_dates = [calc.MortgageCalculator.get_payment_date(events.start_date, month) for month in range(12 * 30 + 2)]
+    for date in random_dates(np.random.default_rng(31), 2000, first_year=2083):
+        expected = next(month for month, payment_date in enumerate(payment_dates) if payment_date >= datetime.strptime(date, '%Y-%m-%d'))
+        assert events.month_index(date) == expected, date
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_dated_events_on_a_month_end_start_date_match_scalar_calculators(seed):
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(list(calc.MORTGAGE_EVENT_TYPES), 12)
+    columns = {
+        **random_scenarios(seed),
+        'start_date': '2084-01-31', 'first_regular_early_repayment_date': '2085-03-31', 'regular_early_repayment_interval': int(rng.choice([1, 6, 12])),
+        'events': [{'date': date, 'type': kind, 'amount': float(rng.uniform(1, 40) if kind == 'maintenance_fees_rate' else rng.uniform(1000, 50000))}
+                   for date, kind in zip(random_dates(rng, len(kinds)), kinds)],
+        'arbitrary_early_repayments': [{'date': date, 'amount': float(rng.uniform(10000, 300000))} for date in random_dates(rng, 12)],
+    }
+    assert_batch_matches_scalar(columns, summary_only=False)
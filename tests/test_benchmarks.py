@@ -0,0 +1,40 @@
+import json
+
+import numpy as np
+
+import benchmarks
+
+
+def test_inputs_are_seeded():
+    assert benchmarks.mortgage_params(25, 1000) == benchmarks.mortgage_params(25, 1000)
+    first, second = benchmarks.batch_scenarios(100), benchmarks.batch_scenarios(100)
+    for name in first:
+        np.testing.assert_array_equal(first[name], second[name])
+
+
+def test_case_names_are_unique():
+    names = [name for name, _ in benchmarks.build_cases(quick=True)]
+    assert len(names) == len(set(names))
+    assert not any('100000' in name for name in names)
+
+
+def test_compare_flags_slowdowns_above_the_threshold():
+    baseline = {'results': {'a': {'median': 1.0}, 'b': {'median': 1.0}}}
+    rows = benchmarks.compare({'a': {'median': 1.1}, 'b': {'median': 1.3}, 'c': {'median': 1.0}}, baseline, threshold=0.2)
+    assert [(name, regressed) for name, _, _, _, regressed in rows] == [('a', False), ('b', True), ('c', False)]
+    assert rows[2][3] is None
+
+
+def test_history_is_compared_on_the_same_machine(tmp_path):
+    history = tmp_path / 'history.jsonl'
+    argv = ['-k', 'mortgage.cached.25y', '--history', str(history), '--repeat', '1', '--fail-on-regression']
+    assert benchmarks.main(argv) == 0
+    entry = json.loads(history.read_text())
+    assert entry['machine'] == benchmarks.machine_info()
+    assert set(entry['results']) == {'mortgage.cached.25y'}
+
+    # A baseline a thousand times faster makes this run a regression
+    entry['results']['mortgage.cached.25y']['median'] /= 1000
+    history.write_text(json.dumps(entry) + '\n')
+    assert benchmarks.main(argv) == 1
+    assert len(history.read_text().splitlines()) == 2
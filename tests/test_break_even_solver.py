@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+
+def net_worth_difference(**overrides):
+    return calc.evaluate_scenarios({**calc.EXAMPLE_SCENARIO, **overrides})['net_worth_difference'][0]
+
+
+def test_finds_the_root_inside_a_sign_changing_bracket():
+    solver = calc.BreakEvenSolver(calc.EXAMPLE_SCENARIO)
+    queries = [{'parameter': 'annual_rent'}, {'parameter': 'later_rate', 'bracket': (1, 40)}, {'parameter': 'annual_rent', 'monthly_salary': 30000}]
+    result = solver.solve_batch(queries)
+    assert result['converged'].all()
+    for query, value in zip(queries, result['value']):
+        parameter, overrides = query['parameter'], {name: value for name, value in query.items() if name not in ('parameter', 'bracket')}
+        low, high = query.get('bracket') or (0.25 * calc.EXAMPLE_SCENARIO[parameter], 4 * calc.EXAMPLE_SCENARIO[parameter])
+        assert low < value < high
+        assert np.sign(net_worth_difference(**overrides, **{parameter: low})) != np.sign(net_worth_difference(**overrides, **{parameter: high}))
+        assert abs(net_worth_difference(**overrides, **{parameter: value})) <= solver.net_worth_tolerance
+
+
+def test_bracket_without_a_sign_change_gives_nan():
+    result = calc.BreakEvenSolver(calc.EXAMPLE_SCENARIO).solve('annual_rent', bracket=(1000, 2000))
+    assert np.isnan(result['value'])
+    assert not result['converged']
+
+
+def test_discrete_parameters_cannot_be_solved_for():
+    with pytest.raises(ValueError):
+        calc.BreakEvenSolver(calc.EXAMPLE_SCENARIO).solve('total_years')
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+pytest.importorskip('matplotlib')
+
+
+def test_export_writes_every_chart(tmp_path):
+    mortgage_calculator, rent_invest_calculator = calc.build_calculators(calc.EXAMPLE_SCENARIO)
+    payment_plan, _, _, _, _, net_worth_progression, _ = mortgage_calculator.generate_payment_plan(*[calc.EXAMPLE_SCENARIO[name] for name in calc.CASH_FLOW_PARAMETERS])
+    balance_progression = rent_invest_calculator.calculate_investment()[0]
+    for output_format, yearly, signature in (('png', False, b'\x89PNG'), ('svg', True, b'<?xml')):
+        paths = calc.ChartExporter(str(tmp_path), output_format, yearly).export(payment_plan, net_worth_progression, balance_progression, prefix='a_')
+        assert [os.path.basename(path) for path in paths] == [f'a_{chart}.{output_format}' for chart in ('payment_plan', 'net_worth_progression', 'balance_progression', 'comparison')]
+        for path in paths:
+            with open(path, 'rb') as f:
+                assert f.read(5).startswith(signature)
+
+
+def test_scenario_charts_come_back_in_row_order(tmp_path):
+    rows = [{'annual_rent': rent} for rent in (70000, 100000, 130000)]
+    paths = calc.export_scenario_charts({}, rows, str(tmp_path), output_format='svg', yearly=True, workers=2)
+    assert [os.path.basename(row_paths[0]) for row_paths in paths] == ['00000_payment_plan.svg', '00001_payment_plan.svg', '00002_payment_plan.svg']
+    assert len(os.listdir(tmp_path)) == 4 * len(rows)
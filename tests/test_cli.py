@@ -0,0 +1,32 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+
+def test_run_writes_the_metrics_of_every_scenario(tmp_path):
+    scenarios = [{'annual_rent': 90000}, {'annual_rent': 120000, 'property_price': 1500000}]
+    input_path, output_path = tmp_path / 'scenarios.json', tmp_path / 'results.csv'
+    input_path.write_text(json.dumps(scenarios))
+    calc.main(['run', str(input_path), '-o', str(output_path)])
+
+    with open(output_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    expected = calc.evaluate_scenarios({**calc.EXAMPLE_SCENARIO, **calc.scenarios_to_columns(scenarios, calc.EXAMPLE_SCENARIO)})
+    assert [float(row['annual_rent']) for row in rows] == [90000, 120000]
+    assert [float(row['property_price']) for row in rows] == [calc.EXAMPLE_SCENARIO['property_price'], 1500000]
+    for name, values in expected.items():
+        np.testing.assert_allclose([float(row[name]) for row in rows], values, rtol=1e-12)
+
+
+def test_unknown_options_are_rejected(tmp_path, capsys):
+    input_path = tmp_path / 'scenarios.json'
+    input_path.write_text(json.dumps([{'annual_rent': 90000}]))
+    with pytest.raises(SystemExit) as error:
+        calc.main(['run', str(input_path), '--ouput', str(tmp_path / 'results.csv')])
+    assert error.value.code == 2
+    assert 'unrecognized arguments: --ouput' in capsys.readouterr().err
+    assert not (tmp_path / 'results.csv').exists()
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+
+@pytest.mark.parametrize('objective', calc.EarlyRepaymentOptimizer.OBJECTIVES)
+def test_result_is_not_worse_than_the_baseline_or_uniform_schedules(objective):
+    optimizer = calc.EarlyRepaymentOptimizer(calc.EXAMPLE_SCENARIO, objective=objective)
+    result = optimizer.run()
+    if objective == 'net_worth':
+        assert result['net_worth'] >= result['baseline_net_worth']
+    else:
+        assert result['total_interest_paid'] <= result['baseline_total_interest_paid']
+    best = optimizer.score(result['amounts'])[0]
+    uniform = np.outer(np.linspace(0, 1, 5), np.full(len(optimizer.dates), optimizer.max_amount))
+    assert best >= optimizer.score(uniform).max()
+    assert (result['amounts'] <= optimizer.max_amount).all()
+
+
+def test_result_reproduces_with_the_scalar_calculator():
+    result = calc.EarlyRepaymentOptimizer(calc.EXAMPLE_SCENARIO).run()
+    scenario = {**calc.EXAMPLE_SCENARIO, 'regular_early_repayment': 0, 'arbitrary_early_repayments': result['arbitrary_early_repayments']}
+    mortgage_calculator, _ = calc.build_calculators(scenario)
+    payment_plan, total_interest_paid, _, _, _, net_worth_progression, _ = mortgage_calculator.generate_payment_plan(
+        *[scenario[name] for name in calc.CASH_FLOW_PARAMETERS])
+    np.testing.assert_allclose(net_worth_progression['Net Worth'][-1], result['net_worth'], rtol=1e-9)
+    np.testing.assert_allclose(total_interest_paid, result['total_interest_paid'], rtol=1e-9)
+    assert payment_plan['Investments'].min() >= 0
+
+
+def test_a_zero_cap_gives_the_baseline():
+    scenario = {**calc.EXAMPLE_SCENARIO, 'max_early_repayment_percent': 0, 'allow_exceed_early_repayment_limit': False}
+    result = calc.EarlyRepaymentOptimizer(scenario).run()
+    assert not result['amounts'].any() and result['arbitrary_early_repayments'] == []
+    assert result['net_worth'] == result['baseline_net_worth']
+    assert result['total_interest_paid'] == result['baseline_total_interest_paid']
+
+
+@pytest.mark.parametrize('steps', [{'step': 0}, {'step': -1000}, {'min_step': 0}])
+def test_non_positive_steps_are_rejected(steps):
+    with pytest.raises(ValueError):
+        calc.EarlyRepaymentOptimizer(calc.EXAMPLE_SCENARIO, **steps)
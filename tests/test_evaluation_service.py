@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import rent_vs_buy_dubai as calc
+
+
+async def request(port, method, path, scenario=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(scenario).encode() if scenario is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+
+def serve(scenarios, **kwargs):
+    """ (status, response) of every scenario posted at once to /evaluate, and the service metrics afterwards. """
+    async def run():
+        service = calc.EvaluationService(**kwargs)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            responses = await asyncio.gather(*[request(port, 'POST', '/evaluate', scenario) for scenario in scenarios])
+            return responses, (await request(port, 'GET', '/metrics'))[1]
+        finally:
+            server.close()
+            for batcher in service.batchers:
+                batcher.cancel()
+    return asyncio.run(run())
+
+
+def test_invalid_request_in_a_batch_only_fails_itself():
+    scenarios = [{'annual_rent': 90000}, {'annual_rent': 'a lot'}, {'annual_rent': 110000}]
+    responses, metrics = serve(scenarios, batch_window=0.1)
+    assert [status for status, _ in responses] == [200, 400, 200]
+    assert 'error' in responses[1][1]
+    expected = calc.evaluate_scenarios({**calc.EXAMPLE_SCENARIO, 'annual_rent': [90000, 110000]})['net_worth_difference']
+    assert [responses[0][1]['net_worth_difference'], responses[2][1]['net_worth_difference']] == expected.tolist()
+    assert metrics['batches'] == 1
+    assert metrics['errors'] == 1
+
+
+def test_identical_requests_share_one_evaluation():
+    responses, metrics = serve([{'later_rate': 7}] * 3 + [{'unknown': 1}], batch_window=0.1)
+    assert [status for status, _ in responses] == [200, 200, 200, 400]
+    assert responses[0][1] == responses[1][1] == responses[2][1]
+    assert metrics['batches'] == 1
+    assert metrics['mean_batch_size'] == 1
+
+
+def test_evaluation_failures_are_server_errors(monkeypatch):
+    evaluate_scenarios = calc.evaluate_scenarios
+
+    def failing(scenarios):
+        if 12345 in scenarios['annual_rent']:
+            raise RuntimeError("engine failure")
+        return evaluate_scenarios(scenarios)
+    monkeypatch.setattr(calc, 'evaluate_scenarios', failing)
+
+    scenarios = [{'annual_rent': 90000}, {'annual_rent': 12345}, {'start_date': '2084-02-30'},
+                 {'events': [{'date': '2090-01-01', 'type': 'renovation', 'amount': 1}]}]
+    responses, metrics = serve(scenarios, batch_window=0.1)
+    assert [status for status, _ in responses] == [200, 500, 400, 400]
+    assert 'engine failure' in responses[1][1]['error']
+    assert metrics['errors'] == 2
+    assert metrics['internal_errors'] == 1
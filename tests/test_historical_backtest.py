@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import benchmarks
+import rent_vs_buy_dubai as calc
+
+SCENARIO = {**calc.EXAMPLE_SCENARIO, 'total_years': 10, 'initial_years': 3}
+
+
+def constant_history(n_months, eibor=4.0, investment_return=0.5):
+    history = np.empty(n_months, dtype=calc.HISTORY_DTYPE)
+    history['month'] = calc.HistoricalBacktest.month_of(SCENARIO['start_date']) + np.arange(n_months)
+    history['eibor'] = eibor
+    history['investment_return'] = investment_return
+    return history
+
+
+def test_one_window_per_start_month_with_the_history_after_it():
+    history = benchmarks.rate_history(150)
+    backtest = calc.HistoricalBacktest(SCENARIO, history, margin=1.5, reset_interval=3)
+    assert list(backtest.starts) == list(range(150 - 120 + 1))
+    later_rate, _, _ = backtest.paths(backtest.starts)
+    np.testing.assert_array_equal(later_rate[7, :6], history['eibor'][[7, 7, 7, 10, 10, 10]] + 1.5)
+
+    limited = calc.HistoricalBacktest(SCENARIO, history, margin=1.5, first_start='2000-03-01', last_start='2001-02-15')
+    assert list(limited.starts) == list(range(2, 14))
+    result = limited.run()
+    assert list(result['start_date'][:2]) == [limited.shift(SCENARIO['start_date'], offset) for offset in history['month'][[2, 3]] - limited.month_of(SCENARIO['start_date'])]
+    assert len(result['net_worth_difference']) == 12
+
+
+def test_history_shorter_than_the_term_has_no_window():
+    with pytest.raises(ValueError):
+        calc.HistoricalBacktest(SCENARIO, benchmarks.rate_history(119), margin=1.5)
+
+
+def test_constant_history_matches_the_calculators():
+    backtest = calc.HistoricalBacktest(SCENARIO, constant_history(121), margin=1.5)
+    result = backtest.run()
+    assert list(result['start_date']) == [SCENARIO['start_date'], backtest.shift(SCENARIO['start_date'], 1)]
+    mortgage_calculator, rent_invest_calculator = calc.build_calculators({**SCENARIO, 'later_rate': 5.5, 'annual_investment_rate': 6.0})
+    rent_invest_calculator.annual_interest_rate = 1.005 ** 12 - 1
+    net_worth_progression = mortgage_calculator.generate_payment_plan(*[SCENARIO[name] for name in calc.CASH_FLOW_PARAMETERS])[5]
+    np.testing.assert_allclose(result['mortgage_net_worth'][0], net_worth_progression['Net Worth'][-1], rtol=1e-9)
+    np.testing.assert_allclose(result['rent_net_worth'][0], rent_invest_calculator.calculate_investment()[0]['Balance'][-1], rtol=1e-9)
+    np.testing.assert_allclose(result['mean_later_rate'], 5.5)
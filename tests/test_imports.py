@@ -0,0 +1,14 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+
+
+@pytest.mark.parametrize('module', ['pandas', 'matplotlib', 'asyncio', 'sqlite3'])
+def test_import_does_not_load_optional_modules(module):
+    code = f"import sys, rent_vs_buy_dubai; print({module!r} in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'False'
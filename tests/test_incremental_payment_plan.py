@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+SCENARIO = calc.EXAMPLE_SCENARIO
+MORTGAGE_PARAMS = {name: SCENARIO[name] for name in calc.MORTGAGE_PARAMETERS if name in SCENARIO}
+CASH_FLOWS = (SCENARIO['monthly_salary'], SCENARIO['monthly_expenses'], SCENARIO['initial_savings'])
+LAST_YEAR = int(SCENARIO['start_date'][:4]) + SCENARIO['total_years'] - 1
+
+
+def assert_matches_full_simulation(plan):
+    mortgage_calculator = calc.MortgageCalculator(**plan.mortgage_params)
+    expected = mortgage_calculator.generate_payment_plan(plan.cash_flows['monthly_salary'], plan.cash_flows['monthly_expenses'], plan.cash_flows['initial_savings'])
+    np.testing.assert_array_equal(plan.result[0].values, expected[0].values)
+    np.testing.assert_array_equal(plan.result[5].values, expected[5].values)
+    assert plan.result[1:5] + plan.result[6:] == expected[1:5] + expected[6:]
+    assert plan.calculator.early_repayment_fees == mortgage_calculator.early_repayment_fees
+
+
+@pytest.mark.parametrize('year', [int(SCENARIO['start_date'][:4]) + 1, int(SCENARIO['start_date'][:4]) + SCENARIO['total_years'] // 2, LAST_YEAR])
+def test_dated_edits_match_full_simulation(year):
+    plan = calc.IncrementalPaymentPlan(MORTGAGE_PARAMS, *CASH_FLOWS)
+    repayments = list(SCENARIO['arbitrary_early_repayments']) + [{'date': f'{year}-03-15', 'amount': 150000}]
+    plan.update(arbitrary_early_repayments=repayments)
+    assert_matches_full_simulation(plan)
+    plan.update(events=[{'date': f'{year}-06-01', 'type': 'maintenance', 'amount': 25000}, {'date': f'{year}-07-01', 'type': 'maintenance_fees_rate', 'amount': 25}])
+    assert_matches_full_simulation(plan)
+    plan.update(arbitrary_early_repayments=repayments[:-1], max_early_repayment_percent=30, allow_exceed_early_repayment_limit=True)
+    assert_matches_full_simulation(plan)
+
+
+def test_late_edits_only_resimulate_the_last_months():
+    plan = calc.IncrementalPaymentPlan(MORTGAGE_PARAMS, *CASH_FLOWS)
+    plan.update(events=[{'date': f'{LAST_YEAR}-06-01', 'type': 'maintenance', 'amount': 25000}])
+    assert plan.resimulated_months == plan.checkpoint_interval
+    assert_matches_full_simulation(plan)
+
+
+def test_random_edits_match_full_simulation():
+    rng = np.random.default_rng(9)
+    plan = calc.IncrementalPaymentPlan(MORTGAGE_PARAMS, *CASH_FLOWS)
+    first_year = int(SCENARIO['start_date'][:4])
+    for _ in range(15):
+        year = int(rng.integers(first_year, LAST_YEAR + 1))
+        edit = rng.integers(6)
+        if edit == 0:
+            changes = {'arbitrary_early_repayments': [{'date': f'{year}-{rng.integers(1, 13):02d}-01', 'amount': float(rng.uniform(0, 300000))}]}
+        elif edit == 1:
+            changes = {'events': [{'date': f'{year}-{rng.integers(1, 13):02d}-01', 'type': 'maintenance_fees_rate', 'amount': float(rng.uniform(10, 30))}]}
+        elif edit == 2:
+            changes = {'later_rate': float(rng.uniform(2, 8))}
+        elif edit == 3:
+            changes = {'max_early_repayment_percent': float(rng.uniform(5, 30))}
+        elif edit == 4:
+            changes = {'regular_early_repayment': float(rng.uniform(0, 100000)), 'first_regular_early_repayment_date': f'{year}-01-01'}
+        else:
+            changes = {'monthly_salary': float(rng.uniform(20000, 50000))}
+        plan.update(**changes)
+        assert_matches_full_simulation(plan)
+
+
+def test_edit_after_the_loan_keeps_the_early_repayment_fees():
+    params = dict(MORTGAGE_PARAMS, allow_exceed_early_repayment_limit=True, arbitrary_early_repayments=[{'date': '2090-01-01', 'amount': 400000}])
+    plan = calc.IncrementalPaymentPlan(params, *CASH_FLOWS)
+    assert plan.calculator.early_repayment_fees > 0
+    plan.update(events=[{'date': f'{LAST_YEAR + 5}-01-01', 'type': 'maintenance', 'amount': 1000}])
+    assert plan.resimulated_months == 0
+    assert_matches_full_simulation(plan)
@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+
+def test_concurrent_tasks_record_into_their_own_collector():
+    async def simulate(total_years):
+        with calc.instrument() as probe:
+            await asyncio.sleep(0)  # Let the other task install its collector in between
+            mortgage_calculator, _ = calc.build_calculators({**calc.EXAMPLE_SCENARIO, 'total_years': total_years})
+            mortgage_calculator.simulate_payment_plan(calc.EXAMPLE_SCENARIO['monthly_salary'], calc.EXAMPLE_SCENARIO['monthly_expenses'],
+                                                      calc.EXAMPLE_SCENARIO['initial_savings'])
+            await asyncio.sleep(0)
+        return probe.summary()
+
+    async def main():
+        return await asyncio.gather(simulate(10), simulate(20))
+
+    short, long = asyncio.run(main())
+    assert short['stages']['mortgage.simulate']['calls'] == long['stages']['mortgage.simulate']['calls'] == 1
+    assert short['counters']['months_simulated'] == 120 and long['counters']['months_simulated'] == 240
+
+
+def test_summary_trace_and_callback_of_one_payment_plan(tmp_path):
+    scenario = calc.EXAMPLE_SCENARIO
+    events = []
+    with calc.instrument(callback=events.append) as probe:
+        mortgage_calculator, _ = calc.build_calculators(scenario)
+        payment_plan, _, _, _, _, net_worth_progression, _ = mortgage_calculator.generate_payment_plan(*[scenario[name] for name in calc.CASH_FLOW_PARAMETERS])
+        payment_plan.to_dataframe()
+        payment_plan.to_records()
+    n_months = scenario['total_years'] * 12
+    repayments = (payment_plan['Early Repayment'] > 0).sum()
+
+    probe.write_json(tmp_path / 'timings.json')
+    summary = json.loads((tmp_path / 'timings.json').read_text())
+    assert summary == probe.summary()
+    assert summary['counters'] == {'months_simulated': n_months, 'early_repayments_applied': repayments, 'dates_formatted': n_months,
+                                   'rows_materialized': 2 * n_months, 'bytes_allocated': payment_plan.nbytes + net_worth_progression.nbytes}
+    assert {name: stage['calls'] for name, stage in summary['stages'].items()} == {'mortgage.events': 1, 'mortgage.simulate': 1, 'dates': 1, 'dataframe': 1}
+
+    probe.write_chrome_trace(tmp_path / 'trace.json')
+    trace = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert trace == events
+    stages = [event for event in trace if event['ph'] == 'X']
+    assert sorted(event['name'] for event in stages) == sorted(summary['stages'])
+    for event in stages:
+        assert event['dur'] == pytest.approx(summary['stages'][event['name']]['seconds'] * 1e6)
+        assert event['ts'] >= 0
+    # Counter events carry the running total, so the last one of each counter is its final value
+    totals = {event['name']: event['args'][event['name']] for event in trace if event['ph'] == 'C'}
+    assert totals == summary['counters']
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+pytest.importorskip('matplotlib')
+
+
+def fresh(dashboard):
+    """ Results of a dashboard built from scratch with the edited scenario. """
+    rebuilt = calc.InteractiveDashboard(dashboard.scenario)
+    return rebuilt.mortgage_result, rebuilt.rent_result
+
+
+def assert_same_results(dashboard):
+    mortgage_result, rent_result = fresh(dashboard)
+    for name in mortgage_result[0].columns:
+        np.testing.assert_array_equal(dashboard.mortgage_result[0][name], mortgage_result[0][name])
+    np.testing.assert_array_equal(dashboard.mortgage_result[5]['Net Worth'], mortgage_result[5]['Net Worth'])
+    assert dashboard.mortgage_result[1:5] == mortgage_result[1:5]
+    np.testing.assert_array_equal(dashboard.rent_result[0]['Balance'], rent_result[0]['Balance'])
+
+
+def test_edits_recompute_only_the_affected_side():
+    dashboard = calc.InteractiveDashboard()
+    dashboard.build_figure().canvas.draw()
+    last_year = int(dashboard.scenario['start_date'][:4]) + dashboard.scenario['total_years'] - 1
+    for changes, recomputed in (({'arbitrary_early_repayments': [{'date': f'{last_year}-03-01', 'amount': 10000}]}, ['mortgage']),
+                                ({'later_rate': 8.5}, ['mortgage']), ({'annual_rent': 120000}, ['rent']),
+                                ({'monthly_salary': 40000}, ['mortgage', 'rent']), ({'monthly_salary': 40000}, [])):
+        assert dashboard.update(**changes) == recomputed
+        assert_same_results(dashboard)
+
+
+def test_late_edit_only_resimulates_the_last_months():
+    dashboard = calc.InteractiveDashboard()
+    dashboard.build_figure().canvas.draw()
+    last_year = int(dashboard.scenario['start_date'][:4]) + dashboard.scenario['total_years'] - 1
+    repayments = dashboard.scenario['arbitrary_early_repayments']
+    dashboard.update(arbitrary_early_repayments=repayments + [{'date': f'{last_year}-03-01', 'amount': 10000}])
+    dashboard.update(arbitrary_early_repayments=repayments + [{'date': f'{last_year}-04-01', 'amount': 10000}])
+    assert dashboard.plan.resimulated_months <= 12
+    assert dashboard.last_update_seconds < 0.05
+    assert_same_results(dashboard)
+
+
+def test_table_pages_cover_the_whole_table():
+    dashboard = calc.InteractiveDashboard(page_size=100)
+    _, n_pages = dashboard.table_html(dashboard.TABLES[0], page=0)
+    assert n_pages == -(-len(dashboard.mortgage_result[0]) // 100)
+    html, _ = dashboard.table_html(dashboard.TABLES[0], page=n_pages + 5)  # past the end shows the last page
+    assert html.count('<tr') == len(dashboard.mortgage_result[0]) - (n_pages - 1) * 100 + 1
+
+
+def test_term_edits_are_blitted_without_redrawing_the_figure():
+    dashboard = calc.InteractiveDashboard()
+    figure = dashboard.build_figure()
+    figure.canvas.draw()
+    draws = []
+    figure.canvas.mpl_connect('draw_event', draws.append)
+    for years in (5, 30):  # the shortest and the longest term set the limits once
+        dashboard.update(total_years=years)
+    limits = {name: (ax.get_xlim(), ax.get_ylim()) for name, ax in dashboard.axes.items()}
+    n_draws = len(draws)
+    for years in (20, 10, 30, 15, 5, 25):
+        dashboard.update(total_years=years)
+        assert dashboard.last_update_seconds < 0.05
+        assert_same_results(dashboard)
+    assert len(draws) == n_draws
+    assert {name: (ax.get_xlim(), ax.get_ylim()) for name, ax in dashboard.axes.items()} == limits
+    assert limits['comparison'][0] == (-0.5, 12 * dashboard.WIDGETS['total_years'][1] + 0.5)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+
+def simulation(**kwargs):
+    scenario = calc.EXAMPLE_SCENARIO
+    mortgage_params = {name: scenario[name] for name in calc.MORTGAGE_PARAMETERS if name in scenario}
+    rent_params = {'initial_amount': scenario['initial_savings'], 'years': scenario['total_years'], 'monthly_salary': scenario['monthly_salary'],
+                   'monthly_expenses': scenario['monthly_expenses'], **{name: scenario[name] for name in calc.RENT_PARAMETERS if name in scenario}}
+    return calc.MonteCarloSimulation(mortgage_params, rent_params, scenario['monthly_salary'], scenario['monthly_expenses'], scenario['initial_savings'], **kwargs)
+
+
+def test_run_rejects_empty_simulation():
+    with pytest.raises(ValueError):
+        simulation().run(0)
+
+
+def test_rate_paths_start_at_later_rate_when_initial_period_ends():
+    monte_carlo = simulation(long_run_rate=1.0, rate_volatility=2.0)
+    shocks = np.random.default_rng(0).standard_normal((10, monte_carlo.total_months))
+    rates = monte_carlo.sample_rate_paths(10, shocks)
+    first_variable_month = calc.EXAMPLE_SCENARIO['initial_years'] * 12
+    assert (rates[:, :first_variable_month + 1] == calc.EXAMPLE_SCENARIO['later_rate']).all()
+    assert (rates[:, first_variable_month + 1] != calc.EXAMPLE_SCENARIO['later_rate']).all()
+
+
+def test_percentiles_of_small_chunks_match_all_paths():
+    """ Bins fixed by a small first chunk must still cover the paths of every later chunk. """
+    monte_carlo = simulation(investment_volatility=20.0, property_volatility=10.0)
+    n_paths, chunk_size = 2000, 20
+    result = monte_carlo.run(n_paths, seed=1, workers=1, chunk_size=chunk_size)
+    chunk_seeds = np.random.SeedSequence(1).spawn(n_paths // chunk_size)
+    final_net_worth = np.concatenate([monte_carlo.simulate_paths(chunk_size, np.random.default_rng(seed))[0][:, -1] for seed in chunk_seeds])
+    for q in (5, 50, 95):
+        np.testing.assert_allclose(result.mortgage_net_worth.percentile(q)[-1], np.percentile(final_net_worth, q), rtol=0.005)
+    for histogram in (result.mortgage_net_worth, result.rent_net_worth):
+        assert histogram.counts[:, [0, -1]].sum() < 0.005 * histogram.counts.sum()
+
+
+def test_final_comparison_uses_the_common_horizon():
+    monte_carlo = simulation()
+    monte_carlo.rent_params['years'] = 15
+    monte_carlo.rent_months = 15 * 12
+    mortgage_net_worth, rent_net_worth = monte_carlo.simulate_paths(200, np.random.default_rng(3))
+    assert mortgage_net_worth.shape[1] != rent_net_worth.shape[1]
+    bounds = [(values.min(axis=0) - 1, values.max(axis=0) + 1) for values in (mortgage_net_worth, rent_net_worth)]
+    result = monte_carlo.summarize(mortgage_net_worth, rent_net_worth, bounds, bins=64)
+    assert result.buy_wins_final == (mortgage_net_worth[:, 15 * 12 - 1] >= rent_net_worth[:, -1]).sum()
+    assert result.probability_buy_wins_final == result.probability_buy_wins[-1]
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import benchmarks
+import rent_vs_buy_dubai as calc
+
+RENTAL_PLANS = [{'annual_rent': annual_rent} for annual_rent in (70000, 100000, 130000)]
+
+
+@pytest.fixture(scope='module')
+def rankings():
+    offers = benchmarks.mortgage_offers(200)
+    return calc.OfferComparison(calc.EXAMPLE_SCENARIO, offers, RENTAL_PLANS).run(), calc.OfferComparison(calc.EXAMPLE_SCENARIO, offers, RENTAL_PLANS, top_k=5).run()
+
+
+def test_pruned_ranking_equals_the_exhaustive_ranking(rankings):
+    exhaustive, pruned = rankings
+    assert (pruned['pruned_month'] >= 0).any()
+    assert list(pruned['strategy'][:5]) == list(exhaustive['strategy'][:5])
+    np.testing.assert_allclose(pruned['final_net_worth'][:5], exhaustive['final_net_worth'][:5], rtol=1e-12)
+    np.testing.assert_allclose(pruned['net_worth'][:5], exhaustive['net_worth'][:5], rtol=1e-12)
+
+
+def test_pruned_offers_stay_below_their_bound(rankings):
+    exhaustive, pruned = rankings
+    final_net_worth = dict(zip(exhaustive['strategy'], exhaustive['final_net_worth']))
+    dropped = pruned['pruned_month'] >= 0
+    for strategy, upper_bound in zip(pruned['strategy'][dropped], pruned['upper_bound'][dropped]):
+        assert final_net_worth[strategy] <= upper_bound * (1 + 1e-9)
+        assert upper_bound < exhaustive['final_net_worth'][4]
+    assert np.isnan(pruned['final_net_worth'][dropped]).all()
+
+
+def test_exhaustive_ranking_is_sorted_and_matches_the_scalar_calculators(rankings):
+    exhaustive, _ = rankings
+    assert np.all(np.diff(exhaustive['final_net_worth']) <= 0)
+    rent = list(exhaustive['strategy']).index('rent 2')
+    _, rent_invest_calculator = calc.build_calculators({**calc.EXAMPLE_SCENARIO, 'annual_rent': 100000})
+    np.testing.assert_allclose(exhaustive['net_worth'][rent], rent_invest_calculator.calculate_investment()[0]['Balance'], rtol=1e-12)
+
+
+def random_comparison(seed):
+    """ Base scenario, offers, rental plans and top_k of a random comparison; many offers run their investment balance negative. """
+    rng = np.random.default_rng(seed)
+    base = {**calc.EXAMPLE_SCENARIO, 'initial_savings': rng.uniform(250000, 900000), 'monthly_expenses': rng.uniform(5000, 30000),
+            'maintenance_fees_interval': int(rng.choice([1, 3, 12])), 'allow_exceed_early_repayment_limit': bool(rng.random() < 0.5),
+            'total_years': int(rng.integers(5, 26))}
+    if rng.random() < 0.5:
+        base.update(regular_early_repayment=0, arbitrary_early_repayments=[])
+    offers = [{'initial_rate': rng.uniform(1, 7), 'later_rate': rng.uniform(1, 9), 'initial_years': int(rng.integers(0, 6)),
+               'annual_investment_rate': rng.uniform(0, 9), 'regular_early_repayment': float(rng.choice([0, 10000, 100000])),
+               'max_early_repayment_percent': float(rng.choice([10, 20, 30]))} for _ in range(int(rng.integers(2, 9)))]
+    rental_plans = [{'annual_rent': rng.uniform(50000, 200000)} for _ in range(int(rng.integers(0, 3)))]
+    return base, offers, rental_plans, int(rng.integers(1, 4))
+
+
+def test_pruning_is_sound_on_random_offers_including_negative_balances():
+    n_pruned = n_negative = 0
+    for seed in range(80):
+        base, offers, rental_plans, top_k = random_comparison(seed)
+        exhaustive = calc.OfferComparison(base, offers, rental_plans).run()
+        pruned = calc.OfferComparison(base, offers, rental_plans, top_k=top_k).run()
+        final_net_worth = dict(zip(exhaustive['strategy'], exhaustive['final_net_worth']))
+        dropped = pruned['pruned_month'] >= 0
+        for strategy, upper_bound in zip(pruned['strategy'][dropped], pruned['upper_bound'][dropped]):
+            assert final_net_worth[strategy] <= upper_bound + 1e-9 * abs(upper_bound), (seed, strategy)
+        assert list(pruned['strategy'][:top_k]) == list(exhaustive['strategy'][:top_k]), seed
+        n_pruned += dropped.sum()
+        mortgage_calculator = calc.MortgageBatchCalculator(**{name: value for name, value in {**base, **calc.scenarios_to_columns(offers, base)}.items() if name in calc.MORTGAGE_PARAMETERS})
+        investments = mortgage_calculator.generate_payment_plan(base['monthly_salary'], base['monthly_expenses'], base['initial_savings'], columns=['Investments'])[0]['Investments']
+        n_negative += (np.nanmin(investments, axis=1) < 0).sum()
+    assert n_pruned > 20 and n_negative > 50
+
+
+def test_offers_borrowing_against_a_negative_balance_are_not_pruned():
+    base = {**calc.EXAMPLE_SCENARIO, 'initial_savings': 800000, 'regular_early_repayment': 0, 'arbitrary_early_repayments': [], 'monthly_expenses': 30000}
+    offers = [{'initial_rate': 5.9, 'later_rate': 5.7, 'initial_years': 0, 'annual_investment_rate': 7.26},
+              {'initial_rate': 1.0, 'later_rate': 1.0, 'initial_years': 0, 'annual_investment_rate': 7.26}]
+    exhaustive = calc.OfferComparison(base, offers, []).run()
+    pruned = calc.OfferComparison(base, offers, [], top_k=1).run()
+    assert (pruned['pruned_month'] < 0).all()
+    np.testing.assert_array_equal(pruned['final_net_worth'], exhaustive['final_net_worth'])
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+pytest.importorskip('pyarrow')
+
+GRID = {'annual_rent': [70000, 100000, 130000], 'later_rate': [6, 7, 8, 9]}
+
+
+def sweep(output_dir, output_format='parquet', **grid):
+    return calc.ParameterSweep(str(output_dir), calc.EXAMPLE_SCENARIO, grid={**GRID, **grid}, chunk_size=5, output_format=output_format)
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'arrow'])
+def test_resumes_after_deleting_a_chunk(tmp_path, output_format):
+    first = sweep(tmp_path, output_format)
+    assert first.run(workers=1) == 12
+    results = first.read_results()
+    assert results['scenario_id'].tolist() == list(range(12))
+
+    os.remove(first.chunk_path(1))
+    resumed = sweep(tmp_path, output_format)
+    assert resumed.run(workers=1) == 5
+    assert resumed.run(workers=1) == 0
+    assert resumed.read_results().equals(results)
+
+
+def test_results_match_the_batch_evaluation(tmp_path):
+    grid_sweep = sweep(tmp_path)
+    grid_sweep.run(workers=2)
+    results = grid_sweep.read_results()
+    rents, rates = np.meshgrid(GRID['annual_rent'], GRID['later_rate'], indexing='ij')
+    metrics = calc.evaluate_scenarios({**calc.EXAMPLE_SCENARIO, 'annual_rent': rents.ravel(), 'later_rate': rates.ravel()})
+    np.testing.assert_array_equal(results['net_worth_difference'], metrics['net_worth_difference'])
+
+
+def test_resuming_a_different_sweep_fails(tmp_path):
+    sweep(tmp_path).run(workers=1)
+    with pytest.raises(ValueError):
+        sweep(tmp_path, later_rate=[5, 6, 7, 8]).run(workers=1)
+
+
+def test_progress_is_reported_only_to_a_callback(tmp_path, capsys):
+    calls = []
+    sweep(tmp_path / 'quiet').run(workers=1)
+    sweep(tmp_path / 'reported').run(workers=1, progress=lambda completed, total, elapsed: calls.append((completed, total)))
+    assert capsys.readouterr().out == ''
+    assert calls == [(1, 3), (2, 3), (3, 3)]
@@ -0,0 +1,60 @@
+import json
+import os
+
+import numpy as np
+
+import rent_vs_buy_dubai as calc
+
+
+def test_scenario_key_is_stable_across_equivalent_inputs():
+    events = [{'date': '2090-1-1', 'type': 'maintenance', 'amount': 5000}, {'date': '2088-06-15', 'type': 'maintenance_fees_rate', 'amount': 20}]
+    repayments = [{'date': '2095-3-1', 'amount': 100000}, {'date': '2086-01-01', 'amount': 50000}]
+    key = calc.scenario_key({**calc.EXAMPLE_SCENARIO, 'events': events, 'arbitrary_early_repayments': repayments})
+    equivalent = {**calc.EXAMPLE_SCENARIO, 'total_years': float(calc.EXAMPLE_SCENARIO['total_years']),
+                  'events': [{'date': '2088-06-15', 'type': 'maintenance_fees_rate', 'amount': 20.0}, {'date': '2090-01-01', 'type': 'maintenance', 'amount': 5000}],
+                  'arbitrary_early_repayments': [{'date': '2086-01-01', 'amount': 50000}, {'date': '2095-03-01', 'amount': 100000.0}]}
+    assert calc.scenario_key(equivalent) == key
+    assert calc.scenario_key({**equivalent, 'events': events[:1]}) != key
+
+
+def test_round_trip_across_instances(tmp_path):
+    rows = [{'annual_rent': 90000}, {'annual_rent': 110000}, {'annual_rent': 90000}]
+    store = calc.ResultStore(str(tmp_path))
+    metrics, schedules = store.evaluate(rows, calc.EXAMPLE_SCENARIO, schedules=True)
+    expected = calc.evaluate_scenarios({**calc.SCENARIO_DEFAULTS, **calc.EXAMPLE_SCENARIO, 'annual_rent': [90000, 110000, 90000]})
+    assert [values['net_worth_difference'] for values in metrics] == expected['net_worth_difference'].tolist()
+    assert len(store) == 2
+
+    reopened = calc.ResultStore(str(tmp_path))
+    stored_metrics, stored_schedules = reopened.evaluate(rows, calc.EXAMPLE_SCENARIO, schedules=True)
+    assert reopened.stats['hits'] == 3 and reopened.stats['misses'] == 0
+    assert stored_metrics == metrics
+    for stored, computed in zip(stored_schedules, schedules):
+        assert stored.keys() == computed.keys()
+        for name in stored:
+            np.testing.assert_array_equal(stored[name], computed[name])
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    entry = {'value': 1.0}
+    nbytes = len(json.dumps(entry)) + 1
+    store = calc.ResultStore(str(tmp_path), max_bytes=2 * nbytes)
+    store.put_many(['a'], [entry])
+    store.put_many(['b'], [entry])
+    store.get_many(['a'])
+    store.put_many(['c'], [entry])
+    assert store.get_many(['a', 'b', 'c']) == [entry, None, entry]
+    assert store.stats['evictions'] == 1
+
+
+def test_entries_of_another_model_version_are_removed_on_opening(tmp_path, monkeypatch):
+    store = calc.ResultStore(str(tmp_path))
+    store.evaluate([{'annual_rent': 90000}], calc.EXAMPLE_SCENARIO, schedules=True)
+    assert len(store) == 1 and len(os.listdir(tmp_path / 'schedules')) == 1
+
+    monkeypatch.setattr(calc, 'model_version', lambda: 'changed')
+    reopened = calc.ResultStore(str(tmp_path))
+    assert len(reopened) == 0
+    assert os.listdir(tmp_path / 'schedules') == []
+    reopened.evaluate([{'annual_rent': 90000}], calc.EXAMPLE_SCENARIO)
+    assert reopened.stats['misses'] == 1
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+SCENARIO = {**calc.EXAMPLE_SCENARIO, 'start_date': '2084-01-31'}
+
+
+@pytest.fixture(scope='module')
+def schedules():
+    """ Payment plan and balance progression of the example on a month-end start date. """
+    mortgage_calculator, rent_invest_calculator = calc.build_calculators(SCENARIO)
+    payment_plan = mortgage_calculator.generate_payment_plan(*[SCENARIO[name] for name in calc.CASH_FLOW_PARAMETERS])[0]
+    return payment_plan, rent_invest_calculator.calculate_investment()[0]
+
+
+def test_dates_are_the_payment_dates_of_the_month_index(schedules):
+    start_date = calc._parse_date(SCENARIO['start_date'])
+    for schedule in schedules:
+        expected = [calc.MortgageCalculator.get_payment_date(start_date, int(month)).strftime('%Y-%m-%d') for month in schedule.month]
+        assert schedule.dates.tolist() == expected
+        assert schedule['Date'] is schedule.dates  # Formatted once
+    assert schedules[0].dates[1] == '2084-02-29' and schedules[1].month[0] == 1
+
+
+def test_dataframe_shares_memory_with_the_schedule(schedules):
+    payment_plan = schedules[0]
+    df = payment_plan.to_dataframe()
+    assert list(df.columns) == payment_plan.keys()
+    for column in payment_plan.columns:
+        assert np.shares_memory(df[column].to_numpy(), payment_plan[column])
+    assert df['Date'].tolist() == payment_plan.dates.tolist()
+
+
+def test_records_round_trip_to_the_schedule(schedules):
+    for schedule in schedules:
+        records = schedule.to_records()
+        assert len(records) == len(schedule)
+        assert all(list(record) == schedule.keys() for record in records)
+        for column in schedule.keys():
+            assert [record[column] for record in records] == schedule[column].tolist()
+        assert all(type(record[column]) is float for record in records[:1] for column in schedule.columns)
+
+
+def test_scenario_is_a_view_of_one_batch_row():
+    columns = {**SCENARIO, 'annual_rent': np.array([80000, 120000, 160000]), 'later_rate': np.array([5.0, 6.5, 8.0])}
+    mortgage_calculator, _ = calc._batch_calculators(columns, 3)
+    payment_plan = mortgage_calculator.generate_payment_plan(columns['monthly_salary'], columns['monthly_expenses'], columns['initial_savings'])[0]
+    assert payment_plan.n_scenarios == 3
+    for i in range(3):
+        scenario = payment_plan.scenario(i)
+        assert scenario.n_scenarios is None and len(scenario) == len(payment_plan)
+        for column in payment_plan.columns:
+            assert np.shares_memory(scenario[column], payment_plan[column])
+            np.testing.assert_array_equal(scenario[column], payment_plan[column][i])
+        assert scenario.month is payment_plan.month  # The batch shares one month index
+        assert scenario.dates.tolist() == payment_plan.dates.tolist()
+    with pytest.raises(ValueError):
+        payment_plan.to_dataframe()
+    with pytest.raises(ValueError):
+        payment_plan.to_records()
@@ -0,0 +1,26 @@
+import numpy as np
+
+import rent_vs_buy_dubai as calc
+
+
+def net_worth_difference(**overrides):
+    return calc.evaluate_scenarios({**calc.SCENARIO_DEFAULTS, **calc.EXAMPLE_SCENARIO, **overrides})['net_worth_difference'][0]
+
+
+def test_changes_match_evaluating_each_perturbation_alone():
+    result = calc.SensitivityAnalysis(calc.EXAMPLE_SCENARIO, steps={'later_rate': 1.0}).run()
+    assert np.all(np.diff(result['swing']) <= 0)
+    base = net_worth_difference()
+    assert result['base_net_worth_difference'] == base
+    for i in np.flatnonzero(np.isin(result['parameter'], ['annual_rent', 'later_rate', 'total_years'])):
+        parameter = result['parameter'][i]
+        np.testing.assert_allclose(result['low_change'][i], net_worth_difference(**{parameter: result['low_value'][i]}) - base, atol=1e-6)
+        np.testing.assert_allclose(result['high_change'][i], net_worth_difference(**{parameter: result['high_value'][i]}) - base, atol=1e-6)
+
+
+def test_perturbations():
+    analysis = calc.SensitivityAnalysis({**calc.EXAMPLE_SCENARIO, 'regular_early_repayment': 0, 'rent_cheques': 1}, steps={'later_rate': 1.0})
+    np.testing.assert_allclose(analysis.perturb('annual_rent'), [0.9 * calc.EXAMPLE_SCENARIO['annual_rent'], 1.1 * calc.EXAMPLE_SCENARIO['annual_rent']])
+    assert analysis.perturb('later_rate') == (calc.EXAMPLE_SCENARIO['later_rate'] - 1, calc.EXAMPLE_SCENARIO['later_rate'] + 1)
+    assert analysis.perturb('regular_early_repayment') == (0, 0)
+    assert analysis.perturb('rent_cheques') == (1, 2)  # whole-valued inputs move by one unit and stay at one or more
@@ -0,0 +1,52 @@
+import tracemalloc
+
+import numpy as np
+
+import rent_vs_buy_dubai as calc
+
+
+def simulation(total_years, step, rent_years=None):
+    scenario = {**calc.EXAMPLE_SCENARIO, 'total_years': total_years}
+    mortgage_calculator, rent_invest_calculator = calc.build_calculators(scenario)
+    if rent_years is not None:
+        rent_invest_calculator.years = rent_years
+    return calc.StreamingSimulation(mortgage_calculator, rent_invest_calculator, scenario['monthly_salary'], scenario['monthly_expenses'],
+                                    scenario['initial_savings'], step=step)
+
+
+def peak_memory(total_years, step):
+    steps = simulation(total_years, step)
+    tracemalloc.start()
+    try:
+        for _ in steps:
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_memory_does_not_grow_with_the_number_of_steps():
+    calc.AMORTIZATION_CACHE.clear()
+    peak_memory(20, 'weekly')  # First run allocates module-level caches
+    weekly, daily = peak_memory(20, 'weekly'), peak_memory(20, 'daily')
+    assert daily < 1.2 * weekly
+    assert len(calc.AMORTIZATION_CACHE) == 0
+
+
+def test_memory_does_not_grow_with_the_horizon():
+    peak_memory(20, 'monthly')
+    assert peak_memory(80, 'daily') < 1.2 * peak_memory(20, 'daily')
+
+
+def test_monthly_steps_follow_each_sides_horizon():
+    for total_years, rent_years in [(25, 15), (10, 22)]:
+        steps = simulation(total_years, 'monthly', rent_years)
+        rows = list(steps)
+        payment_plan = steps.mortgage_calculator.generate_payment_plan(steps.monthly_salary, steps.monthly_expenses, steps.initial_savings)[0]
+        balance_progression = steps.rent_invest_calculator.calculate_investment()[0]
+        assert len(rows) == max(total_years, rent_years) * 12 + 1
+        np.testing.assert_allclose([row[1] for row in rows[:total_years * 12]], payment_plan['Investments'], rtol=0, atol=1e-6)
+        np.testing.assert_allclose([row[4] for row in rows[1:rent_years * 12 + 1]], balance_progression['Balance'], rtol=0, atol=1e-6)
+        # Past its horizon a side keeps its final balance
+        assert rows[-1][1] == payment_plan['Investments'][-1]
+        assert rows[-1][4] == balance_progression['Balance'][-1]
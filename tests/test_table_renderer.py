@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import rent_vs_buy_dubai as calc
+
+
+@pytest.fixture(scope='module')
+def payment_plan():
+    mortgage_calculator = calc.MortgageCalculator(**{name: value for name, value in calc.EXAMPLE_SCENARIO.items() if name in calc.MORTGAGE_PARAMETERS})
+    return mortgage_calculator.generate_payment_plan(*[calc.EXAMPLE_SCENARIO[name] for name in calc.CASH_FLOW_PARAMETERS])
+
+
+def test_text_rows_hold_every_formatted_cell(payment_plan):
+    schedule, highlight_row = payment_plan[0], payment_plan[6]
+    lines = calc.TableRenderer(schedule, highlight_row).text().splitlines()
+    assert len(lines) == len(schedule) + 1
+    assert lines[0].split() == ' '.join(schedule.keys()).split()
+    for row in (0, highlight_row, len(schedule) - 1):
+        label = f'{row + 1}*' if row == highlight_row else str(row + 1)
+        assert lines[row + 1].split() == [label, schedule['Date'][row]] + [format(schedule[column][row], ',.2f') for column in schedule.keys()[1:]]
+
+
+def test_chunked_output_equals_a_single_chunk(payment_plan):
+    schedule, highlight_row = payment_plan[0], payment_plan[6]
+    whole, chunked = calc.TableRenderer(schedule, highlight_row, chunk_size=len(schedule)), calc.TableRenderer(schedule, highlight_row, chunk_size=7)
+    assert chunked.html() == whole.html()
+    assert chunked.text() == whole.text()
+    assert chunked.markdown() == whole.markdown()
+    assert whole.html().count('class="highlight"') == 1
+    # Odd rows are striped like the report Stylers
+    assert 'table.schedule tbody tr:nth-child(odd) td {background-color: #f2f2f2}' in whole.html()
+
+
+def test_pages_cover_the_table_once(payment_plan):
+    renderer = calc.TableRenderer(payment_plan[0])
+    pages = renderer.pages(120)
+    assert [page.start for page in pages] == list(range(0, len(renderer), 120))
+    assert sum(len(renderer.text(rows=page).splitlines()) - 1 for page in pages) == len(renderer)
+
+
+def test_yearly_sums_flows_and_keeps_year_end_balances(payment_plan):
+    schedule = payment_plan[0]
+    yearly = calc.TableRenderer(schedule).yearly()
+    columns = dict(zip(yearly.columns, yearly.values))
+    assert len(yearly) == len(schedule) // 12
+    np.testing.assert_allclose(columns['Interest'][0], schedule['Interest'][:12].sum())
+    assert columns['Mortgage Balance'][0] == schedule['Mortgage Balance'][11]
+
+
+def test_write_streams_the_format_of_the_extension(payment_plan, tmp_path):
+    renderer = calc.TableRenderer(payment_plan[0], payment_plan[6], chunk_size=50)
+    for name, rendered in (('plan.html', renderer.html()), ('plan.md', renderer.markdown()), ('plan.txt', renderer.text())):
+        renderer.write(str(tmp_path / name))
+        assert (tmp_path / name).read_text() == rendered
+
+
+def test_highlight_row_matches_the_styler(payment_plan):
+    schedule, highlight_row = payment_plan[0], payment_plan[6]
+    mortgage_calculator = calc.MortgageCalculator(**{name: value for name, value in calc.EXAMPLE_SCENARIO.items() if name in calc.MORTGAGE_PARAMETERS})
+    styler = mortgage_calculator.style_payment_plan(schedule, highlight_row)
+    styler._compute()
+    styled_rows = {row for (row, _), props in styler.ctx.items() if ('font-weight', 'bold') in props}
+    assert styled_rows == {highlight_row}
+    # The first month whose investment balance covers the remaining principal
+    assert schedule['Investments'][highlight_row] >= schedule['Mortgage Balance'][highlight_row]
+    assert schedule['Investments'][highlight_row - 1] < schedule['Mortgage Balance'][highlight_row - 1]
+    assert f'<tr class="highlight"><th>{highlight_row + 1}</th>' in calc.TableRenderer(schedule, highlight_row).html()